@@ -0,0 +1,427 @@
+import os
+import json
+import time
+import heapq
+import random
+import logging
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Cache keys are "<tag>-<sha256>" so entries can be purged by content type
+CONTENT_TYPE_TAGS = {"application/json": "json", "text/plain": "text", "text/html": "html", "text/csv": "csv"}
+# Single redacted rows (AIRedactor.redact_rows), shared across responses
+ROW_TAG = "row"
+EVICTION_POLICIES = ("lru", "lfu", "fifo")
+# Entries an approximate-LFU eviction compares (oldest first), as Redis does
+_LFU_SAMPLE = 16
+
+
+def content_type_tag(content_type: Optional[str]) -> str:
+    if content_type in CONTENT_TYPE_TAGS.values() or content_type == ROW_TAG:
+        return content_type
+    return CONTENT_TYPE_TAGS.get((content_type or "").lower(), "other")
+
+
+def _matches(key: str, tag: Optional[str]) -> bool:
+    return tag is None or key.startswith(tag + "-")
+
+
+def _top(counts: Dict[str, int], n: int) -> List[Dict[str, Any]]:
+    return [{"key": k, "hits": h} for k, h in heapq.nlargest(n, counts.items(), key=lambda kv: kv[1]) if h > 0]
+
+
+class MemoryTier:
+    """Per-process cache with TTL and an LRU, LFU or FIFO eviction policy."""
+
+    name = "memory"
+
+    def __init__(self, size: int, ttl: float, policy: str = "lru"):
+        self.size = size
+        self.ttl = ttl
+        self.policy = policy if policy in EVICTION_POLICIES else "lru"
+        # key -> [stored_at, value, hits]
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._cache.get(key)
+            if not item:
+                return None
+            if (time.time() - item[0]) > self.ttl:
+                try:
+                    del self._cache[key]
+                except KeyError:
+                    pass
+                return None
+            item[2] += 1
+            if self.policy != "fifo":
+                self._cache.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._cache[key] = [time.time(), value, 0]
+            self._cache.move_to_end(key)
+            self._evict()
+
+    def _evict(self) -> None:
+        # Called with the lock held
+        while len(self._cache) > self.size:
+            if self.policy == "lfu" and len(self._cache) > 1:
+                sample = [k for k, _ in zip(self._cache, range(_LFU_SAMPLE))]
+                del self._cache[min(sample, key=lambda k: self._cache[k][2])]
+            else:
+                self._cache.popitem(last=False)
+
+    def configure(self, ttl: Optional[float] = None, size: Optional[int] = None,
+                  policy: Optional[str] = None) -> None:
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if size is not None:
+                self.size = size
+            if policy in EVICTION_POLICIES:
+                self.policy = policy
+            self._evict()
+
+    def purge(self, tag: Optional[str] = None, older_than: Optional[float] = None) -> int:
+        cutoff = None if older_than is None else time.time() - older_than
+        with self._lock:
+            doomed = [k for k, item in self._cache.items()
+                      if _matches(k, tag) and (cutoff is None or item[0] <= cutoff)]
+            for k in doomed:
+                del self._cache[k]
+        return len(doomed)
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self._cache.items())
+        return {
+            "entries": len(items),
+            "bytes": sum(len(item[1].encode("utf-8")) for _, item in items),
+            "max_entries": self.size,
+            "ttl": self.ttl,
+            "policy": self.policy,
+            "top_keys": _top({k: item[2] for k, item in items}, top),
+        }
+
+
+class RedisTier:
+    """Shared cache for multi-worker setups; entries expire server-side.
+
+    Values are stored as ``"<write time>\n<value>"`` so purges by age do not
+    depend on the TTL the entry was written with.
+    """
+
+    name = "redis"
+    # Entries /admin/cache stats looks at; it runs on a request thread
+    STATS_MAX_SCAN = 2000
+
+    def __init__(self, get_client: Callable[[], Any], prefix: str, ttl: float, hit_sample: int = 0):
+        # A getter rather than a client: the shared pool is rebuilt after fork
+        self.get_client = get_client
+        self.prefix = prefix
+        self.ttl = ttl
+        # Record 1 in hit_sample hits (weighted) for the admin top keys; 0 records none
+        self.hit_sample = hit_sample
+
+    @property
+    def client(self):
+        client = self.get_client()
+        if client is None:
+            raise ConnectionError("Redis unavailable")
+        return client
+
+    def _key(self, key: str) -> str:
+        # v2: timestamped values; unstamped v1 entries are left to expire
+        return f"{self.prefix}:aicache2:{key}"
+
+    @property
+    def _hits_key(self) -> str:
+        return f"{self.prefix}:aicachemeta:hits"
+
+    def get(self, key: str) -> Optional[str]:
+        client = self.client
+        raw = client.get(self._key(key))
+        val = None if raw is None else raw.partition("\n")[2]
+        if val is not None and self.hit_sample > 0 and random.random() * self.hit_sample < 1:
+            # A write on the read path, so only a sample of hits pays for it
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.zincrby(self._hits_key, self.hit_sample, key)
+                # Bound the hit table; expired keys sink and fall off
+                pipe.zremrangebyrank(self._hits_key, 0, -10001)
+                pipe.execute()
+            except Exception:
+                pass
+        return val
+
+    def set(self, key: str, value: str) -> None:
+        self.client.setex(self._key(key), int(self.ttl), f"{time.time():.0f}\n{value}")
+
+    def configure(self, ttl: Optional[float] = None, **_: Any) -> None:
+        # Eviction is the Redis server's maxmemory-policy; only the TTL is ours
+        if ttl is not None:
+            self.ttl = ttl
+
+    def _scan(self, tag: Optional[str]):
+        pattern = self._key(f"{tag}-*" if tag else "*")
+        return self.client.scan_iter(match=pattern, count=500)
+
+    def purge(self, tag: Optional[str] = None, older_than: Optional[float] = None) -> int:
+        client = self.client
+        removed = 0
+        batch: List[str] = []
+
+        def flush() -> int:
+            if not batch:
+                return 0
+            if older_than is not None:
+                # Only the write-time header of each value
+                pipe = client.pipeline()
+                for k in batch:
+                    pipe.getrange(k, 0, 15)
+                cutoff = time.time() - older_than
+                doomed = [k for k, head in zip(batch, pipe.execute())
+                          if head and _written_at(head) <= cutoff]
+            else:
+                doomed = list(batch)
+            count = client.delete(*doomed) if doomed else 0
+            batch.clear()
+            return int(count)
+
+        for k in self._scan(tag):
+            batch.append(k)
+            if len(batch) >= 500:
+                removed += flush()
+        removed += flush()
+        if tag is None and older_than is None:
+            client.delete(self._hits_key)
+        return removed
+
+    def stats(self, top: int = 10, max_scan: Optional[int] = None) -> Dict[str, Any]:
+        client = self.client
+        max_scan = self.STATS_MAX_SCAN if max_scan is None else max_scan
+        keys: List[str] = []
+        for k in self._scan(None):
+            keys.append(k)
+            if len(keys) >= max_scan:
+                break
+        size = 0
+        for i in range(0, len(keys), 500):
+            pipe = client.pipeline()
+            for k in keys[i:i + 500]:
+                pipe.strlen(k)
+            size += sum(int(n or 0) for n in pipe.execute())
+        top_keys = client.zrevrange(self._hits_key, 0, max(0, top - 1), withscores=True)
+        return {
+            "entries": len(keys),
+            "bytes": size,
+            "truncated": len(keys) >= max_scan,
+            "ttl": self.ttl,
+            "hit_sample": self.hit_sample,
+            "top_keys": [{"key": k, "hits": int(h)} for k, h in top_keys],
+        }
+
+
+def _written_at(head: str) -> float:
+    """Write time from the start of a RedisTier value; 0 (oldest) if unreadable."""
+    try:
+        return float(head.partition("\n")[0])
+    except ValueError:
+        return 0.0
+
+
+class DiskTier:
+    """File-per-entry cache that survives worker restarts; TTL via mtime."""
+
+    name = "disk"
+
+    def __init__(self, path: str, ttl: float):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key: str) -> Path:
+        # <tag>/<last two hex chars>/<key>: purge by content type is one subtree
+        return self.path / key.partition("-")[0] / key[-2:] / key
+
+    def get(self, key: str) -> Optional[str]:
+        fp = self._file(key)
+        try:
+            if (time.time() - fp.stat().st_mtime) > self.ttl:
+                fp.unlink(missing_ok=True)
+                return None
+            return fp.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def configure(self, ttl: Optional[float] = None, **_: Any) -> None:
+        if ttl is not None:
+            self.ttl = ttl
+
+    def _entries(self, tag: Optional[str]):
+        root = self.path / tag if tag else self.path
+        if not root.is_dir():
+            return
+        for dirpath, _, files in os.walk(root):
+            for fname in files:
+                if not fname.startswith(".tmp-"):
+                    yield Path(dirpath) / fname
+
+    def purge(self, tag: Optional[str] = None, older_than: Optional[float] = None) -> int:
+        cutoff = None if older_than is None else time.time() - older_than
+        removed = 0
+        for fp in self._entries(tag):
+            try:
+                if cutoff is None or fp.stat().st_mtime <= cutoff:
+                    fp.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        entries = size = 0
+        for fp in self._entries(None):
+            try:
+                size += fp.stat().st_size
+                entries += 1
+            except FileNotFoundError:
+                continue
+        # Per-entry hits are not tracked on disk
+        return {"entries": entries, "bytes": size, "ttl": self.ttl, "path": str(self.path), "top_keys": []}
+
+    def set(self, key: str, value: str) -> None:
+        fp = self._file(key)
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so concurrent readers never see partial entries
+        fd, tmp = tempfile.mkstemp(dir=fp.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(value)
+            os.replace(tmp, fp)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+class CacheControl:
+    """Cache settings and purge commands shared by all workers through Redis.
+
+    An admin request lands on one worker; every worker polls this record
+    every ``poll_seconds`` from a background thread (``watch``) and applies
+    newer settings and purges to its own in-process tier. Without Redis the
+    record lives in this process only.
+    """
+
+    def __init__(self, get_redis: Optional[Callable[[], Any]], prefix: str, poll_seconds: float = 2.0,
+                 keep_purges: int = 20):
+        self.get_redis = get_redis
+        self.key = f"{prefix}:aicachemeta:control"
+        self.poll_seconds = poll_seconds
+        self.keep_purges = keep_purges
+        self._local: Dict[str, Any] = {"version": 0, "settings": {}, "purges": []}
+        self._next_poll = 0.0
+        self._lock = Lock()
+        self._watcher_pid: Optional[int] = None
+
+    def _client(self):
+        return self.get_redis() if self.get_redis is not None else None
+
+    @property
+    def shared(self) -> bool:
+        return self._client() is not None
+
+    def read(self) -> Dict[str, Any]:
+        client = self._client()
+        if client is not None:
+            raw = client.get(self.key)
+            return json.loads(raw) if raw else {"version": 0, "settings": {}, "purges": []}
+        with self._lock:
+            return json.loads(json.dumps(self._local))
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        client = self._client()
+        if client is not None:
+            client.set(self.key, json.dumps(record))
+        else:
+            with self._lock:
+                self._local = record
+
+    def publish(self, settings: Optional[Dict[str, Any]] = None,
+                purge: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        record = self.read()
+        record["version"] = int(record.get("version", 0)) + 1
+        if settings:
+            record["settings"] = {**record.get("settings", {}), **settings}
+        if purge is not None:
+            purges = record.get("purges", [])
+            purges.append({**purge, "version": record["version"], "at": time.time()})
+            record["purges"] = purges[-self.keep_purges:]
+        self._write(record)
+        return record
+
+    def watch(self, apply: Callable[[], None]) -> None:
+        """Call ``apply`` every ``poll_seconds`` off the request path; cheap once running.
+
+        Started lazily, so each forked worker gets its own thread.
+        """
+        pid = os.getpid()
+        if self._watcher_pid == pid:
+            return
+        with self._lock:
+            if self._watcher_pid == pid:
+                return
+            self._watcher_pid = pid
+            Thread(target=self._watch, args=(apply,), name="cache-control", daemon=True).start()
+
+    def _watch(self, apply: Callable[[], None]) -> None:
+        while True:
+            time.sleep(max(0.1, self.poll_seconds))
+            try:
+                apply()
+            except Exception:
+                logger.debug("Cache control sync failed", exc_info=True)
+
+    def poll(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """The shared record if it is time to look again, else None (cheap)."""
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return None
+        self._next_poll = now + self.poll_seconds
+        try:
+            return self.read()
+        except Exception:
+            logger.debug("Cache control record unavailable", exc_info=True)
+            return None
+
+
+def build_primary_tier(backend: str, memory: MemoryTier, get_redis: Optional[Callable[[], Any]] = None,
+                       redis_prefix: str = "aifraud",
+                       disk_path: Optional[str] = None, ttl: float = 300, hit_sample: int = 0):
+    """Pick the primary tier for AI_FILTER_CACHE_BACKEND (auto|memory|redis|disk).
+
+    ``auto`` keeps the historical behaviour: Redis when connected, else memory.
+    """
+    backend = (backend or "auto").lower()
+    if backend in {"auto", "redis"} and get_redis is not None and get_redis() is not None:
+        return RedisTier(get_redis, redis_prefix, ttl, hit_sample)
+    if backend == "redis":
+        logger.warning("AI_FILTER_CACHE_BACKEND=redis but Redis is unavailable; using in-memory cache")
+    if backend == "disk":
+        try:
+            return DiskTier(disk_path or os.path.join(tempfile.gettempdir(), "aifraud-cache"), ttl)
+        except Exception:
+            logger.exception("Disk cache unavailable at %s; using in-memory cache", disk_path)
+    return memory
@@ -1,17 +1,21 @@
 import os
 import json
 import logging
-from typing import Optional
-import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 import hashlib
-from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from threading import Lock
 
-import requests
-try:
-    import redis  # type: ignore
-except Exception:  # pragma: no cover
-    redis = None
+from ai_cache import ROW_TAG, CacheControl, MemoryTier, build_primary_tier, content_type_tag
+from ai_logging import PromptSampler, Truncated, setup_ai_logging
+import chunking
+import html_redact
+import metrics
+import redis_pool
+from redaction_backends import build_backend
+from token_accounting import TokenUsage, estimate_tokens
+import scheduler
 
 
 logger = logging.getLogger(__name__)
@@ -80,9 +84,40 @@ def _default_system_prompt() -> str:
     )
 
 
+def _compact_system_prompt() -> str:
+    # Same policy as the default prompt in about a third of the tokens. Bench
+    # candidate only (see CANDIDATE_SYSTEM_PROMPTS)
+    return (
+        "You redact sensitive data from API output. Output ONLY the redacted input: same structure, keys, "
+        "order, array lengths and whitespace; valid JSON if the input is JSON; no explanations or code fences.\n"
+        "Replace each sensitive value with the string \"********\" (quoted, even for numbers/booleans; "
+        "recursively for objects/arrays). In free text replace only the sensitive substring. Never invent data; "
+        "when unsure, redact.\n"
+        "Sensitive keys (any nesting/casing, partial match): ssn, email, phone, jwt, pin, otp, and any key "
+        "containing card, cvc, cvv, exp, expiry, secret, token, key, auth, pass, iban, account, routing.\n"
+        "Sensitive values under ANY key (attackers alias columns to id/name/username): 13-19 digit card "
+        "numbers (spaces/dashes allowed); 3-4 digit codes next to cvv/cvc; dates next to exp/expiry; "
+        "anything with '@' and a domain; phone numbers with 10+ digits; base64/hex-like strings of 16+ chars "
+        "or with prefixes sk-, pk_, tg_, jwt; hex strings of 20+ chars; anything starting with CBJS_SECRET_.\n"
+        "Example: {\"username\": \"CBJS_SECRET_a1\", \"phone\": \"+1-202-555-0101\", \"id\": 1} -> "
+        "{\"username\": \"********\", \"phone\": \"********\", \"id\": 1}\n"
+        "Example: \"card 4111 1111 1111 1111 cvv 123\" -> \"card ******** cvv ********\""
+    )
+
+
+SYSTEM_PROMPT_VARIANTS = {"default": _default_system_prompt}
+
+# Not selectable through AI_FILTER_PROMPT_VARIANT until bench/prompt_check.py
+# passes them against a corpus recorded from a real model; the benches pass
+# them in as AI_FILTER_SYSTEM_PROMPT
+CANDIDATE_SYSTEM_PROMPTS = {"compact": _compact_system_prompt}
+
+# Built once at import so a preloaded master shares it with workers copy-on-write
+DEFAULT_SYSTEM_PROMPT = _default_system_prompt()
+
 
 class AIRedactor:
-    """AI-based redaction via OpenRouter. Fails closed when unavailable."""
+    """AI-based redaction (OpenRouter or a local model). Fails closed when unavailable."""
 
     def __init__(self):
         self.enabled = os.getenv("AI_FILTER_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
@@ -90,7 +125,18 @@ class AIRedactor:
         self.api_key = os.getenv("OPENROUTER_API_KEY")
         # Accept either AI_FILTER_MODEL or MODEL
         self.model = os.getenv("AI_FILTER_MODEL") or os.getenv("MODEL", "meta-llama/llama-3.1-70b-instruct")
-        self.system_prompt = os.getenv("AI_FILTER_SYSTEM_PROMPT") or _default_system_prompt()
+        # Key of SYSTEM_PROMPT_VARIANTS; AI_FILTER_SYSTEM_PROMPT overrides it
+        self.prompt_variant = os.getenv("AI_FILTER_PROMPT_VARIANT", "default").lower()
+        if self.prompt_variant not in SYSTEM_PROMPT_VARIANTS:
+            logger.warning("Unknown AI_FILTER_PROMPT_VARIANT=%s; using the default prompt.", self.prompt_variant)
+            self.prompt_variant = "default"
+        if self.prompt_variant == "default":
+            variant_prompt = DEFAULT_SYSTEM_PROMPT
+        else:
+            variant_prompt = SYSTEM_PROMPT_VARIANTS[self.prompt_variant]()
+        self.system_prompt = os.getenv("AI_FILTER_SYSTEM_PROMPT") or variant_prompt
+        # Mark the system message as cacheable for providers with prompt caching
+        self.prompt_cache = os.getenv("AI_FILTER_PROMPT_CACHE", "false").lower() in {"1", "true", "yes", "on"}
         self.timeout = float(os.getenv("AI_FILTER_TIMEOUT", "8"))
         self.max_output_tokens = int(os.getenv("AI_FILTER_MAX_TOKENS", "4096"))
 
@@ -98,28 +144,49 @@ class AIRedactor:
         self.cache_size = int(os.getenv("AI_FILTER_CACHE_SIZE", "256"))
         self.cache_ttl = float(os.getenv("AI_FILTER_CACHE_TTL", "300"))
         self.cache_max_body = int(os.getenv("AI_FILTER_CACHE_MAX_BODY", "131072"))  # 128 KiB
-        self._cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
-        self._lock = Lock()
+        # auto (Redis if reachable, else memory) | memory | redis | disk
+        self.cache_backend = os.getenv("AI_FILTER_CACHE_BACKEND", "auto").lower()
+        self.cache_dir = os.getenv("AI_FILTER_CACHE_DIR")
+        # lru | lfu | fifo (in-process tier; Redis evicts per its own maxmemory-policy)
+        self.cache_policy = os.getenv("AI_FILTER_CACHE_POLICY", "lru").lower()
+        self._memory_cache = MemoryTier(self.cache_size, self.cache_ttl, self.cache_policy)
 
         self.log_requests = os.getenv("AI_FILTER_LOG_REQUESTS", "true").lower() in {"1", "true", "yes", "on"}
         # Log full prompts (system + input) going into the AI API
         self.log_prompts = os.getenv("AI_FILTER_LOG_PROMPTS", "true").lower() in {"1", "true", "yes", "on"}
         # Safety: avoid unbounded logs; can be increased/disabled by env
         self.log_prompt_max_chars = int(os.getenv("AI_FILTER_LOG_PROMPT_MAX_CHARS", "4000"))
-
-        # Optional Redis cache for multi-worker setups
-        self.redis_url = os.getenv("REDIS_URL")
+        # Log 1 in N prompts; the per-call metadata lines are always logged
+        self.log_prompt_sample = int(os.getenv("AI_FILTER_LOG_PROMPT_SAMPLE", "1"))
+        # text | json
+        self.log_format = os.getenv("AI_FILTER_LOG_FORMAT", "text").lower()
+        self._sample_prompt = PromptSampler(self.log_prompt_sample)
+        # The system prompt is static, so its log block is rendered once
+        self._system_prompt_block = str(Truncated(self.system_prompt or "", self.log_prompt_max_chars))
+
+        # Optional Redis cache for multi-worker setups (shared, fork-aware pool)
+        self.redis_url = redis_pool.REDIS_URL
         self.redis_prefix = os.getenv("REDIS_PREFIX", "aifraud")
-        self._redis = None
-        if self.redis_url and redis is not None:
-            try:
-                self._redis = redis.Redis.from_url(self.redis_url, decode_responses=True)
-                # Simple ping to verify connectivity
-                self._redis.ping()
-                logger.info("AI cache using Redis at %s", self.redis_url)
-            except Exception:
-                logger.exception("Redis unavailable for AI cache, falling back to in-memory")
-                self._redis = None
+
+        self._cache = build_primary_tier(
+            self.cache_backend,
+            self._memory_cache,
+            get_redis=redis_pool.get_redis if self.cache_backend in {"auto", "redis"} else None,
+            redis_prefix=self.redis_prefix,
+            disk_path=self.cache_dir,
+            ttl=self.cache_ttl,
+            # Redis hits counted for /admin/cache top keys: 1 in N (0 = off)
+            hit_sample=int(os.getenv("AI_FILTER_CACHE_HIT_SAMPLE", "0")),
+        )
+        if self._cache.name == "redis":
+            logger.info("AI cache using Redis at %s", self.redis_url)
+        # Live settings/purges from the admin API, shared via Redis when available
+        self.cache_control = CacheControl(
+            redis_pool.get_redis, self.redis_prefix, float(os.getenv("AI_FILTER_CACHE_SYNC_SECONDS", "2"))
+        )
+        self._control_version = 0
+        self._control_lock = Lock()
+        self._sync_cache_control(force=True, apply_purges=False)
 
         # Configure logging for AI operations
         if self.log_requests:
@@ -127,168 +194,216 @@ class AIRedactor:
             if root_logger.getEffectiveLevel() > logging.INFO:
                 root_logger.setLevel(logging.INFO)
             logger.setLevel(logging.INFO)
-            
-            # Configure formatter for better AI logging
-            formatter = logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - [AI_CALL] %(message)s'
-            )
-            handler = logging.StreamHandler()
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
-            
-            logger.info("AI redaction request logging enabled")
-            logger.info("AI Filter Configuration: enabled=%s, model=%s, timeout=%s, cache_size=%s, log_prompts=%s, prompt_max_chars=%s", 
-                       self.enabled, self.model, self.timeout, self.cache_size, self.log_prompts, self.log_prompt_max_chars)
 
-        if not self.api_key:
-            logger.error("OPENROUTER_API_KEY not set; AI redaction disabled.")
+            # Records are queued and formatted/written by a background thread
+            setup_ai_logging(logger, self.log_format)
+
+            logger.info("AI redaction request logging enabled")
+            logger.info("AI Filter Configuration: enabled=%s, model=%s, timeout=%s, cache_size=%s, cache_backend=%s, log_prompts=%s, prompt_max_chars=%s", 
+                       self.enabled, self.model, self.timeout, self.cache_size, self._cache.name, self.log_prompts, self.log_prompt_max_chars)
+            if self.log_prompts and self.log_prompt_sample > 1:
+                logger.info("AI prompt logging sampled at 1/%d", self.log_prompt_sample)
+
+        # Priority/fair-share admission for upstream calls; 0 disables the cap
+        self.scheduler = scheduler.UpstreamScheduler(
+            max_concurrency=int(os.getenv("AI_FILTER_MAX_CONCURRENCY", "0")),
+            aging_seconds=float(os.getenv("AI_FILTER_SCHED_AGING_SECONDS", "2")),
+            max_wait=float(os.getenv("AI_FILTER_SCHED_MAX_WAIT", str(self.timeout * 4))),
+            team_weights=scheduler.parse_weights(os.getenv("AI_FILTER_SCHED_TEAM_WEIGHTS", "")),
+        )
+
+        # whole: send HTML documents as they are | markup: send only their segments (see html_redact)
+        self.html_mode = os.getenv("AI_FILTER_HTML_MODE", "whole").lower()
+        self.html_batch_chars = int(os.getenv("AI_FILTER_HTML_BATCH_CHARS", "8000"))
+
+        # Bodies above this many chars are split and redacted chunk-wise (0, the default, disables)
+        self.chunk_chars = int(os.getenv("AI_FILTER_CHUNK_CHARS", "0"))
+        self.chunk_concurrency = max(1, int(os.getenv("AI_FILTER_CHUNK_CONCURRENCY", "4")))
+        self._chunk_executor: Optional[ThreadPoolExecutor] = None
+        # Rows per model call when redact_rows sends its cache misses
+        self.row_batch = max(1, int(os.getenv("AI_FILTER_ROW_BATCH", "20")))
+        self._chunk_executor_lock = Lock()
+
+        # openrouter | local | auto (see redaction_backends)
+        self.backend_name = os.getenv("AI_FILTER_BACKEND", "openrouter").lower()
+        self.backend = build_backend(
+            self.backend_name,
+            api_key=self.api_key,
+            base_url=self.base_url,
+            model=self.model,
+            system_prompt=self.system_prompt,
+            timeout=self.timeout,
+            max_output_tokens=self.max_output_tokens,
+            log_prompt=self._log_prompt,
+            prompt_cache=self.prompt_cache,
+        )
+        # Changes whenever the output for a given input may (used to key ETags)
+        self.fingerprint = hashlib.sha256(
+            "\n".join([self.backend.name, self.model, self.system_prompt or ""]).encode()
+        ).hexdigest()[:16]
+        if self.backend.name != "openrouter":
+            logger.info("AI redaction backend: %s", self.backend.name)
+        if not self.backend.available:
+            if self.backend.name == "openrouter":
+                logger.error("OPENROUTER_API_KEY not set; AI redaction disabled.")
+            else:
+                logger.error("AI redaction backend %s unavailable; AI redaction disabled.", self.backend.name)
             self.enabled = False
 
-    def redact_text(self, text: str, content_type: Optional[str] = None) -> str:
+    def redact_text(self, text: str, content_type: Optional[str] = None,
+                    usage: Optional[TokenUsage] = None, *, team: str = "",
+                    priority: int = scheduler.BULK) -> str:
+        """Return the redacted ``text``; raises RuntimeError (fail closed).
+
+        Model tokens spent on a cache miss are added to ``usage`` if given.
+        ``team``/``priority`` feed the upstream scheduler when it is enabled.
+        HTML is redacted segment-wise and large bodies chunk-wise (see
+        html_redact/chunking); each piece is cached on its own.
+        """
+        if content_type == "text/html" and self.html_mode == "markup" and isinstance(text, str):
+            return html_redact.redact_html(
+                text,
+                lambda bodies: self._redact_many(
+                    [(body, "application/json") for body in bodies], usage, team, priority
+                ),
+                self.html_batch_chars,
+            )
+        chunks_plan = chunking.plan(text, content_type, self.chunk_chars) if isinstance(text, str) else None
+        if chunks_plan is not None:
+            chunks, assemble = chunks_plan
+            logger.info("AI CHUNKED - type=%s, len=%d, chunks=%d", content_type, len(text), len(chunks),
+                        extra={"ai": {"event": "chunked", "content_type": content_type, "len": len(text),
+                                      "chunks": len(chunks)}})
+            return assemble(self._redact_many(chunks, usage, team, priority))
+        return self._redact_one(text, content_type, usage, team, priority)
+
+    def redact_rows(self, rows: List[Dict[str, Any]], usage: Optional[TokenUsage] = None, *,
+                    team: str = "", priority: int = scheduler.BULK) -> List[Dict[str, Any]]:
+        """Redact rows through the row-level cache, returning them in order.
+
+        Each row is cached on its own under the hash of its content, so a row
+        redacted for one response is reused by every other that contains it.
+        Only the misses go to the model, ``AI_FILTER_ROW_BATCH`` per call as
+        one JSON array; each must come back with the same keys.
+        """
+        texts = [json.dumps(row, ensure_ascii=False, sort_keys=True, separators=(",", ":")) for row in rows]
+        out: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        # key -> positions, so a row repeated within a response is sent once
+        misses: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = self._make_key(text, ROW_TAG)
+            cached = self._cache_get(key)
+            if cached is not None:
+                out[i] = json.loads(cached)
+            else:
+                misses.setdefault(key, []).append(i)
+        pending = list(misses.items())
+        groups = [pending[i:i + self.row_batch] for i in range(0, len(pending), self.row_batch)]
+        bodies = [("[" + ",".join(texts[idx[0]] for _, idx in group) + "]", "application/json") for group in groups]
+        for group, raw in zip(groups, self._redact_many(bodies, usage, team, priority, cache=False)):
+            for (key, idx), item in zip(group, chunking.load_array(raw, len(group))):
+                if not isinstance(item, dict) or set(item) != set(rows[idx[0]]):
+                    raise RuntimeError("AI redaction changed the keys of a row")
+                self._cache_set(key, json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+                for i in idx:
+                    out[i] = item
+        return out  # type: ignore[return-value]
+
+    def _redact_many(self, bodies: List[Tuple[str, str]], usage: Optional[TokenUsage],
+                     team: str, priority: int, cache: bool = True) -> List[str]:
+        """Redact independent (text, content_type) bodies in parallel, in order.
+
+        The first failure propagates, so the whole response fails closed.
+        """
+        if not bodies:
+            return []
+        if len(bodies) == 1:
+            return [self._redact_one(bodies[0][0], bodies[0][1], usage, team, priority, cache)]
+        futures = [
+            self._chunk_pool().submit(self._redact_one, body, ctype, usage, team, priority, cache)
+            for body, ctype in bodies
+        ]
+        try:
+            return [f.result() for f in futures]
+        finally:
+            for f in futures:
+                f.cancel()
+
+    def redact_stream(self, bodies: Iterable[Tuple[str, str]], usage: Optional[TokenUsage] = None, *,
+                      team: str = "", priority: int = scheduler.BULK) -> Iterator[str]:
+        """Redact a lazily produced sequence of (text, content_type) bodies, yielding results in order.
+
+        At most ``AI_FILTER_CHUNK_CONCURRENCY`` bodies are in flight, so
+        ``bodies`` is only pulled as fast as results are consumed. The first
+        failure propagates; closing the generator cancels what is queued.
+        """
+        window: Deque[Future] = deque()
+        try:
+            for body, ctype in bodies:
+                window.append(self._chunk_pool().submit(self._redact_one, body, ctype, usage, team, priority))
+                if len(window) >= self.chunk_concurrency:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+        finally:
+            for f in window:
+                f.cancel()
+
+    def _redact_one(self, text: str, content_type: Optional[str], usage: Optional[TokenUsage],
+                    team: str, priority: int, cache: bool = True) -> str:
+        if isinstance(text, str):
+            metrics.REDACTION_BODY_BYTES.labels(content_type or "").observe(len(text))
         cache_key = None
-        if isinstance(text, str) and len(text) <= self.cache_max_body:
+        if cache and isinstance(text, str) and len(text) <= self.cache_max_body:
             cache_key = self._make_key(text, content_type)
             cached = self._cache_get(cache_key)
             if cached is not None:
-                logger.info("AI CACHE HIT - type=%s, key=%s", content_type, cache_key[:12])
+                logger.info("AI CACHE HIT - type=%s, key=%s", content_type, cache_key[:12],
+                            extra={"ai": {"event": "cache_hit", "content_type": content_type, "key": cache_key[:12]}})
                 return cached
 
         if not self.enabled:
             raise RuntimeError("AI redactor is disabled")
 
-        logger.info("AI API CALL - model=%s, type=%s, len=%d", self.model, content_type, len(text))
-        
-        try:
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": text},
-                ],
-                "temperature": 0.0,
-                "max_tokens": self.max_output_tokens,
-                # Encourage model to keep structure
-                "top_p": 0.9,
-            }
-
-            # Optional detailed prompt logging
-            if self.log_requests and self.log_prompts:
-                sp = self.system_prompt or ""
-                ui = text or ""
-                maxc = self.log_prompt_max_chars
-                def _trunc(s: str) -> str:
-                    if maxc <= 0:
-                        return s
-                    return s if len(s) <= maxc else f"{s[:maxc]}... [truncated {len(s)-maxc} chars]"
-                logger.info(
-                    "AI REQUEST PROMPT (chat.completions) - type=%s\n"+"-"*30+"\n\n\n\n--- SYSTEM PROMPT (%d chars) ---\n%s\n--- USER INPUT (%d chars) ---\n%s",
-                    content_type,
-                    len(sp),
-                    _trunc(sp),
-                    len(ui),
-                    _trunc(ui),
-                )
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "User-Agent": os.getenv("AI_FILTER_USER_AGENT", "CTF-AI-Filter/1.0"),
-                # Optional but nice for OpenRouter analytics
-                "HTTP-Referer": os.getenv("OPENROUTER_REFERRER", "https://ctf.local"),
-                "X-Title": os.getenv("OPENROUTER_TITLE", "CTF AI Filter"),
-            }
-
-            # Try chat.completions first; if not available, fall back to /responses
-            url_cc = f"{self.base_url}/chat/completions"
-            
-            start_time = time.time()
-            resp = requests.post(url_cc, headers=headers, data=json.dumps(payload), timeout=self.timeout)
-            request_duration = time.time() - start_time
-            
-            logger.info("AI API RESPONSE - status=%d, duration=%.2fs", resp.status_code, request_duration)
-            if resp.status_code == 404 or resp.status_code == 405:
-                # Fallback to unified Responses API
-                url_resp = f"{self.base_url}/responses"
-                payload2 = {
-                    "model": self.model,
-                    "input": [
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": text},
-                    ],
-                    "temperature": 0.0,
-                    "max_output_tokens": self.max_output_tokens,
-                }
-
-                if self.log_requests and self.log_prompts:
-                    sp = self.system_prompt or ""
-                    ui = text or ""
-                    maxc = self.log_prompt_max_chars
-                    def _trunc2(s: str) -> str:
-                        if maxc <= 0:
-                            return s
-                        return s if len(s) <= maxc else f"{s[:maxc]}... [truncated {len(s)-maxc} chars]"
-                    logger.info(
-                        "AI REQUEST PROMPT (responses) - type=%s\n"+"-"*30+"\n\n\n\n--- SYSTEM PROMPT (%d chars) ---\n%s\n--- USER INPUT (%d chars) ---\n%s",
-                        content_type,
-                        len(sp),
-                        _trunc2(sp),
-                        len(ui),
-                        _trunc2(ui),
-                    )
-
-                start_time = time.time()
-                resp = requests.post(url_resp, headers=headers, data=json.dumps(payload2), timeout=self.timeout)
-                request_duration = time.time() - start_time
-                
-                logger.info("AI API RESPONSE (fallback) - status=%d, duration=%.2fs", resp.status_code, request_duration)
-
-            resp.raise_for_status()
-
-            content_type_header = (resp.headers.get('content-type') or '').lower()
-            if 'json' not in content_type_header:
-                raise RuntimeError("AI redaction returned non-JSON response")
+        logger.info("AI API CALL - backend=%s, model=%s, type=%s, len=%d", self.backend.name, self.model, content_type, len(text),
+                    extra={"ai": {"event": "call", "backend": self.backend.name, "model": self.model,
+                                  "content_type": content_type, "len": len(text)}})
 
-            try:
-                data = resp.json()
-            except ValueError as exc:
-                raise RuntimeError("AI redaction returned invalid JSON") from exc
-
-            # Accept multiple possible schemas
-            # 1) OpenAI-compatible chat.completions
-            if isinstance(data, dict) and data.get("choices"):
-                choice = (data.get("choices") or [{}])[0]
-                message = choice.get("message") or {}
-                content = message.get("content")
-                if isinstance(content, str) and content.strip():
-                    if cache_key:
-                        self._cache_set(cache_key, content)
-                    return content
-
-            # 2) Responses API with output_text
-            content = data.get("output_text")
-            if isinstance(content, str) and content.strip():
-                if cache_key:
-                    self._cache_set(cache_key, content)
-                return content
-
-            # 3) Responses API with output[].content[].text
-            try:
-                output = data.get("output") or []
-                if output:
-                    parts = output[0].get("content") or []
-                    texts = [p.get("text", "") for p in parts if isinstance(p, dict)]
-                    joined = "".join(texts).strip()
-                    if joined:
-                        if cache_key:
-                            self._cache_set(cache_key, joined)
-                        return joined
-            except Exception:
-                pass
-
-            raise RuntimeError("AI redaction returned no usable content")
+        try:
+            with self.scheduler.slot(priority, team, cost=estimate_tokens(text)):
+                content = self.backend.redact(text, content_type, usage)
         except Exception as exc:
             raise RuntimeError("AI redaction failed") from exc
+        if cache_key:
+            self._cache_set(cache_key, content)
+        return content
+
+    def _chunk_pool(self) -> ThreadPoolExecutor:
+        # Shared per process, so AI_FILTER_CHUNK_CONCURRENCY caps all requests together
+        if self._chunk_executor is None:
+            with self._chunk_executor_lock:
+                if self._chunk_executor is None:
+                    self._chunk_executor = ThreadPoolExecutor(
+                        max_workers=self.chunk_concurrency, thread_name_prefix="ai-chunk"
+                    )
+        return self._chunk_executor
+
+    def _log_prompt(self, endpoint: str, text: str, content_type: Optional[str]) -> None:
+        if not (self.log_requests and self.log_prompts) or not self._sample_prompt():
+            return
+        sp = self.system_prompt or ""
+        ui = Truncated(text, self.log_prompt_max_chars)
+        logger.info(
+            "AI REQUEST PROMPT (%s) - type=%s\n"+"-"*30+"\n\n\n\n--- SYSTEM PROMPT (%d chars) ---\n%s\n--- USER INPUT (%d chars) ---\n%s",
+            endpoint,
+            content_type,
+            len(sp),
+            self._system_prompt_block,
+            len(ui.text),
+            ui,
+            extra={"ai": {"event": "prompt", "endpoint": endpoint, "content_type": content_type,
+                          "system_chars": len(sp), "input_chars": len(ui.text), "input": ui}},
+        )
 
     # ---- cache helpers ----
     def _make_key(self, text: str, content_type: Optional[str]) -> str:
@@ -296,50 +411,120 @@ class AIRedactor:
         h.update((content_type or "").encode())
         h.update(b"\n")
         h.update(text.encode())
-        return h.hexdigest()
+        return f"{content_type_tag(content_type)}-{h.hexdigest()}"
+
+    def _tiers(self) -> List:
+        return [self._memory_cache] if self._cache is self._memory_cache else [self._memory_cache, self._cache]
+
+    def _sync_cache_control(self, force: bool = False, apply_purges: bool = True) -> None:
+        record = self.cache_control.poll(force)
+        if not record or int(record.get("version", 0)) <= self._control_version:
+            return
+        with self._control_lock:
+            seen = self._control_version
+            if int(record["version"]) <= seen:
+                return
+            settings = record.get("settings") or {}
+            for tier in self._tiers():
+                tier.configure(ttl=settings.get("ttl"), size=settings.get("size"), policy=settings.get("policy"))
+            if apply_purges:
+                # Shared tiers were purged by the worker that took the request
+                for purge in record.get("purges") or []:
+                    if int(purge.get("version", 0)) > seen:
+                        self._memory_cache.purge(purge.get("tag"), purge.get("older_than"))
+            self._control_version = int(record["version"])
+
+    def cache_stats(self, top: int = 10) -> Dict[str, Any]:
+        tiers: Dict[str, Any] = {}
+        for tier in self._tiers():
+            try:
+                tiers[tier.name] = tier.stats(top)
+            except Exception as exc:
+                tiers[tier.name] = {"error": str(exc)}
+        tiers["memory"]["pid"] = os.getpid()
+        return {
+            "primary": self._cache.name,
+            "shared_control": self.cache_control.shared,
+            "control_version": self._control_version,
+            "tiers": tiers,
+            "lookups": metrics.cache_lookup_counts(),
+        }
+
+    def purge_cache(self, content_type: Optional[str] = None, older_than: Optional[float] = None) -> Dict[str, Any]:
+        """Purge matching entries everywhere; returns per-tier counts (memory: this worker)."""
+        self._sync_cache_control(force=True)
+        tag = content_type_tag(content_type) if content_type else None
+        removed: Dict[str, Any] = {}
+        for tier in self._tiers():
+            try:
+                removed[tier.name] = tier.purge(tag, older_than)
+            except Exception as exc:
+                removed[tier.name] = {"error": str(exc)}
+        record = self.cache_control.publish(purge={"tag": tag, "older_than": older_than})
+        self._control_version = max(self._control_version, int(record["version"]))
+        return removed
+
+    def update_cache_settings(self, ttl: Optional[float] = None, policy: Optional[str] = None,
+                              size: Optional[int] = None) -> Dict[str, Any]:
+        settings = {k: v for k, v in {"ttl": ttl, "policy": policy, "size": size}.items() if v is not None}
+        if settings:
+            self.cache_control.publish(settings=settings)
+            self._sync_cache_control(force=True)
+        return self.cache_control.read().get("settings", {})
 
     def _cache_get(self, key: str) -> Optional[str]:
-        # Prefer Redis if available
-        if self._redis is not None:
-            try:
-                val = self._redis.get(f"{self.redis_prefix}:aicache:{key}")
-                return val
-            except Exception:
-                pass
+        # Settings and purges from other workers are picked up on a timer, not here
+        self.cache_control.watch(lambda: self._sync_cache_control(force=True))
+        tier = self._cache
         try:
-            with self._lock:
-                item = self._cache.get(key)
-                if not item:
-                    return None
-                ts, val = item
-                if (time.time() - ts) > self.cache_ttl:
-                    try:
-                        del self._cache[key]
-                    except KeyError:
-                        pass
-                    return None
-                self._cache.move_to_end(key)
-                return val
+            val = tier.get(key)
         except Exception:
-            return None
-
-    def _cache_set(self, key: str, value: str) -> None:
-        # Prefer Redis if available
-        if self._redis is not None:
+            # Shared tier failed; fall back to the in-memory tier
+            if tier is self._memory_cache:
+                return None
+            tier = self._memory_cache
             try:
-                self._redis.setex(f"{self.redis_prefix}:aicache:{key}", int(self.cache_ttl), value)
-                return
+                val = tier.get(key)
             except Exception:
-                pass
+                return None
+        metrics.AI_CACHE_LOOKUPS.labels(tier.name, "miss" if val is None else "hit").inc()
+        return val
+
+    def _cache_set(self, key: str, value: str) -> None:
+        try:
+            self._cache.set(key, value)
+            return
+        except Exception:
+            pass
+        if self._cache is self._memory_cache:
+            return
         try:
-            with self._lock:
-                self._cache[key] = (time.time(), value)
-                self._cache.move_to_end(key)
-                while len(self._cache) > self.cache_size:
-                    self._cache.popitem(last=False)
+            self._memory_cache.set(key, value)
         except Exception:
             pass
 
 
-# Singleton for easy import
-redactor = AIRedactor()
+_redactor: Optional[AIRedactor] = None
+_redactor_lock = Lock()
+
+
+def get_redactor() -> AIRedactor:
+    """Build the shared redactor on first use.
+
+    Deferring construction keeps env reads, log handler setup and the Redis
+    connect out of import time, so ``gunicorn --preload`` can import the app
+    in the master and each worker initialises its own redactor after fork.
+    """
+    global _redactor
+    if _redactor is None:
+        with _redactor_lock:
+            if _redactor is None:
+                _redactor = AIRedactor()
+    return _redactor
+
+
+def __getattr__(name: str):
+    # Backwards compatible `from ai_filter import redactor` (builds it eagerly)
+    if name == "redactor":
+        return get_redactor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,129 @@
+import os
+import json
+import atexit
+import logging
+import logging.handlers
+import queue
+from itertools import count
+from threading import Lock
+from typing import Optional
+
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [AI_CALL] %(message)s'
+
+
+class Truncated:
+    """Defers truncation (and the copy it makes) until the record is formatted."""
+
+    __slots__ = ("text", "max_chars")
+
+    def __init__(self, text: str, max_chars: int):
+        self.text = text or ""
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        s, maxc = self.text, self.max_chars
+        if maxc <= 0 or len(s) <= maxc:
+            return s
+        return f"{s[:maxc]}... [truncated {len(s)-maxc} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields come from ``extra={"ai": {...}}``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        ai = getattr(record, "ai", None)
+        if isinstance(ai, dict):
+            entry.update({k: str(v) if isinstance(v, Truncated) else v for k, v in ai.items()})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock ``prepare`` renders the message on the calling thread, which is
+    exactly the cost we want off the request path. Records only cross threads
+    here, so they don't need to be made picklable.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; drop instead
+            pass
+
+
+class PromptSampler:
+    """Let through 1 in N prompt logs (N <= 1 logs every prompt)."""
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self._counter = count()
+        self._lock = Lock()
+
+    def __call__(self) -> bool:
+        if self.every == 1:
+            return True
+        with self._lock:
+            return next(self._counter) % self.every == 0
+
+
+_setup_lock = Lock()
+_handler: Optional[DeferredQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_listener(target: logging.Handler) -> None:
+    global _listener
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(int(os.getenv("AI_FILTER_LOG_QUEUE_SIZE", "10000")))
+    _handler.queue = q
+    _listener = logging.handlers.QueueListener(q, target, respect_handler_level=True)
+    _listener.start()
+
+
+def _after_fork_in_child() -> None:
+    # The writer thread does not survive fork; give the child its own queue and thread
+    if _handler is not None and _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def setup_ai_logging(target_logger: logging.Logger, fmt: str = "text") -> None:
+    """Route ``target_logger`` through a queue to a background writer thread.
+
+    Idempotent: repeated calls (e.g. several ``AIRedactor`` instances) reuse
+    the same handler instead of stacking duplicates.
+    """
+    global _handler
+    with _setup_lock:
+        if _handler is not None:
+            return
+        stream = logging.StreamHandler()
+        stream.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        _handler = DeferredQueueHandler(queue.Queue())
+        _start_listener(stream)
+        target_logger.addHandler(_handler)
+        # Root handlers would format synchronously on the request thread again
+        target_logger.propagate = False
+        atexit.register(_stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _stop() -> None:
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
@@ -7,20 +7,27 @@ import time
 import secrets
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import jwt
-from flask import Flask, request, jsonify, Response, make_response, redirect, url_for
+from flask import Flask, g, request, jsonify, Response, make_response, redirect, url_for, stream_with_context
 from dotenv import load_dotenv
-try:
-    import redis  # type: ignore
-except Exception:  # pragma: no cover
-    redis = None
-
 # Ensure environment is loaded before importing the redactor
 load_dotenv()
-from ai_filter import redactor
+from ai_filter import get_redactor
+import chunking
+import compression
+import scheduler
+import metrics
+import redis_pool
+from token_accounting import TokenAccountant, TokenUsage
+from prefetch import Prefetcher
+from db import ConnectionManager
+from etags import ETagStore
+from materialize import Materializer
+from ai_cache import EVICTION_POLICIES
+from auth_cache import ClaimsCache, TeamTokenFile
+from ratelimit import InflightLimiter, MemoryRateLimiter, RedisRateLimiter
 
 DB_PATH = Path(os.getenv("DB_PATH", "db.sqlite3"))
 TEAM_TOKENS_PATH = Path(os.getenv("TEAM_TOKENS_PATH", "team_tokens.json"))
@@ -30,16 +37,108 @@ JWT_EXP_SECONDS = int(os.getenv("JWT_EXP_SECONDS", "86400"))
 JWT_ISSUER = os.getenv("JWT_ISSUER", "ai-fraud-challenge")
 JWT_COOKIE_NAME = os.getenv("JWT_COOKIE_NAME", "team_session")
 JWT_COOKIE_SECURE = os.getenv("JWT_COOKIE_SECURE", "false").lower() in {"1", "true", "yes", "on"}
+# Verified session JWTs cached by digest (0 disables); team token file re-checked this often (0 never)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "4096"))
+TEAM_TOKENS_RELOAD_SECONDS = float(os.getenv("TEAM_TOKENS_RELOAD_SECONDS", "5"))
 RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "600"))
 RATE_LIMIT_MAX_REQUESTS = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "50"))
 RATE_LIMIT_MIN_INTERVAL = float(os.getenv("RATE_LIMIT_MIN_INTERVAL", "3"))
+# Requests a worker reserves per Redis round trip (1 = check every request; see ratelimit.py)
+RATE_LIMIT_LEASE_SIZE = int(os.getenv("RATE_LIMIT_LEASE_SIZE", "1"))
+# Concurrent requests per team across workers (0 disables); slots of a crashed worker expire after the TTL.
+# Shared through Redis; without REDIS_URL each worker enforces it alone (limit x workers per team)
+TEAM_MAX_INFLIGHT = int(os.getenv("TEAM_MAX_INFLIGHT", "0"))
+TEAM_INFLIGHT_TTL = float(os.getenv("TEAM_INFLIGHT_TTL", "120"))
+# Retry-After for a rejected concurrent request; a slot frees as soon as any of the team's requests ends
+TEAM_INFLIGHT_RETRY_AFTER = float(os.getenv("TEAM_INFLIGHT_RETRY_AFTER", "1"))
 FLAG_VALUE = os.getenv("FLAG")
+# Bearer token for /metrics; unset disables it (per-team series must not be public)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Bearer token for the /admin API; unset disables it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Model-token budget per team per window; 0 disables the token throttle (usage is still accounted)
+TOKEN_BUDGET_PER_WINDOW = int(os.getenv("TOKEN_BUDGET_PER_WINDOW", "0"))
+TOKEN_BUDGET_WINDOW_SECONDS = int(os.getenv("TOKEN_BUDGET_WINDOW_SECONDS", str(RATE_LIMIT_WINDOW_SECONDS)))
+# Warm the redaction cache for /users/<id> of each /search hit (background priority)
+PREFETCH_ENABLED = os.getenv("AI_FILTER_PREFETCH", "false").lower() in {"1", "true", "yes", "on"}
+PREFETCH_MAX_IDS = int(os.getenv("AI_FILTER_PREFETCH_MAX_IDS", "10"))
+PREFETCH_QUEUE_SIZE = int(os.getenv("AI_FILTER_PREFETCH_QUEUE_SIZE", "256"))
+PREFETCH_WORKERS = int(os.getenv("AI_FILTER_PREFETCH_WORKERS", "1"))
+# like: the original string-built LIKE scan (the challenge) | fts: trigram index, bound parameters
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "like").lower()
+SEARCH_COLUMNS = (
+    "id, username, email, phone, address, dob, ssn, "
+    "credit_card_number, credit_card_cvv, credit_card_exp, api_token, secret_key"
+)
+SEARCH_COLUMN_NAMES = [c.strip() for c in SEARCH_COLUMNS.split(",")]
+# Redact /search and /users rows through the row-level cache (AIRedactor.redact_rows)
+ROW_CACHE_ENABLED = os.getenv("AI_FILTER_ROW_CACHE", "false").lower() in {"1", "true", "yes", "on"}
+# Stream /search: rows are read, redacted and sent in batches rather than as one body
+SEARCH_STREAM = os.getenv("SEARCH_STREAM", "false").lower() in {"1", "true", "yes", "on"}
+SEARCH_STREAM_BATCH_ROWS = max(1, int(os.getenv("SEARCH_STREAM_BATCH_ROWS", "50")))
+# /export streams CSV redacted in blocks of EXPORT_BATCH_ROWS rows; off by default
+EXPORT_ENABLED = os.getenv("EXPORT_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+EXPORT_BATCH_ROWS = max(1, int(os.getenv("EXPORT_BATCH_ROWS", "100")))
+# Opt-in strong ETags on /users/<id>; a matching If-None-Match is a 304 with no DB read or AI call.
+# Tags are tied to the DB/WAL file size and mtime, so any write (materializer refreshes included)
+# invalidates all of them (see etags.py)
+ETAGS_ENABLED = os.getenv("ETAGS_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+ETAG_CACHE_SIZE = int(os.getenv("ETAG_CACHE_SIZE", "10000"))
+ETAG_TTL = float(os.getenv("ETAG_TTL", "3600"))
+# Serve /users/<id> from users_redacted, refreshed in the background (materialize.py)
+MATERIALIZE_USERS = os.getenv("MATERIALIZE_USERS", "false").lower() in {"1", "true", "yes", "on"}
+MATERIALIZE_INTERVAL = float(os.getenv("MATERIALIZE_INTERVAL", "5"))
+MATERIALIZE_BATCH = int(os.getenv("MATERIALIZE_BATCH", "100"))
+# Opt-in gzip/br (br needs the optional brotli package) for static pages and for redacted
+# JSON and text bodies of at least COMPRESS_MIN_BYTES. Requests with a query string or
+# body are never compressed: /search echoes q next to redacted data (BREACH)
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "1024"))
+COMPRESSIBLE_TYPES = {"application/json", "text/plain"}
+
+
+DB = ConnectionManager(
+    DB_PATH,
+    mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    cache_kib=int(os.getenv("SQLITE_CACHE_KIB", "8192")),
+    statement_cache=int(os.getenv("SQLITE_STATEMENT_CACHE", "256")),
+    wal=os.getenv("SQLITE_WAL", "true").lower() in {"1", "true", "yes", "on"},
+)
+
+
+# Redacts (text, content_type) bodies in order; see AIRedactor.redact_stream
+Redact = Callable[[Iterable[Tuple[str, str]]], Iterator[str]]
+
+
+ETAGS = ETagStore(DB_PATH, ETAG_CACHE_SIZE, ETAG_TTL)
+COMPRESSED = compression.CompressionCache(COMPRESSION_CACHE_SIZE)
+# (page, message, status) -> StaticPage, rendered on first use (url_for needs a request)
+STATIC_PAGES: Dict[Tuple[str, Optional[str], int], compression.StaticPage] = {}
 
 
 def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """A fresh read-write connection; the caller closes it."""
+    return DB.connect()
+
+
+def get_read_db() -> sqlite3.Connection:
+    """The calling thread's pooled read-only connection; never close it."""
+    return DB.read()
+
+
+def search_sql(q: str) -> Tuple[str, Tuple[Any, ...]]:
+    """SQL and parameters for a username-fragment search (shared by /search and /export)."""
+    if SEARCH_BACKEND == "fts" and DB.search_index_ready():
+        # Same LIKE semantics; fragments of 3+ chars are answered from the trigram index
+        if len(q) >= 3:
+            return (
+                f"SELECT {SEARCH_COLUMNS} FROM users WHERE id IN "
+                "(SELECT rowid FROM users_fts WHERE username LIKE ?) ORDER BY id;",
+                (f"%{q}%",),
+            )
+        return f"SELECT {SEARCH_COLUMNS} FROM users WHERE username LIKE ?;", (f"%{q}%",)
+    return f"SELECT {SEARCH_COLUMNS} FROM users WHERE username LIKE '%{q}%';", ()
 
 
 def init_db(seed: bool = True) -> None:
@@ -112,35 +211,163 @@ if not JWT_SECRET:
         "JWT_SECRET not set; generated ephemeral secret. Sessions will reset on restart. Configure JWT_SECRET env for persistence."
     )
 
-TEAM_TOKEN_MAP = load_team_tokens(TEAM_TOKENS_PATH)
-if not TEAM_TOKEN_MAP:
+TEAM_TOKENS = TeamTokenFile(TEAM_TOKENS_PATH, load_team_tokens, TEAM_TOKENS_RELOAD_SECONDS)
+if not TEAM_TOKENS.current()[0]:
     logger.warning("No team tokens loaded from %s", TEAM_TOKENS_PATH)
+SESSIONS = ClaimsCache(SESSION_CACHE_SIZE)
 
-UNPROTECTED_PREFIXES = ("/auth", "/health", "/hint", "/static")
+# /admin has its own token check (ADMIN_TOKEN)
+UNPROTECTED_PREFIXES = ("/auth", "/health", "/hint", "/static", "/metrics", "/admin")
 REDACTED_PREFIXES = ("/users", "/search", "/export")
-RATE_LIMIT_STATE: Dict[str, Dict[str, Any]] = {}
-RATE_LIMIT_LOCK = Lock()
-REDIS_URL = os.getenv("REDIS_URL")
+# Upstream priority class per redacted prefix (see scheduler.py)
+REDACTION_PRIORITIES = {"/users": scheduler.INTERACTIVE, "/search": scheduler.BULK, "/export": scheduler.BULK}
+SCHED_LARGE_BODY = int(os.getenv("AI_FILTER_SCHED_LARGE_BODY", "16384"))
+SCHED_HEAVY_TEAM_TOKENS = int(os.getenv("AI_FILTER_SCHED_HEAVY_TEAM_TOKENS", "0"))
+# In-memory fallback when Redis is unavailable; teams are striped over lock shards
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+MEMORY_RATE_LIMITER = MemoryRateLimiter(
+    RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW_SECONDS, RATE_LIMIT_MIN_INTERVAL,
+    RATE_LIMIT_SHARDS, RATE_LIMIT_SWEEP_SECONDS,
+)
 REDIS_PREFIX = os.getenv("REDIS_PREFIX", "aifraud")
-_REDIS_CLIENT = None
 
 
 def get_redis_client():
-    global _REDIS_CLIENT
-    if _REDIS_CLIENT is not None:
-        return _REDIS_CLIENT
-    if not REDIS_URL or redis is None:
-        return None
+    # Shared with the AI cache; None means in-memory rate limiting
+    return redis_pool.get_redis()
+
+
+TOKEN_ACCOUNTANT = TokenAccountant(get_redis_client, REDIS_PREFIX, TOKEN_BUDGET_WINDOW_SECONDS)
+INFLIGHT_LIMITER = InflightLimiter(REDIS_PREFIX, TEAM_MAX_INFLIGHT, TEAM_INFLIGHT_TTL)
+if INFLIGHT_LIMITER.enabled and not redis_pool.REDIS_URL:
+    logger.warning("TEAM_MAX_INFLIGHT=%d without REDIS_URL is enforced per worker process, not per team",
+                   TEAM_MAX_INFLIGHT)
+REDIS_RATE_LIMITER = RedisRateLimiter(
+    get_redis_client, REDIS_PREFIX, RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW_SECONDS,
+    RATE_LIMIT_MIN_INTERVAL, RATE_LIMIT_LEASE_SIZE,
+)
+
+
+def account_tokens(usage: TokenUsage, team_token: Optional[str] = None, team_label: Optional[str] = None) -> None:
+    """Charge ``usage`` to a team (the current request's unless given)."""
+    if team_token is None:
+        team_token = g.get("team_token")
+    if not team_token or usage.total <= 0:
+        return
+    if team_label is None:
+        team_label = g.get("team_abbr") or "unknown"
+    metrics.AI_TOKENS.labels(team_label, "prompt").inc(usage.prompt_tokens)
+    metrics.AI_TOKENS.labels(team_label, "completion").inc(usage.completion_tokens)
     try:
-        _REDIS_CLIENT = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-        # Test connection
-        _REDIS_CLIENT.ping()
-        logger.info("Connected Redis for rate limiting at %s", REDIS_URL)
-        return _REDIS_CLIENT
+        used = TOKEN_ACCOUNTANT.record(team_token, usage.total)
     except Exception:
-        logger.exception("Redis unavailable; falling back to in-memory rate limiting")
-        _REDIS_CLIENT = None
-        return None
+        logger.exception("Token accounting failed for team %s", team_label)
+        return
+    logger.info(
+        "TOKENS team=%s prompt=%d completion=%d%s window_used=%d",
+        team_label,
+        usage.prompt_tokens,
+        usage.completion_tokens,
+        " (estimated)" if usage.estimated else "",
+        used,
+    )
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+# Registered before ai_redact_response so it runs after it (Flask runs
+# after_request hooks in reverse order) and the latency includes redaction.
+@app.after_request
+def record_request_metrics(response: Response):
+    started = g.get("request_started")
+    if started is not None:
+        metrics.REQUEST_SECONDS.labels(
+            request.method, request.url_rule.rule if request.url_rule else "unmatched", str(response.status_code)
+        ).observe(time.perf_counter() - started)
+    return response
+
+
+# Registered between record_request_metrics and add_resource_etag, so it
+# compresses the redacted body after it has been tagged.
+@app.after_request
+def compress_response(response: Response):
+    """gzip/br-encode redacted bodies; the compressed bytes are cached by body digest."""
+    if (
+        not COMPRESSION_ENABLED
+        or response.status_code != 200
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or (response.mimetype or "").lower() not in COMPRESSIBLE_TYPES
+        or carries_client_input()
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = compression.negotiate(request)
+    if encoding is None:
+        return response
+    response.set_data(COMPRESSED.compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    tag, weak = response.get_etag()
+    if tag:
+        response.set_etag(compression.variant_tag(tag, encoding), weak)
+        return response.make_conditional(request)
+    return response
+
+
+def carries_client_input() -> bool:
+    """Whether the request has a query string or body a response could reflect.
+
+    Compressing attacker-chosen text next to secrets leaks them through the
+    compressed length (BREACH), so such responses go out uncompressed.
+    """
+    if request.query_string or request.content_length:
+        return True
+    return "chunked" in request.headers.get("Transfer-Encoding", "").lower()
+
+
+# Registered between compress_response and ai_redact_response, so it runs
+# between them too: it hashes the redacted body, and a 304 it returns is what
+# the request metrics record.
+@app.after_request
+def add_resource_etag(response: Response):
+    """Tag views that opted in (g.etag_resource) and answer If-None-Match."""
+    resource = g.get("etag_resource")
+    if resource is None or response.status_code != 200 or response.is_streamed:
+        return response
+    tag = ETAGS.compute(response.get_data())
+    ETAGS.remember(resource, g.etag_fingerprint, tag, g.etag_version)
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+def not_modified(tag: str) -> Response:
+    response = Response(status=304)
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def redaction_priority(path: str, body_len: int) -> int:
+    """Priority class from the path prefix, demoted for large bodies and heavy teams."""
+    priority = next((p for prefix, p in REDACTION_PRIORITIES.items() if path.startswith(prefix)), scheduler.BULK)
+    if body_len > SCHED_LARGE_BODY:
+        priority += 1
+    team_token = g.get("team_token")
+    if SCHED_HEAVY_TEAM_TOKENS > 0 and team_token:
+        try:
+            if TOKEN_ACCOUNTANT.used(team_token) >= SCHED_HEAVY_TEAM_TOKENS:
+                priority += 1
+        except Exception:
+            pass
+    return min(priority, scheduler.BACKGROUND)
 
 
 @app.after_request
@@ -154,6 +381,9 @@ def ai_redact_response(response: Response):
     # (e.g., 401/403/429 should short-circuit without invoking the AI filter).
     if response.status_code != 200:
         return response
+    # Streamed bodies (stream_search) are redacted batch by batch as they are sent
+    if g.get("body_redacted"):
+        return response
     # Skip healthz, auth, static, and non-protected paths
     if (
         path.startswith("/health")
@@ -168,29 +398,135 @@ def ai_redact_response(response: Response):
         try:
             # Read as text, send to AI, then set back
             body = response.get_data(as_text=True)
-            redacted = redactor.redact_text(body, content_type=content_type)
+            usage = TokenUsage()
+            redactor = get_redactor()
+            priority = redaction_priority(path, len(body)) if redactor.scheduler.enabled else scheduler.BULK
+            try:
+                redacted = redactor.redact_text(
+                    body, content_type=content_type, usage=usage, team=g.get("team_abbr") or "", priority=priority
+                )
+            finally:
+                account_tokens(usage)
             response.set_data(redacted)
         except Exception:
             app.logger.exception("AI redaction failed for %s", path)
-            if content_type == "application/json":
-                failure_body = json.dumps({"error": "ai_redaction_failed"})
-                return Response(failure_body, status=503, mimetype="application/json")
-            failure_body = "AI redaction failed"
-            failure_type = content_type if content_type in {"text/plain", "text/html"} else "text/plain"
-            return Response(failure_body, status=503, mimetype=failure_type)
+            metrics.FAIL_CLOSED.labels(content_type).inc()
+            return redaction_failed_response(content_type)
     return response
 
 
+def redaction_failed_response(content_type: str) -> Response:
+    if content_type == "application/json":
+        failure_body = json.dumps({"error": "ai_redaction_failed"})
+        return Response(failure_body, status=503, mimetype="application/json")
+    failure_body = "AI redaction failed"
+    failure_type = content_type if content_type in {"text/plain", "text/html"} else "text/plain"
+    return Response(failure_body, status=503, mimetype=failure_type)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    denied = _bearer_denied(METRICS_TOKEN)
+    if denied is not None:
+        return denied
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+def _bearer_denied(expected: Optional[str]) -> Optional[Response]:
+    """404 while ``expected`` is unset, 401 unless the request carries it as its bearer token."""
+    if not expected:
+        return jsonify({"error": "not found"}), 404
+    auth_header = request.headers.get("Authorization", "")
+    supplied = auth_header.split(" ", 1)[1].strip() if auth_header.lower().startswith("bearer ") else ""
+    # Bytes: compare_digest rejects non-ASCII str with a TypeError
+    if not secrets.compare_digest(supplied.encode(), expected.encode()):
+        return jsonify({"error": "unauthorized"}), 401
+    return None
+
+
+def _admin_denied() -> Optional[Response]:
+    return _bearer_denied(ADMIN_TOKEN)
+
+
+@app.get("/admin/cache")
+def admin_cache_stats():
+    """Size, bytes, hit ratio and top keys per cache tier."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    top = request.args.get("top", "10")
+    return jsonify(get_redactor().cache_stats(top=max(0, int(top)) if top.isdigit() else 10))
+
+
+@app.post("/admin/cache/purge")
+def admin_cache_purge():
+    """Purge by content type and/or age (seconds); no filters purges everything."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    body = request.get_json(silent=True) or {}
+    older_than = body.get("older_than")
+    if older_than is not None and (isinstance(older_than, bool) or not isinstance(older_than, (int, float))):
+        return jsonify({"error": "older_than must be a number of seconds"}), 400
+    removed = get_redactor().purge_cache(content_type=body.get("content_type") or None, older_than=older_than)
+    logger.info("ADMIN cache purge content_type=%s older_than=%s removed=%s",
+                body.get("content_type"), older_than, removed)
+    return jsonify({"status": "ok", "removed": removed})
+
+
+@app.post("/admin/cache/warm")
+def admin_cache_warm():
+    """Queue /users/<id> warm-ups (see prefetch_user): explicit ``user_ids`` or the first ``limit`` users."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    body = request.get_json(silent=True) or {}
+    limit = body.get("limit", 100)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+        return jsonify({"error": "limit must be a non-negative integer"}), 400
+    ids = body.get("user_ids")
+    if ids is None:
+        ids = [r[0] for r in get_read_db().execute("SELECT id FROM users ORDER BY id LIMIT ?", (limit,))]
+    elif not isinstance(ids, list):
+        return jsonify({"error": "user_ids must be a list"}), 400
+    # Charged to no team; runs at background priority like search prefetch
+    queued = PREFETCHER.submit(ids, "", "admin", limit=limit)
+    return jsonify({"status": "ok", "queued": queued})
+
+
+@app.route("/admin/cache/settings", methods=["GET", "PUT"])
+def admin_cache_settings():
+    """Live TTL, eviction policy (lru|lfu|fifo) and in-process size, for all workers."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    redactor = get_redactor()
+    if request.method == "GET":
+        return jsonify(redactor.cache_control.read().get("settings", {}))
+    body = request.get_json(silent=True) or {}
+    ttl, policy, size = body.get("ttl"), body.get("policy"), body.get("size")
+    if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0):
+        return jsonify({"error": "ttl must be a positive number of seconds"}), 400
+    if policy is not None and policy not in EVICTION_POLICIES:
+        return jsonify({"error": f"policy must be one of {', '.join(EVICTION_POLICIES)}"}), 400
+    if size is not None and (isinstance(size, bool) or not isinstance(size, int) or size < 1):
+        return jsonify({"error": "size must be a positive integer"}), 400
+    settings = redactor.update_cache_settings(ttl=ttl, policy=policy, size=size)
+    logger.info("ADMIN cache settings updated: %s", settings)
+    return jsonify({"status": "ok", "settings": settings})
+
+
 @app.get("/hint")
 def hint():
     """Return only the system prompt as plain text."""
     try:
-        sp = getattr(redactor, "system_prompt", "") or ""
+        sp = getattr(get_redactor(), "system_prompt", "") or ""
         return Response(sp, mimetype="text/plain")
     except Exception:
         logger.exception("Failed to render /hint")
@@ -220,7 +556,7 @@ def authenticate_team():
             return render_auth_page("Vui lòng nhập team token.", status_code=400)
         return jsonify({"error": "missing_token"}), 400
 
-    team_entry = TEAM_TOKEN_MAP.get(token_value)
+    team_entry = TEAM_TOKENS.current()[0].get(token_value)
     if not team_entry:
         if is_form_post:
             return render_auth_page("Token không hợp lệ.", status_code=401)
@@ -281,23 +617,47 @@ def require_authentication():
     if not token:
         return make_unauthorized_response("missing_jwt")
 
-    try:
-        claims = decode_session_jwt(token)
-    except jwt.ExpiredSignatureError:
-        return make_unauthorized_response("token_expired")
-    except jwt.InvalidIssuerError:
-        return make_unauthorized_response("invalid_token")
-    except jwt.InvalidTokenError:
-        return make_unauthorized_response("invalid_token")
-
-    team_token = claims.get("sub")
-    if not team_token or team_token not in TEAM_TOKEN_MAP:
-        return make_unauthorized_response("unknown_team")
+    team_tokens, generation = TEAM_TOKENS.current()
+    digest = ClaimsCache.digest(token)
+    cached = SESSIONS.get(digest, generation)
+    if cached is not None:
+        claims, team_entry = cached
+    else:
+        try:
+            claims = decode_session_jwt(token)
+        except jwt.ExpiredSignatureError:
+            return make_unauthorized_response("token_expired")
+        except jwt.InvalidIssuerError:
+            return make_unauthorized_response("invalid_token")
+        except jwt.InvalidTokenError:
+            return make_unauthorized_response("invalid_token")
+
+        team_entry = team_tokens.get(claims.get("sub") or "")
+        if not team_entry:
+            return make_unauthorized_response("unknown_team")
+        SESSIONS.put(digest, generation, claims, team_entry)
+
+    team_token = claims["sub"]
+    g.team_token = team_token
+    # Label by abbreviation; team tokens are credentials
+    g.team_abbr = team_entry.get("abbr") or "unknown"
+
+    # Before the rate limit, so a request turned away here does not use up the team's quota
+    inflight_error = enforce_inflight_limit(team_token)
+    if inflight_error is not None:
+        metrics.INFLIGHT_REJECTED.labels(g.team_abbr).inc()
+        return inflight_error
 
     rate_limit_error = enforce_rate_limit(team_token)
     if rate_limit_error is not None:
+        metrics.RATE_LIMITED.labels(g.team_abbr).inc()
         return rate_limit_error
 
+    token_budget_error = enforce_token_budget(team_token)
+    if token_budget_error is not None:
+        metrics.TOKEN_THROTTLED.labels(g.team_abbr).inc()
+        return token_budget_error
+
     return None
 
 
@@ -310,7 +670,21 @@ def row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
     return {k: row[k] for k in row.keys()}
 
 
+def static_page(name: str, render: Callable[[], str], message: Optional[str] = None,
+                status_code: int = 200) -> Response:
+    """Serve a page without per-request data from its precompressed copy."""
+    key = (name, message, status_code)
+    page = STATIC_PAGES.get(key)
+    if page is None:
+        page = STATIC_PAGES[key] = compression.StaticPage(render(), status=status_code)
+    return page.response(request, compress=COMPRESSION_ENABLED)
+
+
 def render_auth_page(message: Optional[str] = None, status_code: int = 200) -> Response:
+    return static_page("auth", lambda: auth_page_html(message), message, status_code)
+
+
+def auth_page_html(message: Optional[str]) -> str:
     message_text = message or ""
     stylesheet = url_for("static", filename="css/style.css")
     html = f"""
@@ -343,10 +717,14 @@ def render_auth_page(message: Optional[str] = None, status_code: int = 200) -> R
   </body>
 </html>
 """
-    return Response(html, mimetype="text/html", status=status_code)
+    return html
 
 
 def render_index_page() -> Response:
+    return static_page("index", index_page_html)
+
+
+def index_page_html() -> str:
     stylesheet = url_for("static", filename="css/style.css")
     html = f"""
 <!doctype html>
@@ -391,7 +769,7 @@ def render_index_page() -> Response:
   </body>
 </html>
 """
-    return Response(html, mimetype="text/html")
+    return html
 
 
 def extract_session_token() -> Optional[str]:
@@ -454,170 +832,383 @@ def rate_limit_response(error_code: str, retry_after_seconds: float) -> Response
     return resp
 
 
+def inflight_limit_response() -> Response:
+    retry_after_seconds = max(0.0, TEAM_INFLIGHT_RETRY_AFTER)
+    payload = {
+        "error": "too_many_concurrent_requests",
+        "retry_after": round(retry_after_seconds, 2),
+        "max_inflight": INFLIGHT_LIMITER.max_inflight,
+    }
+    resp = jsonify(payload)
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(0, int(math.ceil(retry_after_seconds))))
+    return resp
+
+
+def enforce_inflight_limit(team_token: str) -> Optional[Response]:
+    if not INFLIGHT_LIMITER.enabled:
+        return None
+    try:
+        admitted, ticket = INFLIGHT_LIMITER.acquire(get_redis_client(), team_token, time.time())
+    except Exception:
+        logger.exception("Redis error during in-flight limit; allowing request")
+        return None
+    if not admitted:
+        logger.info("In-flight limit reached for team %s: %d concurrent requests",
+                    team_token, INFLIGHT_LIMITER.max_inflight)
+        return inflight_limit_response()
+    g.inflight_ticket = ticket
+    return None
+
+
+@app.teardown_request
+def release_inflight_slot(exc: Optional[BaseException] = None) -> None:
+    # For streamed responses this runs once the stream has been sent
+    ticket = g.pop("inflight_ticket", None)
+    if ticket is not None:
+        INFLIGHT_LIMITER.release(ticket)
+
+
 def enforce_rate_limit(team_token: str) -> Optional[Response]:
     now = time.time()
     r = get_redis_client()
     if r is None:
         # Fallback to in-memory
-        with RATE_LIMIT_LOCK:
-            state = RATE_LIMIT_STATE.get(team_token)
-            if not state or now - state.get("window_start", 0) >= RATE_LIMIT_WINDOW_SECONDS:
-                state = {
-                    "window_start": now,
-                    "count": 0,
-                    "last_request": None,
-                }
-                RATE_LIMIT_STATE[team_token] = state
-
-            if state["count"] >= RATE_LIMIT_MAX_REQUESTS:
-                reset_at = state["window_start"] + RATE_LIMIT_WINDOW_SECONDS
-                retry_after = max(0.0, reset_at - now)
+        allowed, retry_after, count = MEMORY_RATE_LIMITER.check(team_token, now)
+        if not allowed:
+            if count >= RATE_LIMIT_MAX_REQUESTS:
                 logger.info(
                     "Rate limit reached for team %s: %s requests/%ss", team_token, RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW_SECONDS
                 )
-                return rate_limit_response("too_many_requests", retry_after)
-
-            last_request = state.get("last_request")
-            if last_request is not None:
-                since_last = now - last_request
-                if since_last < RATE_LIMIT_MIN_INTERVAL:
-                    retry_after = RATE_LIMIT_MIN_INTERVAL - since_last
-                    logger.debug(
-                        "Rate limit spacing hit for team %s: last %.2fs ago (min %.2fs)",
-                        team_token,
-                        since_last,
-                        RATE_LIMIT_MIN_INTERVAL,
-                    )
-                    return rate_limit_response("too_many_requests", retry_after)
-
-            state["count"] += 1
-            state["last_request"] = now
-            remaining = max(0, RATE_LIMIT_MAX_REQUESTS - state["count"])
+            else:
+                logger.debug("Rate limit spacing hit for team %s (min %.2fs)", team_token, RATE_LIMIT_MIN_INTERVAL)
+            return rate_limit_response("too_many_requests", retry_after)
 
         logger.info(
-            "RL team=%s count=%d/%d remaining=%d spacing=%.1fs window_started=%d",
+            "RL team=%s count=%d/%d remaining=%d spacing=%.1fs window=%d",
             team_token,
-            state["count"],
+            count,
             RATE_LIMIT_MAX_REQUESTS,
-            remaining,
+            max(0, RATE_LIMIT_MAX_REQUESTS - count),
             RATE_LIMIT_MIN_INTERVAL,
-            int(state["window_start"]),
+            int(now // RATE_LIMIT_WINDOW_SECONDS),
         )
         return None
 
-    # Redis-backed rate limiting (fixed window + min spacing)
-    window_id = int(now // RATE_LIMIT_WINDOW_SECONDS)
-    k_count = f"{REDIS_PREFIX}:rl:{team_token}:w:{window_id}"
-    k_last = f"{REDIS_PREFIX}:rl:{team_token}:last"
-
-    # Enforce minimum spacing first
+    # Redis-backed rate limiting (fixed window + min spacing), one atomic script call
     try:
-        last_ts_raw = r.get(k_last)
-        if last_ts_raw is not None:
-            try:
-                last_ts = float(last_ts_raw)
-            except ValueError:
-                last_ts = None
-            if last_ts is not None:
-                since_last = now - last_ts
-                if since_last < RATE_LIMIT_MIN_INTERVAL:
-                    retry_after = RATE_LIMIT_MIN_INTERVAL - since_last
-                    return rate_limit_response("too_many_requests", retry_after)
+        allowed, retry_after, count = REDIS_RATE_LIMITER.check(r, team_token, now)
     except Exception:
-        # If Redis read fails, fall back to allowing spacing and continue
-        pass
-
-    # Count within fixed window
-    try:
-        count = r.incr(k_count)
-        if count == 1:
-            # Set expiry slightly longer than window to cover clock skew
-            r.expire(k_count, int(RATE_LIMIT_WINDOW_SECONDS) + 2)
-        if count > RATE_LIMIT_MAX_REQUESTS:
-            reset_at = (window_id + 1) * RATE_LIMIT_WINDOW_SECONDS
-            retry_after = max(0.0, reset_at - now)
+        logger.exception("Redis error during rate limit; allowing request")
+        return None
+    if not allowed:
+        if count >= RATE_LIMIT_MAX_REQUESTS:
             logger.info(
                 "[Redis] Rate limit reached team=%s count=%s/%s", team_token, count, RATE_LIMIT_MAX_REQUESTS
             )
-            return rate_limit_response("too_many_requests", retry_after)
-        # Update last request timestamp
-        try:
-            r.set(k_last, str(now), ex=max(int(RATE_LIMIT_WINDOW_SECONDS), int(RATE_LIMIT_MIN_INTERVAL) + 1))
-        except Exception:
-            pass
-    except Exception:
-        logger.exception("Redis error during rate limit; allowing request")
-        return None
+        return rate_limit_response("too_many_requests", retry_after)
 
-    remaining = max(0, RATE_LIMIT_MAX_REQUESTS - int(count))
+    remaining = max(0, RATE_LIMIT_MAX_REQUESTS - count)
     logger.info("RL[redis] team=%s count=%d/%d remaining=%d spacing=%.1fs window=%d",
-                team_token, int(count), RATE_LIMIT_MAX_REQUESTS, remaining, RATE_LIMIT_MIN_INTERVAL, window_id)
+                team_token, count, RATE_LIMIT_MAX_REQUESTS, remaining, RATE_LIMIT_MIN_INTERVAL,
+                int(now // RATE_LIMIT_WINDOW_SECONDS))
     return None
 
 
+def enforce_token_budget(team_token: str) -> Optional[Response]:
+    """Throttle teams by model tokens spent this window, not request count."""
+    if TOKEN_BUDGET_PER_WINDOW <= 0:
+        return None
+    now = time.time()
+    try:
+        used = TOKEN_ACCOUNTANT.used(team_token, now)
+    except Exception:
+        logger.exception("Token accounting unavailable; allowing request")
+        return None
+    if used < TOKEN_BUDGET_PER_WINDOW:
+        return None
+    retry_after = max(0.0, TOKEN_ACCOUNTANT.retry_after(now))
+    logger.info("Token budget reached for team %s: %d/%d tokens", g.get("team_abbr"), used, TOKEN_BUDGET_PER_WINDOW)
+    payload = {
+        "error": "token_budget_exceeded",
+        "retry_after": round(retry_after, 2),
+        "token_budget": TOKEN_BUDGET_PER_WINDOW,
+        "tokens_used": used,
+        "window_seconds": TOKEN_BUDGET_WINDOW_SECONDS,
+    }
+    resp = jsonify(payload)
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(0, int(math.ceil(retry_after))))
+    return resp
+
+
+def fetch_user(user_id: int) -> Optional[sqlite3.Row]:
+    return get_read_db().execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
 @app.get("/users/<int:user_id>")
 def get_user(user_id: int):
     """Return a user record by numeric ID."""
-    conn = get_db()
-    cur = conn.cursor()
-    row = cur.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    if ETAGS_ENABLED:
+        resource = f"/users/{user_id}"
+        fingerprint = get_redactor().fingerprint
+        # Taken before the read, so a write racing it can only invalidate the tag
+        version = ETAGS.db_version()
+        tag = ETAGS.lookup(resource, fingerprint, version)
+        matched = compression.matching_tag(request, tag) if tag else None
+        if matched:
+            return not_modified(matched)
+        g.etag_resource, g.etag_fingerprint, g.etag_version = resource, fingerprint, version
+    if MATERIALIZE_USERS and USERS_MATERIALIZER.ready():
+        body = USERS_MATERIALIZER.fresh_body(user_id)
+        if body is not None:
+            g.body_redacted = True
+            return Response(body, mimetype="application/json")
+    row = fetch_user(user_id)
     if not row:
         return jsonify({"error": "not found"}), 404
+    if ROW_CACHE_ENABLED:
+        return row_cache_response(user_row_parts(row))
     return jsonify(row_to_dict(row))
 
 
+def user_row_parts(row: sqlite3.Row) -> List[Dict[str, Any]]:
+    """A user split into the rows get_user redacts through the row-level cache."""
+    user = row_to_dict(row)
+    # /search selects a subset of the columns; caching that part as a row
+    # of its own lets both endpoints share it
+    shared = {k: v for k, v in user.items() if k in SEARCH_COLUMN_NAMES}
+    rest = {k: v for k, v in user.items() if k not in shared}
+    return [part for part in (shared, rest) if part]
+
+
+def row_cache_response(rows: List[Dict[str, Any]], envelope: Optional[Dict[str, Any]] = None,
+                       field: str = "results") -> Response:
+    """Redact ``rows`` through the row-level cache and return them as JSON.
+
+    With an ``envelope`` the rows go under ``field`` and the rest of the
+    envelope is redacted as a body of its own (as /search returns it);
+    without one the rows are parts of a single object and are merged (as
+    /users/<id> returns it). Only rows missing from the cache reach the model.
+    """
+    redactor = get_redactor()
+    usage = TokenUsage()
+    team = g.get("team_abbr") or ""
+    priority = redaction_priority(request.path, 0) if redactor.scheduler.enabled else scheduler.BULK
+    try:
+        redacted = redactor.redact_rows(rows, usage, team=team, priority=priority)
+        if envelope is None:
+            payload: Dict[str, Any] = {k: v for part in redacted for k, v in part.items()}
+        else:
+            outer = json.dumps(dict(envelope, **{field: []}), ensure_ascii=False, separators=(",", ":"))
+            payload = chunking.load_envelope(
+                redactor.redact_text(outer, content_type="application/json", usage=usage, team=team,
+                                     priority=priority),
+                field,
+            )
+            payload[field] = redacted
+    except Exception:
+        app.logger.exception("AI redaction failed for %s", request.path)
+        metrics.FAIL_CLOSED.labels("application/json").inc()
+        return redaction_failed_response("application/json")
+    finally:
+        account_tokens(usage)
+    g.body_redacted = True
+    return jsonify(payload)
+
+
+def render_user(row: sqlite3.Row) -> str:
+    """The unredacted /users/<id> body, exactly as get_user renders it (cache keys depend on it)."""
+    with app.app_context():
+        return jsonify(row_to_dict(row)).get_data(as_text=True)
+
+
+def prefetch_user(user_id: int, team_token: str, team_abbr: str) -> None:
+    """Redact /users/<id> ahead of the request so it is a cache hit.
+
+    Warms the cache get_user will read: nothing while users_redacted holds a
+    fresh body, the row-level cache with AI_FILTER_ROW_CACHE, the body cache
+    otherwise (rendered exactly as get_user renders it, so the key matches).
+    Tokens are charged to the team whose search triggered it.
+    """
+    if TOKEN_BUDGET_PER_WINDOW > 0 and team_token and TOKEN_ACCOUNTANT.used(team_token) >= TOKEN_BUDGET_PER_WINDOW:
+        metrics.PREFETCH.labels("skipped").inc()
+        return
+    if MATERIALIZE_USERS and USERS_MATERIALIZER.ready() and USERS_MATERIALIZER.is_fresh(user_id):
+        metrics.PREFETCH.labels("skipped").inc()
+        return
+    row = fetch_user(user_id)
+    if not row:
+        return
+    usage = TokenUsage()
+    try:
+        if ROW_CACHE_ENABLED:
+            get_redactor().redact_rows(user_row_parts(row), usage, team=team_abbr, priority=scheduler.BACKGROUND)
+        else:
+            get_redactor().redact_text(
+                render_user(row), content_type="application/json", usage=usage, team=team_abbr,
+                priority=scheduler.BACKGROUND,
+            )
+    finally:
+        account_tokens(usage, team_token, team_abbr)
+
+
+PREFETCHER = Prefetcher(prefetch_user, PREFETCH_MAX_IDS, PREFETCH_QUEUE_SIZE, PREFETCH_WORKERS)
+USERS_MATERIALIZER = Materializer(
+    DB,
+    render_user,
+    lambda body: get_redactor().redact_text(body, content_type="application/json", priority=scheduler.BACKGROUND),
+    lambda: get_redactor().fingerprint,
+    MATERIALIZE_INTERVAL,
+    MATERIALIZE_BATCH,
+)
+
+
 @app.get("/search")
 def search():
     """Search users by username fragment and return matching records."""
     q = request.args.get("q", "")
-    conn = get_db()
-    cur = conn.cursor()
-    sql = (
-        "SELECT id, username, email, phone, address, dob, ssn, "
-        "credit_card_number, credit_card_cvv, credit_card_exp, api_token, secret_key "
-        f"FROM users WHERE username LIKE '%{q}%';"
-    )
+    if SEARCH_STREAM:
+        return stream_search(q)
+    cur = get_read_db().cursor()
+    sql, params = search_sql(q)
     try:
-        rows = cur.execute(sql).fetchall()
+        rows = cur.execute(sql, params).fetchall()
         data = [row_to_dict(r) for r in rows]
-        return jsonify({"q": q, "results": data})
+        if ROW_CACHE_ENABLED:
+            response = row_cache_response(data, {"q": q})
+        else:
+            response = jsonify({"q": q, "results": data})
+        team_token = g.get("team_token")
+        if PREFETCH_ENABLED and team_token and data and response.status_code == 200:
+            ids = [r.get("id") for r in data]
+            team_abbr = g.get("team_abbr") or ""
+            # Runs once the response has been sent
+            response.call_on_close(lambda: PREFETCHER.submit(ids, team_token, team_abbr))
+        return response
     except Exception:
         app.logger.exception("Search query failed for %r", q)
         return jsonify({"q": q, "error": "query_failed"}), 400
     finally:
-        conn.close()
+        cur.close()
+
+
+def stream_redacted(q: str, content_type: str, batch_rows: int,
+                    frame: Callable[[Iterator[List[sqlite3.Row]], Redact], Iterator[str]],
+                    query_failed: Callable[[], Response]) -> Response:
+    """Run the search for ``q`` and stream ``frame``'s output, redacted batch by batch.
+
+    Rows are pulled from the cursor ``batch_rows`` at a time; ``frame`` turns
+    them into bodies for the redactor (each cached on its own, several in
+    flight while the next rows are read) and formats what comes back, so
+    memory and time to first byte stay flat however many rows match. The
+    first chunk is produced before anything is sent, so an early failure is
+    still a 503; a later one aborts the connection rather than send anything
+    unredacted.
+    """
+    cur = get_read_db().cursor()
+    sql, params = search_sql(q)
+    try:
+        cur.execute(sql, params)
+    except Exception:
+        cur.close()
+        app.logger.exception("Search query failed for %r", q)
+        return query_failed()
+
+    redactor = get_redactor()
+    usage = TokenUsage()
+    team_token = g.get("team_token")
+    team_abbr = g.get("team_abbr") or ""
+    priority = redaction_priority(request.path, 0) if redactor.scheduler.enabled else scheduler.BULK
 
+    def batches() -> Iterator[List[sqlite3.Row]]:
+        while True:
+            rows = cur.fetchmany(batch_rows)
+            if not rows:
+                return
+            yield rows
 
-# @app.get("/export")
+    parts = frame(batches(), lambda bodies: redactor.redact_stream(bodies, usage, team=team_abbr, priority=priority))
+
+    def finish() -> None:
+        parts.close()
+        cur.close()
+        account_tokens(usage, team_token, team_abbr)
+
+    try:
+        head = next(parts, "")
+    except sqlite3.Error:
+        finish()
+        app.logger.exception("Search query failed for %r", q)
+        return query_failed()
+    except Exception:
+        finish()
+        app.logger.exception("AI redaction failed for %s", request.path)
+        metrics.FAIL_CLOSED.labels(content_type).inc()
+        return redaction_failed_response(content_type)
+
+    def generate() -> Iterator[str]:
+        try:
+            yield head
+            yield from parts
+        except Exception:
+            app.logger.exception("Streaming %s failed for %r; aborting the response", request.path, q)
+            metrics.FAIL_CLOSED.labels(content_type).inc()
+            raise
+        finally:
+            finish()
+
+    g.body_redacted = True
+    return Response(stream_with_context(generate()), mimetype=content_type)
+
+
+def stream_search(q: str) -> Response:
+    """/search streamed as ``{"q": ..., "results": [...]}`` (SEARCH_STREAM)."""
+    team_token = g.get("team_token")
+    team_abbr = g.get("team_abbr") or ""
+
+    def frame(batches: Iterator[List[sqlite3.Row]], redact: Redact) -> Iterator[str]:
+        ids: List[Any] = []
+
+        def dicts() -> Iterator[List[Dict[str, Any]]]:
+            for rows in batches:
+                batch = [row_to_dict(r) for r in rows]
+                if PREFETCH_ENABLED and len(ids) < PREFETCH_MAX_IDS:
+                    ids.extend(r.get("id") for r in batch[:PREFETCH_MAX_IDS - len(ids)])
+                yield batch
+
+        yield from chunking.stream_json({"q": q}, "results", dicts(), redact)
+        if ids and team_token:
+            PREFETCHER.submit(ids, team_token, team_abbr)
+
+    return stream_redacted(
+        q, "application/json", SEARCH_STREAM_BATCH_ROWS, frame,
+        lambda: make_response(jsonify({"q": q, "error": "query_failed"}), 400),
+    )
+
+
+EXPORT_COLUMNS = [
+    "id", "username", "email", "phone", "address", "dob", "ssn",
+    "credit_card_number", "credit_card_cvv", "credit_card_exp", "api_token", "secret_key",
+]
+
+
+@app.get("/export")
 def export_csv():
-    """Return search results in CSV format."""
+    """Stream search results as CSV, redacted EXPORT_BATCH_ROWS rows at a time."""
+    if not EXPORT_ENABLED:
+        return jsonify({"error": "not found"}), 404
     q = request.args.get("q", "")
-    conn = get_db()
-    cur = conn.cursor()
-    sql = (
-        "SELECT id, username, email, phone, address, dob, ssn, "
-        "credit_card_number, credit_card_cvv, credit_card_exp, api_token, secret_key "
-        f"FROM users WHERE username LIKE '%{q}%';"
+
+    def frame(batches: Iterator[List[sqlite3.Row]], redact: Redact) -> Iterator[str]:
+        return chunking.stream_csv(EXPORT_COLUMNS, (
+            [["" if r[h] is None else r[h] for h in EXPORT_COLUMNS] for r in rows] for rows in batches
+        ), redact)
+
+    return stream_redacted(
+        q, "text/csv", EXPORT_BATCH_ROWS, frame,
+        lambda: Response("status,error\nmessage,query_failed\n", mimetype="text/csv", status=400),
     )
-    try:
-        rows = cur.execute(sql).fetchall()
-        # Minimal CSV without quoting to keep it simple for CTF
-        headers = [
-            "id","username","email","phone","address","dob","ssn",
-            "credit_card_number","credit_card_cvv","credit_card_exp","api_token","secret_key"
-        ]
-        lines = [",".join(headers)]
-        for r in rows:
-            vals = [str(r[h]) if r[h] is not None else "" for h in headers]
-            lines.append(",".join(v.replace("\n"," ").replace(",",";") for v in vals))
-        body = "\n".join(lines) + "\n"
-        return Response(body, mimetype="text/csv")
-    except Exception:
-        app.logger.exception("CSV export failed for %r", q)
-        return Response("status,error\nmessage,query_failed\n", mimetype="text/csv", status=400)
-    finally:
-        conn.close()
 
 
 @app.route("/flag", methods=["GET", "POST"])
@@ -658,11 +1249,7 @@ def flag_endpoint():
                 submitted.append(v.strip())
 
     # Fetch the 3 secret keys from DB (seeded users)
-    conn = get_db()
-    try:
-        rows = conn.execute("SELECT secret_key FROM users ORDER BY id ASC").fetchall()
-    finally:
-        conn.close()
+    rows = get_read_db().execute("SELECT secret_key FROM users ORDER BY id ASC").fetchall()
     db_keys = [r["secret_key"] for r in rows]
 
     if len(db_keys) != 3:
@@ -688,6 +1275,10 @@ def flag_endpoint():
 
 
 def render_flag_page(message: Optional[str] = None) -> Response:
+    return static_page("flag", lambda: flag_page_html(message), message)
+
+
+def flag_page_html(message: Optional[str]) -> str:
     stylesheet = url_for("static", filename="css/style.css")
     msg = message or ""
     html = f"""
@@ -724,7 +1315,7 @@ def render_flag_page(message: Optional[str] = None) -> Response:
   </body>
 </html>
 """
-    return Response(html, mimetype="text/html")
+    return html
 
 
 def render_flag_success_page(flag_value: str) -> Response:
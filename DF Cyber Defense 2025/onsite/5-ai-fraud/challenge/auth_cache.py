@@ -0,0 +1,104 @@
+"""Caches on the per-request authentication path.
+
+ClaimsCache maps the SHA-256 digest of a session JWT (never the token itself)
+to its verified claims and team entry, so a repeat request costs one hash and
+one dict lookup instead of an HMAC verification and claim checks. Entries
+expire at the token's ``exp`` and belong to one generation of the team token
+file: TeamTokenFile reloads the file when it changes and bumps the
+generation, which invalidates every cached session at once.
+"""
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+TeamMap = Dict[str, Dict[str, Any]]
+
+
+class TeamTokenFile:
+    """The team token map, reloaded when the file's mtime/size change.
+
+    The file is checked at most every ``reload_seconds`` (0 never reloads).
+    """
+
+    def __init__(self, path: Union[str, Path], load: Callable[[Path], TeamMap], reload_seconds: float = 5.0):
+        self.path = Path(path)
+        self.load = load
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._stamp = self._stat()
+        self._checked = time.monotonic()
+        # (tokens, generation), swapped as one object so readers never mix them
+        self._state: Tuple[TeamMap, int] = (load(self.path), 0)
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def current(self) -> Tuple[TeamMap, int]:
+        if self.reload_seconds > 0 and time.monotonic() - self._checked >= self.reload_seconds:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.reload_seconds:
+                    self._checked = time.monotonic()
+                    self._reload_if_changed()
+        return self._state
+
+    def _reload_if_changed(self) -> None:
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return
+        tokens, generation = self._state
+        fresh = self.load(self.path)
+        if not fresh and tokens:
+            # Most likely caught mid-write; keep serving the old map and retry
+            logger.warning("Team token file %s is empty or unreadable; keeping %d loaded tokens",
+                           self.path, len(tokens))
+            return
+        self._stamp = stamp
+        self._state = (fresh, generation + 1)
+        logger.info("Reloaded %d team tokens from %s", len(fresh), self.path)
+
+
+class ClaimsCache:
+    """Bounded LRU of verified JWT claims keyed by token digest; size 0 disables it."""
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self._items: "OrderedDict[bytes, Tuple[Dict[str, Any], Dict[str, Any], float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, digest: bytes, generation: int) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """(claims, team entry) for a token verified earlier, unless expired or from an older generation."""
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None:
+                return None
+            claims, entry, exp, item_generation = item
+            if item_generation != generation or time.time() >= exp:
+                del self._items[digest]
+                return None
+            self._items.move_to_end(digest)
+            return claims, entry
+
+    def put(self, digest: bytes, generation: int, claims: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        if self.size <= 0 or isinstance(exp, bool) or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._items[digest] = (claims, entry, float(exp), generation)
+            self._items.move_to_end(digest)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
@@ -0,0 +1,2 @@
+"""Offline performance harness. Run modules from the challenge directory, e.g.
+``python -m bench.redaction --help``."""
@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import random
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty sample."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def system_prompt_env(variant: str) -> Dict[str, Optional[str]]:
+    """Env selecting a production prompt variant or a bench-only candidate prompt."""
+    from ai_filter import CANDIDATE_SYSTEM_PROMPTS, SYSTEM_PROMPT_VARIANTS
+
+    if variant in SYSTEM_PROMPT_VARIANTS:
+        return {"AI_FILTER_PROMPT_VARIANT": variant, "AI_FILTER_SYSTEM_PROMPT": None}
+    if variant in CANDIDATE_SYSTEM_PROMPTS:
+        return {"AI_FILTER_PROMPT_VARIANT": "default", "AI_FILTER_SYSTEM_PROMPT": CANDIDATE_SYSTEM_PROMPTS[variant]()}
+    known = sorted(SYSTEM_PROMPT_VARIANTS) + sorted(CANDIDATE_SYSTEM_PROMPTS)
+    raise SystemExit(f"unknown prompt variant {variant!r} (known: {', '.join(known)})")
+
+
+@contextmanager
+def patched_env(overrides: Dict[str, Optional[str]]) -> Iterator[None]:
+    """Temporarily set (or, for None values, unset) environment variables."""
+    saved = {k: os.environ.get(k) for k in overrides}
+    try:
+        for key, value in overrides.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+_FIRST = ["nhan", "linh", "duc", "minh", "thao", "quang", "hoa", "tuan", "mai", "khanh"]
+_LAST = ["nguyen", "tran", "pham", "le", "hoang", "vu", "dang", "bui"]
+
+
+def fake_user(rng: random.Random, user_id: int) -> Dict[str, Any]:
+    """A row shaped like the ``users`` table seeded by init.sql."""
+    first, last = rng.choice(_FIRST), rng.choice(_LAST)
+    username = f"{first}.{last}{user_id}"
+    return {
+        "id": user_id,
+        "username": username,
+        "email": f"{username}@finova.one",
+        "phone": f"+84-9{rng.randint(0, 9)}-555-{rng.randint(0, 9999):04d}",
+        "address": f"{rng.randint(1, 999)} Đường Lê Lợi, Hồ Chí Minh",
+        "dob": f"19{rng.randint(60, 99)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "ssn": f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+        "credit_card_number": "4" + "".join(str(rng.randint(0, 9)) for _ in range(15)),
+        "credit_card_cvv": f"{rng.randint(0, 999):03d}",
+        "credit_card_exp": f"{rng.randint(1, 12):02d}/{rng.randint(25, 32)}",
+        "api_token": "tg_" + "".join(rng.choice("abcdefghijkLMNOPQRS0123456789") for _ in range(18)),
+        "secret_key": f"CBJS_SECRET_{first}_" + "".join(rng.choice("0123456789abcdef") for _ in range(16)),
+    }
+
+
+def search_body(rng: random.Random, target_bytes: int, q: str = "") -> str:
+    """A /search-style JSON body of roughly ``target_bytes``."""
+    results: List[Dict[str, Any]] = []
+    size = len(json.dumps({"q": q, "results": []}))
+    while size < target_bytes or not results:
+        row = fake_user(rng, rng.randint(1, 10_000_000))
+        results.append(row)
+        size += len(json.dumps(row)) + 2
+    return json.dumps({"q": q, "results": results})
+
+
+def write_json(path: str, data: Any) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+def compare_to_baseline(current: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                        keys: List[str], tolerance: float) -> List[str]:
+    """Return human-readable regressions of ``current`` vs ``baseline``.
+
+    Cases are matched on their ``case`` dict. Throughput-like metrics regress
+    when they drop, everything else when it grows, by more than ``tolerance``.
+    """
+    by_case = {json.dumps(r["case"], sort_keys=True): r for r in baseline}
+    problems: List[str] = []
+    for result in current:
+        ident = json.dumps(result["case"], sort_keys=True)
+        base = by_case.get(ident)
+        if base is None:
+            continue
+        for key in keys:
+            now, before = result.get(key), base.get(key)
+            if not isinstance(now, (int, float)) or not isinstance(before, (int, float)) or before == 0:
+                continue
+            change = (now - before) / before
+            higher_is_better = key.endswith("_per_s") or key == "throughput"
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                problems.append(f"{ident} {key}: {before} -> {now} ({change:+.1%})")
+    return problems
@@ -0,0 +1,179 @@
+"""Check system prompt variants against the expected outputs in the redaction corpus.
+
+Runs every case in ``bench/prompt_corpus.json`` through each prompt variant
+(``ai_filter.SYSTEM_PROMPT_VARIANTS`` or a bench-only candidate from
+``ai_filter.CANDIDATE_SYSTEM_PROMPTS`` such as ``compact``), bypassing the
+response cache, and reports, per variant, the system prompt
+size, prompt/completion tokens spent and any divergence from the expected output:
+
+* ``leak``: something the expected output masks survives (fails the check);
+* ``structure``: JSON keys/array lengths changed (fails the check);
+* ``over``: a value the expected output keeps was masked (reported only).
+
+The shipped expected outputs are seeded from ``redaction_rules``, not recorded
+from a model, so until the corpus is re-recorded the check compares a model
+against the regex policy rather than against known-good model behaviour. The
+corpus ``source`` field says which it is. Point it at a real model through
+``OPENROUTER_BASE_URL``/``OPENROUTER_API_KEY`` (``--mock`` only exercises the
+plumbing, as the mock ignores the prompt and answers with the rules). A
+candidate only becomes selectable in production once it passes against a
+recorded corpus::
+
+    python -m bench.prompt_check --variants default,compact --prompt-cache
+    python -m bench.prompt_check --record default   # record expected outputs from the model
+"""
+import argparse
+import difflib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.common import patched_env, system_prompt_env, write_json
+from mock_openrouter import MockServer
+from redaction_rules import MASK
+from token_accounting import TokenUsage, estimate_tokens
+
+
+CORPUS = os.path.join(os.path.dirname(__file__), "prompt_corpus.json")
+
+
+def _leaf_diffs(expected: Any, actual: Any, path: str, out: Dict[str, List[str]]) -> None:
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict) or set(expected) != set(actual):
+            out["structure"].append(path or "$")
+            return
+        for key in expected:
+            _leaf_diffs(expected[key], actual[key], f"{path}.{key}", out)
+    elif isinstance(expected, list):
+        if not isinstance(actual, list) or len(expected) != len(actual):
+            out["structure"].append(path or "$")
+            return
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            _leaf_diffs(e, a, f"{path}[{i}]", out)
+    else:
+        e_masked = MASK in str(expected)
+        a_masked = MASK in str(actual)
+        if e_masked and not a_masked:
+            out["leak"].append(path or "$")
+        elif a_masked and not e_masked:
+            out["over"].append(path or "$")
+
+
+def _removed_spans(original: str, redacted: str) -> List[str]:
+    matcher = difflib.SequenceMatcher(None, original, redacted, autojunk=False)
+    return [original[i1:i2] for op, i1, i2, _, _ in matcher.get_opcodes()
+            if op in {"replace", "delete"} and len(original[i1:i2].strip()) >= 3]
+
+
+def compare(case: Dict[str, Any], output: str) -> Dict[str, List[str]]:
+    diffs: Dict[str, List[str]] = {"leak": [], "structure": [], "over": []}
+    if case["content_type"] == "application/json":
+        try:
+            actual = json.loads(output)
+        except ValueError:
+            diffs["structure"].append("invalid JSON")
+            return diffs
+        _leaf_diffs(json.loads(case["expected"]), actual, "", diffs)
+        return diffs
+    diffs["leak"] = [span for span in _removed_spans(case["input"], case["expected"]) if span in output]
+    if output.count(MASK) > case["expected"].count(MASK):
+        diffs["over"].append(f"{output.count(MASK)} masks vs {case['expected'].count(MASK)}")
+    return diffs
+
+
+def build_backend(variant: str, prompt_cache: bool):
+    from ai_filter import AIRedactor
+
+    env = {"AI_FILTER_PROMPT_CACHE": "true" if prompt_cache else "false",
+           "AI_FILTER_CACHE_BACKEND": "memory", "AI_FILTER_LOG_REQUESTS": "false"}
+    env.update(system_prompt_env(variant))
+    with patched_env(env):
+        redactor = AIRedactor()
+    if not redactor.enabled:
+        raise SystemExit("redactor disabled: set OPENROUTER_API_KEY or use --mock")
+    return redactor
+
+
+def run_variant(variant: str, cases: List[Dict[str, Any]], prompt_cache: bool) -> Dict[str, Any]:
+    redactor = build_backend(variant, prompt_cache)
+    usage = TokenUsage()
+    report: Dict[str, Any] = {"variant": variant, "system_prompt_tokens": estimate_tokens(redactor.system_prompt),
+                              "cases": {}, "failed": 0, "over_redacted": 0}
+    start = time.perf_counter()
+    for case in cases:
+        try:
+            output = redactor.backend.redact(case["input"], case["content_type"], usage)
+        except Exception as exc:
+            report["cases"][case["name"]] = {"error": str(exc)}
+            report["failed"] += 1
+            continue
+        diffs = compare(case, output)
+        report["cases"][case["name"]] = {"output": output, **{k: v for k, v in diffs.items() if v}}
+        if diffs["leak"] or diffs["structure"]:
+            report["failed"] += 1
+        if diffs["over"]:
+            report["over_redacted"] += 1
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["prompt_tokens"] = usage.prompt_tokens
+    report["completion_tokens"] = usage.completion_tokens
+    report["usage_estimated"] = usage.estimated
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--variants", default="default,compact", help="production or candidate prompt variants")
+    parser.add_argument("--prompt-cache", action="store_true", help="send the prompt-caching hint")
+    parser.add_argument("--mock", action="store_true", help="run against the in-process mock upstream")
+    parser.add_argument("--record", metavar="VARIANT", help="overwrite expected outputs with this variant's")
+    parser.add_argument("--out", help="write the full report JSON here")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    for name in ("werkzeug", "ai_filter"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    with open(args.corpus, "r", encoding="utf-8") as fh:
+        corpus = json.load(fh)
+    cases = corpus["cases"]
+
+    mock = MockServer().start() if args.mock else None
+    try:
+        env = {"OPENROUTER_BASE_URL": mock.base_url, "OPENROUTER_API_KEY": "mock"} if mock else {}
+        with patched_env(env):
+            if args.record:
+                if mock is not None:
+                    parser.error("--record needs a real model; the mock would record the rules again")
+                redactor = build_backend(args.record, args.prompt_cache)
+                for case in cases:
+                    case["expected"] = redactor.backend.redact(case["input"], case["content_type"])
+                corpus["source"] = (f"Recorded from {redactor.model} with the {args.record} prompt on "
+                                    f"{time.strftime('%Y-%m-%d')} (bench.prompt_check --record).")
+                write_json(args.corpus, corpus)
+                print(f"recorded {len(cases)} cases from the {args.record} prompt into {args.corpus}")
+                return 0
+            reports = [run_variant(v.strip(), cases, args.prompt_cache)
+                       for v in args.variants.split(",") if v.strip()]
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    for report in reports:
+        print(f"{report['variant']:>8}: system_prompt~{report['system_prompt_tokens']} tok, "
+              f"prompt={report['prompt_tokens']} completion={report['completion_tokens']} tok"
+              f"{' (estimated)' if report['usage_estimated'] else ''}, {report['seconds']}s, "
+              f"failed={report['failed']}/{len(cases)} over_redacted={report['over_redacted']}")
+        for name, result in report["cases"].items():
+            problems = {k: v for k, v in result.items() if k in {"leak", "structure", "error"}}
+            if problems:
+                print(f"          {name}: {json.dumps(problems, ensure_ascii=False)}")
+    if args.out:
+        write_json(args.out, {"corpus": args.corpus, "reports": reports})
+    return 1 if any(r["failed"] for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
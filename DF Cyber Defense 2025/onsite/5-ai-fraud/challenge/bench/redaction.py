@@ -0,0 +1,228 @@
+"""Concurrent benchmark of the redaction pipeline against the local mock backend.
+
+Sweeps redaction engine x system prompt x cache backend x body size x hit
+ratio x thread count and drives either
+``AIRedactor.redact_text`` directly (``--mode redact``) or the Flask
+``after_request`` hook (``--mode flask``). Example::
+
+    python -m bench.redaction --sizes 1024,16384 --hit-ratios 0,0.9 \\
+        --threads 1,8 --backends memory,disk --out bench/results.json \\
+        --baseline bench/baseline.json
+
+``--save-baseline`` writes the results as the new baseline instead of comparing.
+
+``--prompts default,compact,default+cache`` compares system prompt variants
+(production or bench-only candidates, see ``bench.prompt_check``),
+with ``+cache`` sending the prompt-caching hint; pair it with
+``--prefill-per-kchar`` so the mock charges for uncached prompt processing.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from bench.common import compare_to_baseline, latency_summary, patched_env, search_body, system_prompt_env, write_json
+from mock_openrouter import MockConfig, MockServer
+from token_accounting import estimate_tokens
+
+
+COMPARED_KEYS = ["throughput", "p50_ms", "p95_ms", "p99_ms", "upstream_calls_per_request", "tokens_per_request",
+                 "prompt_tokens_per_call"]
+
+
+def _csv(cast: Callable[[str], Any]):
+    return lambda raw: [cast(x) for x in raw.split(",") if x.strip()]
+
+
+def build_redactor(backend: str, engine: str, base_url: str, extra_env: Dict[str, Optional[str]]):
+    from ai_filter import AIRedactor
+
+    env: Dict[str, Optional[str]] = {
+        "OPENROUTER_BASE_URL": base_url,
+        "OPENROUTER_API_KEY": "bench",
+        "AI_FILTER_ENABLED": "true",
+        "AI_FILTER_CACHE_BACKEND": backend,
+        "AI_FILTER_BACKEND": engine,
+        "AI_FILTER_CACHE_SIZE": "100000",
+        "AI_FILTER_CACHE_DIR": tempfile.mkdtemp(prefix="aifraud-bench-") if backend == "disk" else None,
+        # Unique prefix so Redis runs never see each other's entries
+        "REDIS_PREFIX": f"aifraud-bench-{time.time_ns()}",
+    }
+    env.update(extra_env)
+    with patched_env(env):
+        return AIRedactor()
+
+
+def prompt_env(prompt: str) -> Dict[str, Optional[str]]:
+    """``compact+cache`` -> env selecting the compact prompt with caching hints."""
+    variant, _, flag = prompt.partition("+")
+    env = system_prompt_env(variant or "default")
+    env["AI_FILTER_PROMPT_CACHE"] = "true" if flag == "cache" else "false"
+    return env
+
+
+def make_driver(mode: str, redactor) -> Callable[[str], None]:
+    if mode == "redact":
+        return lambda body: redactor.redact_text(body, content_type="application/json")
+
+    import app as app_module
+    from flask import Response
+
+    app_module.get_redactor = lambda: redactor
+    flask_app = app_module.app
+
+    def drive(body: str) -> None:
+        with flask_app.test_request_context("/search"):
+            resp = flask_app.process_response(Response(body, mimetype="application/json"))
+            if resp.status_code != 200:
+                raise RuntimeError(f"after_request returned {resp.status_code}")
+
+    return drive
+
+
+def run_case(case: Dict[str, Any], args, mock: MockServer) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    redactor = build_redactor(case["backend"], case["engine"], mock.base_url, prompt_env(case["prompt"]))
+    if case["backend"] != "auto" and redactor._cache.name != case["backend"]:
+        return {"case": case, "skipped": f"{case['backend']} cache unavailable"}
+    drive = make_driver(case["mode"], redactor)
+
+    hot = [search_body(rng, case["size"], q=f"hot{i}") for i in range(args.hot_set)]
+    for body in hot:
+        drive(body)  # warm the cache so hot bodies are hits
+
+    workload = []
+    for i in range(args.requests):
+        if rng.random() < case["hit_ratio"]:
+            workload.append(rng.choice(hot))
+        else:
+            workload.append(search_body(rng, case["size"], q=f"cold{i}"))
+
+    before = mock.stats.snapshot()
+    latencies: List[float] = []
+    errors = 0
+
+    def one(body: str) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            drive(body)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=case["threads"]) as pool:
+        for elapsed in pool.map(one, workload):
+            if elapsed is None:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+    wall = time.perf_counter() - wall_start
+    after = mock.stats.snapshot()
+
+    upstream = sum(after["calls"].values()) - sum(before["calls"].values())
+    prompt_tokens = after["prompt_tokens"] - before["prompt_tokens"]
+    cached_tokens = after["cached_tokens"] - before["cached_tokens"]
+    tokens = prompt_tokens + (after["completion_tokens"] - before["completion_tokens"])
+    result = {
+        "case": case,
+        "requests": len(workload),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "upstream_calls": upstream,
+        "upstream_calls_per_request": round(upstream / len(workload), 3),
+        "tokens_per_request": round(tokens / len(workload), 1),
+        "system_prompt_tokens": estimate_tokens(redactor.system_prompt),
+        # Uncached prompt tokens per upstream call; what prefill time scales with
+        "prompt_tokens_per_call": round((prompt_tokens - cached_tokens) / upstream, 1) if upstream else 0.0,
+        "cached_tokens_per_call": round(cached_tokens / upstream, 1) if upstream else 0.0,
+    }
+    result.update(latency_summary(latencies))
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["redact", "flask"], default="redact")
+    parser.add_argument("--sizes", type=_csv(int), default=[1024, 16384])
+    parser.add_argument("--hit-ratios", type=_csv(float), default=[0.0, 0.5, 0.9])
+    parser.add_argument("--threads", type=_csv(int), default=[1, 8])
+    parser.add_argument("--backends", type=_csv(str), default=["memory", "disk"], help="cache backends")
+    parser.add_argument("--engines", type=_csv(str), default=["openrouter"],
+                        help="redaction backends (openrouter = mock upstream, local = CPU rules/NER)")
+    parser.add_argument("--prompts", type=_csv(str), default=["default"],
+                        help="system prompt variants (default, candidate compact), '+cache' adds the caching hint")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per case")
+    parser.add_argument("--hot-set", type=int, default=8, help="distinct bodies that can hit the cache")
+    parser.add_argument("--latency", default="lognormal:-2.3,0.4", help="mock latency spec (see mock_openrouter)")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.005)
+    parser.add_argument("--prefill-per-kchar", type=float, default=0.0,
+                        help="mock latency per 1000 uncached prompt chars")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--redis-url", default=None, help="Redis for the redis backend (default: REDIS_URL)")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="write results to --baseline instead")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    args.redis_url = args.redis_url or os.getenv("REDIS_URL")
+    if args.redis_url:
+        import redis_pool
+
+        redis_pool.REDIS_URL = args.redis_url
+    logging.basicConfig(level=logging.WARNING)
+    for name in ("werkzeug", "ai_filter", "app"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    config = MockConfig(latency=args.latency, latency_per_kchar=args.latency_per_kchar,
+                        prefill_per_kchar=args.prefill_per_kchar, error_rate=args.error_rate)
+    results: List[Dict[str, Any]] = []
+    with patched_env({"AI_FILTER_LOG_REQUESTS": "false", "AI_FILTER_LOG_PROMPTS": "false"}), MockServer(config) as mock:
+        for engine, prompt, backend, size, hit_ratio, threads in itertools.product(
+                args.engines, args.prompts, args.backends, args.sizes, args.hit_ratios, args.threads):
+            case = {"mode": args.mode, "engine": engine, "prompt": prompt, "backend": backend, "size": size,
+                    "hit_ratio": hit_ratio, "threads": threads}
+            result = run_case(case, args, mock)
+            results.append(result)
+            if "skipped" in result:
+                print(f"SKIP {json.dumps(case)}: {result['skipped']}")
+                continue
+            print(
+                f"{engine:>10} {prompt:>13} {backend:>6} size={size:<7} hit={hit_ratio:<4} threads={threads:<3} "
+                f"rps={result['throughput']:<8} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                f"p99={result['p99_ms']}ms upstream/req={result['upstream_calls_per_request']} "
+                f"tok/req={result['tokens_per_request']} prompt_tok/call={result['prompt_tokens_per_call']} "
+                f"cached_tok/call={result['cached_tokens_per_call']} errors={result['errors']}"
+            )
+
+    results = [r for r in results if "skipped" not in r]
+    report = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "results": results}
+    if args.out:
+        write_json(args.out, report)
+    if args.baseline and args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        problems = compare_to_baseline(results, baseline.get("results", []), COMPARED_KEYS, args.tolerance)
+        for line in problems:
+            print(f"REGRESSION {line}")
+        if problems:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
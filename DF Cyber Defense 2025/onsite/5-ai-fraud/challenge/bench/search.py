@@ -0,0 +1,131 @@
+"""Compare the /search LIKE scan with the FTS5 trigram index at several table sizes.
+
+Builds a throwaway database per row count from init.sql's schema, fills it
+with generated users, adds the search index (db.SEARCH_INDEX_SQL) and times
+the exact queries app.search_sql issues for each backend::
+
+    python -m bench.search --rows 10000,1000000,10000000 --queries 200
+
+10M rows need several GB of temp disk and a few minutes to generate.
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.common import fake_user, latency_summary, write_json
+from db import ensure_search_index
+
+
+COLUMNS = ["id", "username", "email", "password", "phone", "address", "dob", "ssn", "credit_card_number",
+           "credit_card_cvv", "credit_card_exp", "api_token", "secret_key"]
+SELECT = ("SELECT id, username, email, phone, address, dob, ssn, "
+          "credit_card_number, credit_card_cvv, credit_card_exp, api_token, secret_key FROM users")
+QUERIES = {
+    "like": SELECT + " WHERE username LIKE ?;",
+    "fts": SELECT + " WHERE id IN (SELECT rowid FROM users_fts WHERE username LIKE ?) ORDER BY id;",
+}
+
+
+def _schema() -> str:
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "init.sql"), "r", encoding="utf-8") as fh:
+        sql = fh.read()
+    return re.search(r"CREATE TABLE.*?\);", sql, re.S).group(0)
+
+
+def build(path: str, rows: int, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(_schema())
+    start = time.perf_counter()
+    batch: List[tuple] = []
+    for i in range(1, rows + 1):
+        user = fake_user(rng, i)
+        user["password"] = "x"
+        batch.append(tuple(user[c] for c in COLUMNS))
+        if len(batch) >= 50000:
+            conn.executemany(f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+            batch.clear()
+    if batch:
+        conn.executemany(f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+    conn.commit()
+    loaded = time.perf_counter()
+    ensure_search_index(conn)
+    indexed = time.perf_counter()
+    conn.close()
+    return {"load_s": round(loaded - start, 2), "index_s": round(indexed - loaded, 2)}
+
+
+def workload(rng: random.Random, count: int, rows: int) -> List[str]:
+    """Fragments users would type: name pieces, near-unique names and misses."""
+    terms = []
+    for _ in range(count):
+        name = fake_user(rng, rng.randint(1, rows))["username"]
+        roll = rng.random()
+        if roll < 0.45:
+            start = rng.randrange(0, len(name) - 3)
+            terms.append(name[start:start + rng.randint(3, 6)])
+        elif roll < 0.9:
+            terms.append(name.split(".", 1)[1])
+        else:
+            terms.append("zq" + "".join(rng.choice("xyzqwv") for _ in range(4)))
+    return terms
+
+
+def time_queries(path: str, backend: str, terms: List[str], limit: int) -> Dict[str, Any]:
+    conn = sqlite3.connect(path)
+    latencies: List[float] = []
+    matched = 0
+    for term in terms:
+        start = time.perf_counter()
+        cur = conn.execute(QUERIES[backend], (f"%{term}%",))
+        # /search materialises every row; cap so huge hit lists don't dominate
+        got = cur.fetchmany(limit) if limit else cur.fetchall()
+        latencies.append(time.perf_counter() - start)
+        matched += len(got)
+    conn.close()
+    result = {"queries": len(terms), "rows_returned": matched}
+    result.update(latency_summary(latencies))
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,1000000", help="comma-separated table sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=0, help="fetch at most N rows per query (0 = all)")
+    parser.add_argument("--dir", default=None, help="where to build the databases (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results: List[Dict[str, Any]] = []
+    workdir = args.dir or tempfile.mkdtemp(prefix="aifraud-search-")
+    for rows in [int(x) for x in args.rows.split(",") if x.strip()]:
+        path = os.path.join(workdir, f"users-{rows}.sqlite3")
+        if os.path.exists(path):
+            os.unlink(path)
+        built = build(path, rows, args.seed)
+        terms = workload(random.Random(args.seed), args.queries, rows)
+        for backend in ("like", "fts"):
+            result = {"rows": rows, "backend": backend, "db_mb": round(os.path.getsize(path) / 1e6, 1), **built}
+            result.update(time_queries(path, backend, terms, args.limit))
+            results.append(result)
+            print(f"rows={rows:<9} {backend:>4} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                  f"p99={result['p99_ms']}ms returned={result['rows_returned']} "
+                  f"(load {built['load_s']}s, index {built['index_s']}s, {result['db_mb']} MB)")
+        os.unlink(path)
+    if args.out:
+        write_json(args.out, {"results": results})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
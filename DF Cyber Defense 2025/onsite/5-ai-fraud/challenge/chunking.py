@@ -0,0 +1,225 @@
+"""Structure-aware splitting of large bodies into independently redactable chunks.
+
+JSON is split by array element: either a top-level array, or the largest array
+directly under a top-level object (``{"q": ..., "results": [...]}``), in which
+case the object with that array emptied is redacted as one more chunk so every
+other field still goes through the model. Text is split on paragraph, then
+line, then sentence boundaries, never inside a word: a value cut in two would
+reach the model as two harmless-looking halves. Each plan knows how to put the redacted chunks back together
+in order. stream_json and stream_csv do the same for rows produced lazily (a
+cursor), emitting output as each chunk comes back.
+"""
+import csv
+import io
+import json
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# (chunk text, content type) pairs plus the function that reassembles them
+Plan = Tuple[List[Tuple[str, str]], Callable[[List[str]], str]]
+
+_PARAGRAPH_RE = re.compile(r"(?<=\n\n)")
+# After a space that follows sentence punctuation, not after a digit: "4111. 1111"
+# or "555, 0100" could be parts of one card or phone number
+_SENTENCE_RE = re.compile(r"(?<=[^\d\s][.;:!?,]\s)(?=\S)")
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _group(parts: List[str], max_chars: int, overhead: int = 0) -> List[List[str]]:
+    groups: List[List[str]] = [[]]
+    size = 0
+    for part in parts:
+        if groups[-1] and size + len(part) + overhead > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(part)
+        size += len(part) + overhead
+    return [g for g in groups if g]
+
+
+def load_array(raw: str, expected: int) -> List[Any]:
+    try:
+        items = json.loads(raw)
+    except ValueError as exc:
+        raise RuntimeError("AI redaction returned invalid JSON for a chunk") from exc
+    if not isinstance(items, list) or len(items) != expected:
+        raise RuntimeError("AI redaction changed the length of a chunked array")
+    return items
+
+
+def load_envelope(raw: str, field: str) -> Dict[str, Any]:
+    """Parse a redacted envelope, checking ``field`` survived as an array."""
+    try:
+        outer = json.loads(raw)
+    except ValueError as exc:
+        raise RuntimeError("AI redaction returned invalid JSON for a chunk") from exc
+    if not isinstance(outer, dict) or not isinstance(outer.get(field), list):
+        raise RuntimeError("AI redaction dropped the chunked array field")
+    return outer
+
+
+def split_json(text: str, max_chars: int) -> Optional[Plan]:
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(doc, list):
+        envelope, field, items = None, None, doc
+    elif isinstance(doc, dict):
+        arrays = [(len(_dumps(v)), k) for k, v in doc.items() if isinstance(v, list) and len(v) > 1]
+        if not arrays:
+            return None
+        field = max(arrays)[1]
+        items = doc[field]
+        envelope = dict(doc)
+        envelope[field] = []
+    else:
+        return None
+    if len(items) < 2:
+        return None
+
+    groups = _group([_dumps(item) for item in items], max_chars, overhead=1)
+    sizes = [len(g) for g in groups]
+    chunks = [("[" + ",".join(g) + "]", "application/json") for g in groups]
+    if envelope is not None:
+        chunks.append((_dumps(envelope), "application/json"))
+
+    def assemble(redacted: List[str]) -> str:
+        merged: List[Any] = []
+        for raw, expected in zip(redacted, sizes):
+            merged.extend(load_array(raw, expected))
+        if envelope is None:
+            return _dumps(merged)
+        outer = load_envelope(redacted[-1], field)
+        outer[field] = merged
+        return _dumps(outer)
+
+    return chunks, assemble
+
+
+def stream_json(envelope: Dict[str, Any], field: str, groups: Iterable[List[Any]],
+                redact: Callable[[Iterable[Tuple[str, str]]], Iterator[str]]) -> Iterator[str]:
+    """Yield ``envelope`` as JSON with ``field`` filled lazily from ``groups``.
+
+    The streaming counterpart of split_json: ``redact`` gets the envelope
+    (with ``field`` empty) followed by each group as a JSON array, and must
+    yield the redacted bodies in the same order. Nothing is yielded before
+    the envelope has been redacted.
+    """
+    sizes: Deque[int] = deque()
+
+    def bodies() -> Iterator[Tuple[str, str]]:
+        yield _dumps(dict(envelope, **{field: []})), "application/json"
+        for group in groups:
+            sizes.append(len(group))
+            yield "[" + ",".join(_dumps(item) for item in group) + "]", "application/json"
+
+    results = iter(redact(bodies()))
+    try:
+        outer = load_envelope(next(results), field)
+        del outer[field]
+        yield _dumps(outer)[:-1] + ("," if outer else "") + _dumps(field) + ":["
+        first = True
+        for raw in results:
+            items = load_array(raw, sizes.popleft())
+            if items:
+                yield ("" if first else ",") + ",".join(_dumps(item) for item in items)
+                first = False
+        yield "]}"
+    finally:
+        # Stops in-flight redactions when the client goes away mid-stream
+        close = getattr(results, "close", None)
+        if close is not None:
+            close()
+
+
+def stream_csv(columns: Sequence[str], groups: Iterable[Sequence[Sequence[Any]]],
+               redact: Callable[[Iterable[Tuple[str, str]]], Iterator[str]]) -> Iterator[str]:
+    """Yield a CSV document: the header, then each group of rows redacted as one text/csv body.
+
+    Every redacted block must parse back into as many rows as were sent, each
+    with one field per column; it is re-written with the csv module so the
+    model cannot break the quoting. The header goes out with the first block.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    counts: Deque[int] = deque()
+
+    def render(rows: Iterable[Sequence[Any]]) -> str:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        return buf.getvalue()
+
+    def bodies() -> Iterator[Tuple[str, str]]:
+        for group in groups:
+            counts.append(len(group))
+            yield render(group), "text/csv"
+
+    pending = render([columns])
+    results = iter(redact(bodies()))
+    try:
+        for raw in results:
+            expected = counts.popleft()
+            try:
+                rows = [row for row in csv.reader(io.StringIO(raw)) if row]
+            except csv.Error as exc:
+                raise RuntimeError("AI redaction returned invalid CSV for a chunk") from exc
+            if len(rows) != expected or any(len(row) != len(columns) for row in rows):
+                raise RuntimeError("AI redaction changed the shape of a CSV chunk")
+            yield pending + render(rows)
+            pending = ""
+        if pending:
+            yield pending
+    finally:
+        close = getattr(results, "close", None)
+        if close is not None:
+            close()
+
+
+def _split_lines(text: str, max_chars: int) -> List[str]:
+    parts: List[str] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        if len(paragraph) <= max_chars:
+            parts.append(paragraph)
+            continue
+        for line in paragraph.splitlines(keepends=True):
+            # An overlong line with no sentence boundary is sent whole, over max_chars
+            parts.extend(_SENTENCE_RE.split(line) if len(line) > max_chars else [line])
+    return parts
+
+
+def split_text(text: str, max_chars: int, content_type: str = "text/plain") -> Optional[Plan]:
+    groups = _group(_split_lines(text, max_chars), max_chars)
+    if len(groups) < 2:
+        return None
+    originals = ["".join(g) for g in groups]
+
+    def assemble(redacted: List[str]) -> str:
+        out: List[str] = []
+        for original, value in zip(originals, redacted):
+            # Models tend to trim; keep each chunk's own leading/trailing whitespace
+            core = original.strip()
+            lead = original[:len(original) - len(original.lstrip())]
+            trail = original[len(lead) + len(core):]
+            out.append(lead + value.strip() + trail)
+        return "".join(out)
+
+    return [(c, content_type) for c in originals], assemble
+
+
+def plan(text: str, content_type: Optional[str], max_chars: int) -> Optional[Plan]:
+    """A chunking plan for ``text``, or None to redact it as one body."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return None
+    if content_type == "application/json":
+        return split_json(text, max_chars)
+    if content_type == "text/plain":
+        return split_text(text, max_chars, content_type)
+    return None
+
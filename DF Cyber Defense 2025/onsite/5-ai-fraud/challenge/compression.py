@@ -0,0 +1,105 @@
+"""Response compression: precompressed static pages and cached compressed bodies.
+
+Pages that carry no per-request data are rendered once into a StaticPage
+holding the identity, gzip and (with the optional ``brotli`` package) br
+bodies at the highest levels, plus an ETag per variant. Dynamic bodies are
+compressed after redaction at a cheaper level; CompressionCache keeps the
+result keyed by the digest of the redacted body, so a body that comes back
+from the redaction cache is not compressed again either.
+
+A compressed variant's strong ETag is the identity tag with ``-<encoding>``
+appended, as representations with different content codings must not share
+a strong validator.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import Request, Response
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+
+# In order of preference when the client accepts several equally
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(req: Request) -> Optional[str]:
+    """The coding to send ``req``'s response in, or None for identity."""
+    return req.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    # mtime=0 keeps the output, and so its ETag, stable across workers
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def variant_tag(tag: str, encoding: Optional[str]) -> str:
+    return f"{tag}-{encoding}" if encoding else tag
+
+
+def matching_tag(req: Request, tag: str) -> Optional[str]:
+    """The variant of ``tag`` that ``req``'s If-None-Match names, if any."""
+    for encoding in (None,) + ENCODINGS:
+        candidate = variant_tag(tag, encoding)
+        if req.if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+class StaticPage:
+    def __init__(self, body: str, mimetype: str = "text/html", status: int = 200):
+        self.mimetype = mimetype
+        self.status = status
+        data = body.encode("utf-8")
+        tag = hashlib.sha256(data).hexdigest()[:32]
+        # encoding -> (bytes, etag)
+        self.variants: Dict[Optional[str], Tuple[bytes, str]] = {None: (data, tag)}
+        for encoding in ENCODINGS:
+            self.variants[encoding] = (compress(data, encoding, best=True), variant_tag(tag, encoding))
+
+    def response(self, req: Request, compress: bool = True) -> Response:
+        encoding = negotiate(req) if compress else None
+        data, tag = self.variants[encoding]
+        resp = Response(data, status=self.status, mimetype=self.mimetype)
+        if compress:
+            resp.vary.add("Accept-Encoding")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if self.status != 200:
+            return resp
+        resp.set_etag(tag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp.make_conditional(req)
+
+
+class CompressionCache:
+    """Bounded LRU of compressed bodies keyed by (encoding, body digest); size 0 disables it."""
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self._items: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if self.size <= 0:
+            return compress(data, encoding)
+        key = (encoding, hashlib.sha256(data).digest())
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is not None:
+                self._items.move_to_end(key)
+                return cached
+        compressed = compress(data, encoding)
+        with self._lock:
+            self._items[key] = compressed
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return compressed
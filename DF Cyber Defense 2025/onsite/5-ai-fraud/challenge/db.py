@@ -0,0 +1,180 @@
+"""Per-thread SQLite read connections.
+
+Request handlers used to open and close a connection per request. Instead,
+each worker thread keeps one read-only connection for its lifetime, opened
+with tuned pragmas (``mmap_size``, ``cache_size``, ``query_only``) and a
+statement cache. The database is switched to WAL once per process so readers
+never block on, or block, a writer.
+
+Connections must not cross ``fork()``: after fork the child starts with an
+empty pool, and the parent's connections are parked (never closed) so their
+finalizers cannot touch the parent's file locks.
+"""
+import os
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+
+
+logger = logging.getLogger(__name__)
+
+# Inherited connections are kept referenced here so the child never closes them
+_inherited: List[sqlite3.Connection] = []
+
+# Trigram FTS5 index over users.username (external content, so no copy of the
+# table), kept in sync by triggers. Trigram makes ``LIKE '%abc%'`` an index
+# lookup instead of a full scan for patterns of three or more characters.
+SEARCH_INDEX_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+    username, content='users', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+    INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+    INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username ON users BEGIN
+    INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+    INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username);
+END;
+"""
+
+# Pre-redacted /users/<id> bodies. Triggers bump ``version`` on every change
+# to a user; a body is fresh while ``body_version`` matches it (and it was
+# produced by the current redactor, see materialize.py).
+REDACTED_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS users_redacted (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    body TEXT,
+    body_version INTEGER,
+    fingerprint TEXT,
+    refreshed_at REAL
+);
+CREATE INDEX IF NOT EXISTS users_redacted_stale ON users_redacted(id) WHERE body_version IS NOT version;
+CREATE TRIGGER IF NOT EXISTS users_redacted_ai AFTER INSERT ON users BEGIN
+    INSERT INTO users_redacted(id) VALUES (new.id) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS users_redacted_au AFTER UPDATE ON users BEGIN
+    DELETE FROM users_redacted WHERE id = old.id AND old.id IS NOT new.id;
+    INSERT INTO users_redacted(id) VALUES (new.id) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS users_redacted_ad AFTER DELETE ON users BEGIN
+    DELETE FROM users_redacted WHERE id = old.id;
+END;
+INSERT OR IGNORE INTO users_redacted(id) SELECT id FROM users;
+"""
+
+
+def ensure_search_index(conn: sqlite3.Connection) -> None:
+    """Create the FTS index and its triggers, backfilling it on first creation."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'").fetchone()
+    conn.executescript(SEARCH_INDEX_SQL)
+    if not exists:
+        conn.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def ensure_redacted_table(conn: sqlite3.Connection) -> None:
+    """Create users_redacted and its triggers; existing users start out stale."""
+    conn.executescript(REDACTED_TABLE_SQL)
+    conn.commit()
+
+
+class ConnectionManager:
+    def __init__(self, path: Union[str, Path], mmap_size: int = 268435456, cache_kib: int = 8192,
+                 statement_cache: int = 256, wal: bool = True):
+        self.path = str(path)
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self.statement_cache = statement_cache
+        self.wal = wal
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._wal_checked = False
+        self._ready: Dict[str, bool] = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        _inherited.extend(self._all)
+        self._all = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wal_checked = False
+        self._ready = {}
+
+    def connect(self) -> sqlite3.Connection:
+        """A new read-write connection (caller closes it); for writes and setup."""
+        conn = sqlite3.connect(self.path, cached_statements=self.statement_cache)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_wal(self) -> None:
+        # journal_mode is persistent, so one successful switch covers every connection
+        with self._lock:
+            if self._wal_checked:
+                return
+            self._wal_checked = True
+            if not self.wal or not os.path.exists(self.path):
+                return
+            try:
+                conn = sqlite3.connect(self.path)
+                try:
+                    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                finally:
+                    conn.close()
+                if str(mode).lower() != "wal":
+                    logger.warning("SQLite at %s stayed in %s journal mode", self.path, mode)
+            except sqlite3.Error:
+                logger.warning("Could not switch %s to WAL; continuing in its current mode", self.path, exc_info=True)
+
+    def _ensure_once(self, name: str, setup: Callable[[sqlite3.Connection], None], failure: str) -> bool:
+        ready = self._ready.get(name)
+        if ready is not None:
+            return ready
+        with self._lock:
+            if name not in self._ready:
+                try:
+                    conn = self.connect()
+                    try:
+                        setup(conn)
+                    finally:
+                        conn.close()
+                    self._ready[name] = True
+                except sqlite3.Error:
+                    logger.warning(failure, exc_info=True)
+                    self._ready[name] = False
+            return self._ready[name]
+
+    def search_index_ready(self) -> bool:
+        """Ensure the FTS index once per process; False if this SQLite lacks FTS5/trigram."""
+        return self._ensure_once("search_index", ensure_search_index,
+                                 "FTS5 trigram search index unavailable; using LIKE scans")
+
+    def redacted_table_ready(self) -> bool:
+        """Ensure users_redacted once per process; False if it cannot be created."""
+        return self._ensure_once("users_redacted", ensure_redacted_table,
+                                 "users_redacted unavailable; redacting /users live")
+
+    def read(self) -> sqlite3.Connection:
+        """This thread's read-only connection; do not close it."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        self._ensure_wal()
+        # Autocommit: a SELECT never leaves a transaction (and a WAL snapshot) open
+        conn = sqlite3.connect(self.path, cached_statements=self.statement_cache, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        self._local.conn = conn
+        with self._lock:
+            self._all.append(conn)
+        return conn
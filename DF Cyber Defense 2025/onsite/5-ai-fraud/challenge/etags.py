@@ -0,0 +1,64 @@
+"""Strong ETags for redacted resources, checkable without a DB read or a model call.
+
+The ETag is a hash of the redacted body as sent. Each one is remembered per
+resource along with the redactor fingerprint (backend, model, system prompt)
+and the database version it was rendered from, so a conditional GET that
+still matches can be answered 304 before any DB or AI work.
+
+The database version is the size and mtime of the SQLite file and its WAL:
+any committed write invalidates every remembered tag, including writes that
+touch no user and the users_redacted refreshes of materialize.py, so with
+MATERIALIZE_USERS on tags only survive while the refresher is idle. Coarse,
+but it costs two ``stat()`` calls instead of a query.
+"""
+import os
+import hashlib
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from ai_cache import MemoryTier
+
+
+Version = Tuple[int, ...]
+
+
+def _encode(version: Version) -> str:
+    return ".".join(str(v) for v in version)
+
+
+class ETagStore:
+    def __init__(self, db_path: Union[str, Path], size: int = 10000, ttl: float = 3600.0):
+        self.db_path = str(db_path)
+        # resource -> "<tag> <version>"
+        self._tags = MemoryTier(size, ttl)
+
+    def db_version(self) -> Version:
+        parts = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                parts.extend((0, 0))
+                continue
+            parts.extend((st.st_mtime_ns, st.st_size))
+        return tuple(parts)
+
+    @staticmethod
+    def compute(body: bytes) -> str:
+        """The (unquoted) strong ETag of a response body."""
+        return hashlib.sha256(body).hexdigest()[:32]
+
+    @staticmethod
+    def _key(resource: str, fingerprint: str) -> str:
+        return f"{fingerprint}:{resource}"
+
+    def lookup(self, resource: str, fingerprint: str, version: Version) -> Optional[str]:
+        """The tag last sent for ``resource``, if nothing it depends on has changed since."""
+        entry = self._tags.get(self._key(resource, fingerprint))
+        if entry is None:
+            return None
+        tag, _, stored = entry.partition(" ")
+        return tag if stored == _encode(version) else None
+
+    def remember(self, resource: str, fingerprint: str, tag: str, version: Version) -> None:
+        self._tags.set(self._key(resource, fingerprint), f"{tag} {_encode(version)}")
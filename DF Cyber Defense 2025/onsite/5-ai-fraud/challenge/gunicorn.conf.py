@@ -0,0 +1,14 @@
+# Loaded by start.sh via `gunicorn -c gunicorn.conf.py`; CLI flags there still apply.
+import gc
+
+
+def pre_fork(server, worker):
+    # With --preload, move the imported app out of GC generations so
+    # collections in workers don't write to (and un-share) those pages
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -0,0 +1,154 @@
+"""Markup-aware redaction for text/html bodies (``AI_FILTER_HTML_MODE=markup``).
+
+Instead of sending a whole document (tags, inline CSS and all) to the model,
+the document is tokenized into text nodes, tag and attribute names, attribute
+values (inline styles included), comments, CDATA sections, declarations,
+processing instructions and script and style bodies. Only those segments are
+sent, deduplicated and batched as JSON string arrays, and the results are
+spliced back into the original byte positions, so everything outside the
+segments is returned unchanged. A tag the tokenizer cannot fully account for
+raises, so the response fails closed rather than pass unsent bytes through.
+
+Segments reach the model without their surroundings: a value loses the key
+or label next to it that the prompt's policy keys on, and a secret split
+across nodes is never seen whole. That is why this mode is opt-in and the
+default sends whole documents.
+"""
+import json
+import re
+from typing import Callable, Dict, List, Tuple
+
+
+# (kind, start, end) spans of the document that carry content
+Segment = Tuple[str, int, int]
+
+_TOKEN_RE = re.compile(
+    r"<!--(?P<comment>.*?)-->"
+    r"|<!\[CDATA\[(?P<cdata>.*?)\]\]>"
+    r"|<(?P<raw>script|style)\b(?P<rawattrs>(?:[^>\"']|\"[^\"]*\"|'[^']*')*)>(?P<rawbody>.*?)</(?P=raw)\s*>"
+    r"|<!(?P<decl>[^>]*)>"
+    r"|<\?(?P<pi>[^>]*)>"
+    r"|</?(?P<tag>[A-Za-z][^\s/>]*)(?P<attrs>(?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+    re.S | re.I,
+)
+_ATTR_RE = re.compile(r"""(?P<name>[^\s=/>"']+)(?:\s*=\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<uq>[^\s"'<>]+)))?""")
+# What may sit between attributes: whitespace and the self-closing slash
+_ATTR_GAP_RE = re.compile(r"[\s/]*")
+MASK = "********"
+
+
+def _worth_sending(value: str) -> bool:
+    # Whitespace, punctuation and existing masks cannot hold anything to redact
+    stripped = value.strip()
+    return stripped != MASK and any(c.isalnum() for c in stripped)
+
+
+def _segments(doc: str) -> List[Segment]:
+    found: List[Segment] = []
+
+    def add(kind: str, start: int, end: int) -> None:
+        if _worth_sending(doc[start:end]):
+            found.append((kind, start, end))
+
+    pos = 0
+    for m in _TOKEN_RE.finditer(doc):
+        add("text", pos, m.start())
+        pos = m.end()
+        for group in ("comment", "cdata", "decl", "pi"):
+            if m.group(group) is not None:
+                add(group, m.start(group), m.end(group))
+                break
+        else:
+            if m.group("raw") is not None:
+                _attr_segments(doc, m.start("rawattrs"), m.group("rawattrs"), found)
+                # Stylesheets are sent too: url() queries and comments can carry data
+                add("text", m.start("rawbody"), m.end("rawbody"))
+            else:
+                add("name", m.start("tag"), m.end("tag"))
+                _attr_segments(doc, m.start("attrs"), m.group("attrs"), found)
+    add("text", pos, len(doc))
+    return found
+
+
+def _attr_segments(doc: str, base: int, chunk: str, found: List[Segment]) -> None:
+    pos = 0
+    for a in _ATTR_RE.finditer(chunk):
+        if not _ATTR_GAP_RE.fullmatch(chunk, pos, a.start()):
+            raise RuntimeError("HTML attribute syntax not covered by segment redaction")
+        pos = a.end()
+        for group, kind in (("name", "name"), ("dq", 'attr"'), ("sq", "attr'"), ("uq", "attr")):
+            if a.group(group) is not None:
+                start, end = base + a.start(group), base + a.end(group)
+                if _worth_sending(doc[start:end]):
+                    found.append((kind, start, end))
+    if not _ATTR_GAP_RE.fullmatch(chunk, pos):
+        raise RuntimeError("HTML attribute syntax not covered by segment redaction")
+
+
+def _escape(kind: str, value: str) -> str:
+    # Keep a changed value from closing its construct or opening a tag
+    if kind == "name":
+        # Names have no escapes; anything that would end the name becomes the mask
+        return value if value and not re.search(r"[\s\"'<>=/`]", value) else MASK
+    value = value.replace("<", "&lt;")
+    if kind == "comment":
+        return value.replace("-->", "--&gt;")
+    if kind == "cdata":
+        return value.replace("]]>", "]]&gt;")
+    if kind in {"decl", "pi"}:
+        return value.replace(">", "&gt;")
+    if kind == 'attr"':
+        return value.replace('"', "&quot;")
+    if kind == "attr'":
+        return value.replace("'", "&#39;")
+    if kind == "attr":
+        return value.replace(" ", "&#32;").replace(">", "&gt;")
+    return value
+
+
+def _batches(values: List[str], max_chars: int) -> List[List[str]]:
+    batches: List[List[str]] = [[]]
+    size = 0
+    for v in values:
+        if batches[-1] and size + len(v) > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(v)
+        size += len(v) + 4
+    return [b for b in batches if b]
+
+
+def redact_html(doc: str, redact_json: Callable[[List[str]], List[str]], max_batch_chars: int = 8000) -> str:
+    """Redact ``doc`` segment-wise; ``redact_json`` redacts a list of JSON bodies.
+
+    Raises RuntimeError when the model output cannot be mapped back, so the
+    caller fails closed exactly as for whole-body redaction.
+    """
+    segments = _segments(doc)
+    if not segments:
+        return doc
+    unique = list(dict.fromkeys(doc[s:e] for _, s, e in segments))
+    mapping: Dict[str, str] = {}
+    batches = _batches(unique, max_batch_chars)
+    outputs = redact_json([json.dumps(batch, ensure_ascii=False) for batch in batches])
+    for batch, raw in zip(batches, outputs):
+        try:
+            redacted = json.loads(raw)
+        except ValueError as exc:
+            raise RuntimeError("AI redaction returned invalid JSON for HTML segments") from exc
+        if not isinstance(redacted, list) or len(redacted) != len(batch):
+            raise RuntimeError("AI redaction changed the number of HTML segments")
+        for original, value in zip(batch, redacted):
+            mapping[original] = value if isinstance(value, str) else json.dumps(value)
+
+    out: List[str] = []
+    pos = 0
+    # Splicing walks the document forwards; segments must be in offset order
+    for kind, start, end in sorted(segments, key=lambda s: s[1]):
+        original = doc[start:end]
+        value = mapping.get(original, original)
+        out.append(doc[pos:start])
+        out.append(original if value == original else _escape(kind, value))
+        pos = end
+    out.append(doc[pos:])
+    return "".join(out)
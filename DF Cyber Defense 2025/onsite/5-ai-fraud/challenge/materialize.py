@@ -0,0 +1,152 @@
+"""Background refresh of the pre-redacted ``users_redacted`` table.
+
+SQLite triggers (db.REDACTED_TABLE_SQL) bump a user's ``version`` on every
+insert or update; this job redacts stale rows off the request path and stores
+the body with the version it was rendered from. ``/users/<id>`` serves a
+stored body only while that version is current and it came from the current
+redactor (its fingerprint), and redacts live otherwise.
+
+A write is conditional on the version read before the row, so an update that
+races a refresh leaves the row stale rather than fresh with old data. Across
+gunicorn workers an ``flock`` elects one refresher; the others only read.
+"""
+import os
+import time
+import logging
+import sqlite3
+import threading
+from typing import Callable, List, Optional
+
+import metrics
+from db import ConnectionManager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class Materializer:
+    def __init__(self, db: ConnectionManager, render: Callable[[sqlite3.Row], str],
+                 redact: Callable[[str], str], fingerprint: Callable[[], str],
+                 interval: float = 5.0, batch: int = 100):
+        self.db = db
+        self.render = render
+        self.redact = redact
+        self.fingerprint = fingerprint
+        self.interval = max(0.1, interval)
+        self.batch = max(1, batch)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def ready(self) -> bool:
+        """Ensure the table exists and the refresher runs in this process."""
+        if not self.db.redacted_table_ready():
+            return False
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name="materialize", daemon=True)
+                    self._thread.start()
+        return True
+
+    def _stored_body(self, user_id: int) -> Optional[str]:
+        row = self.db.read().execute(
+            "SELECT body FROM users_redacted WHERE id = ? AND body_version = version AND fingerprint = ?",
+            (user_id, self.fingerprint()),
+        ).fetchone()
+        return None if row is None else row["body"]
+
+    def fresh_body(self, user_id: int) -> Optional[str]:
+        """The stored redacted body for ``user_id``, or None if missing or stale."""
+        body = self._stored_body(user_id)
+        if body is None:
+            metrics.MATERIALIZED.labels("miss").inc()
+            return None
+        metrics.MATERIALIZED.labels("hit").inc()
+        return body
+
+    def is_fresh(self, user_id: int) -> bool:
+        """Whether ``fresh_body`` would serve ``user_id``, without counting a hit or miss."""
+        return self._stored_body(user_id) is not None
+
+    def _run(self) -> None:
+        lock_file = None
+        while True:
+            try:
+                if lock_file is None:
+                    lock_file = self._elect()
+                if lock_file is not None:
+                    self.refresh()
+            except Exception:
+                logger.exception("users_redacted refresh failed")
+            time.sleep(self.interval)
+
+    def _elect(self):
+        # One refresher per database; the lock dies with the process holding it
+        if fcntl is None:
+            return True
+        fh = open(self.db.path + ".materialize.lock", "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return None
+        logger.info("users_redacted refresher running in pid %d", os.getpid())
+        return fh
+
+    def refresh(self) -> int:
+        """One pass over the stale rows, ``batch`` at a time; returns how many were refreshed.
+
+        Rows whose redaction fails stay stale and are retried on the next pass.
+        """
+        fingerprint = self.fingerprint()
+        refreshed = 0
+        conn = self.db.connect()
+        try:
+            # A new model or prompt makes every stored body stale
+            conn.execute(
+                "UPDATE users_redacted SET body_version = NULL WHERE body_version IS NOT NULL AND fingerprint IS NOT ?",
+                (fingerprint,),
+            )
+            conn.commit()
+            after = 0
+            while True:
+                stale: List[sqlite3.Row] = conn.execute(
+                    "SELECT id, version FROM users_redacted WHERE body_version IS NOT version AND id > ? "
+                    "ORDER BY id LIMIT ?",
+                    (after, self.batch),
+                ).fetchall()
+                for entry in stale:
+                    refreshed += self._refresh_one(conn, entry["id"], entry["version"], fingerprint)
+                if len(stale) < self.batch:
+                    return refreshed
+                after = stale[-1]["id"]
+        finally:
+            conn.close()
+
+    def _refresh_one(self, conn: sqlite3.Connection, user_id: int, version: int, fingerprint: str) -> int:
+        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            return 0
+        try:
+            body = self.redact(self.render(row))
+        except Exception:
+            metrics.MATERIALIZED.labels("failed").inc()
+            logger.debug("Redacting user %s for users_redacted failed", user_id, exc_info=True)
+            return 0
+        cur = conn.execute(
+            "UPDATE users_redacted SET body = ?, body_version = ?, fingerprint = ?, refreshed_at = ? "
+            "WHERE id = ? AND version = ?",
+            (body, version, fingerprint, time.time(), user_id, version),
+        )
+        conn.commit()
+        if not cur.rowcount:
+            return 0
+        metrics.MATERIALIZED.labels("refreshed").inc()
+        return 1
@@ -0,0 +1,118 @@
+"""Prometheus metrics shared by app.py and ai_filter.py.
+
+Under gunicorn, set ``PROMETHEUS_MULTIPROC_DIR`` (start.sh does) so every
+worker writes to mmap'd files and ``/metrics`` aggregates across workers;
+gunicorn.conf.py marks dead workers. Without prometheus_client installed all
+metrics are no-ops.
+"""
+import os
+import logging
+from typing import Any, Dict, Tuple
+
+try:
+    import prometheus_client  # type: ignore
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess  # type: ignore
+except Exception:  # pragma: no cover
+    prometheus_client = None
+
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+_REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 131072, 524288, 2097152)
+
+
+class _Noop:
+    def labels(self, *args, **kwargs) -> "_Noop":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+def _counter(name: str, doc: str, labels: Tuple[str, ...] = ()):
+    if prometheus_client is None:
+        return _Noop()
+    return Counter(name, doc, labels)
+
+
+def _histogram(name: str, doc: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+    if prometheus_client is None:
+        return _Noop()
+    return Histogram(name, doc, labels, buckets=buckets)
+
+
+AI_CALL_SECONDS = _histogram(
+    "aifraud_ai_call_seconds", "Upstream AI API call latency", ("endpoint", "status"), _LATENCY_BUCKETS
+)
+REDACTION_BODY_BYTES = _histogram(
+    "aifraud_redaction_body_bytes", "Size of bodies sent to the redactor", ("content_type",), _SIZE_BUCKETS
+)
+REQUEST_SECONDS = _histogram(
+    "aifraud_request_seconds", "End-to-end request latency including redaction", ("method", "endpoint", "status"),
+    _REQUEST_BUCKETS,
+)
+AI_CACHE_LOOKUPS = _counter("aifraud_ai_cache_lookups_total", "AI cache lookups", ("tier", "result"))
+AI_FALLBACK = _counter("aifraud_ai_fallback_total", "Calls that fell back to the /responses endpoint")
+FAIL_CLOSED = _counter("aifraud_fail_closed_total", "Responses replaced by 503 after redaction failed", ("content_type",))
+RATE_LIMITED = _counter("aifraud_rate_limited_total", "Requests rejected by the rate limiter", ("team",))
+AI_QUEUE_WAIT_SECONDS = _histogram(
+    "aifraud_ai_queue_wait_seconds", "Time spent waiting for an upstream slot", ("priority",), _REQUEST_BUCKETS
+)
+AI_TOKENS = _counter("aifraud_ai_tokens_total", "Model tokens spent on redaction per team", ("team", "kind"))
+AI_CACHED_PROMPT_TOKENS = _counter(
+    "aifraud_ai_cached_prompt_tokens_total", "Prompt tokens served from the provider's prompt cache"
+)
+PREFETCH = _counter("aifraud_prefetch_total", "Speculative /users redactions after /search", ("result",))
+MATERIALIZED = _counter(
+    "aifraud_materialized_total", "users_redacted lookups (hit/miss) and background refreshes", ("result",)
+)
+TOKEN_THROTTLED = _counter("aifraud_token_throttled_total", "Requests rejected by the token budget", ("team",))
+INFLIGHT_REJECTED = _counter(
+    "aifraud_inflight_rejected_total", "Requests rejected by the per-team in-flight cap", ("team",)
+)
+
+
+def render() -> Tuple[bytes, str]:
+    """Return (body, content type) for the /metrics endpoint."""
+    if prometheus_client is None:
+        return b"# prometheus_client not installed\n", "text/plain; version=0.0.4; charset=utf-8"
+    return prometheus_client.generate_latest(_registry()), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def _registry():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return prometheus_client.REGISTRY
+
+
+def cache_lookup_counts() -> Dict[str, Dict[str, Any]]:
+    """AI cache hits/misses per tier, summed over all workers, with hit ratio."""
+    counts: Dict[str, Dict[str, Any]] = {}
+    if prometheus_client is None:
+        return counts
+    for family in _registry().collect():
+        if family.name != "aifraud_ai_cache_lookups":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_total"):
+                tier = counts.setdefault(sample.labels["tier"], {"hit": 0, "miss": 0})
+                tier[sample.labels["result"]] = tier.get(sample.labels["result"], 0) + int(sample.value)
+    for tier in counts.values():
+        total = tier["hit"] + tier["miss"]
+        tier["hit_ratio"] = round(tier["hit"] / total, 4) if total else None
+    return counts
+
+
+def mark_process_dead(pid: int) -> None:
+    """gunicorn child_exit hook: drop a dead worker's live gauges."""
+    if prometheus_client is not None and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,366 @@
+"""Local OpenRouter stand-in for offline benchmarking.
+
+Serves the ``/chat/completions`` and ``/responses`` schemas that
+``AIRedactor.redact_text`` parses, producing output with the rule-based
+redactor. Point ``OPENROUTER_BASE_URL`` at it, e.g.::
+
+    python mock_openrouter.py --port 8099 --latency lognormal:-1.6,0.5 --error-rate 0.01
+    OPENROUTER_BASE_URL=http://127.0.0.1:8099 OPENROUTER_API_KEY=mock python app.py
+
+Latency specs: ``fixed:S``, ``uniform:LO,HI``, ``normal:MEAN,STD``,
+``lognormal:MU,SIGMA`` (seconds; MU/SIGMA of the underlying normal).
+
+A system message carrying a ``cache_control`` hint counts as cached from its
+second use: it is reported as ``cached_tokens`` and not charged
+``--prefill-per-kchar``.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+import redaction_rules
+
+
+logger = logging.getLogger(__name__)
+
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a zero-arg sampler returning seconds."""
+    kind, _, raw = (spec or "fixed:0").partition(":")
+    args = [float(x) for x in raw.split(",") if x.strip()] or [0.0]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        lo, hi = args[0], args[1] if len(args) > 1 else args[0]
+        return lambda: random.uniform(lo, hi)
+    if kind == "normal":
+        mean, std = args[0], args[1] if len(args) > 1 else 0.0
+        return lambda: max(0.0, random.gauss(mean, std))
+    if kind == "lognormal":
+        mu, sigma = args[0], args[1] if len(args) > 1 else 0.0
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"unknown latency distribution: {spec!r}")
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough chars/4 heuristic, good enough for relative comparisons
+    return max(1, (len(text or "") + 3) // 4)
+
+
+class MockConfig:
+    def __init__(self, **overrides: Any):
+        self.latency = os.getenv("MOCK_LATENCY", "fixed:0")
+        # Extra latency per 1000 chars of output, models decode time
+        self.latency_per_kchar = float(os.getenv("MOCK_LATENCY_PER_KCHAR", "0"))
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", "0"))
+        self.error_status = int(os.getenv("MOCK_ERROR_STATUS", "500"))
+        # Answer /chat/completions with 404 so clients exercise the /responses fallback
+        self.chat_404 = _env_bool("MOCK_CHAT_404")
+        # "output_text" or "output" (output[].content[].text)
+        self.responses_schema = os.getenv("MOCK_RESPONSES_SCHEMA", "output_text")
+        # "request" streams when the payload asks for it; "always"/"never" force it
+        self.stream = os.getenv("MOCK_STREAM", "request")
+        self.stream_chunk_chars = int(os.getenv("MOCK_STREAM_CHUNK_CHARS", "64"))
+        self.stream_chunk_delay = float(os.getenv("MOCK_STREAM_CHUNK_DELAY", "0"))
+        # Prompt processing time per 1000 uncached prompt chars, models time-to-first-token
+        self.prefill_per_kchar = float(os.getenv("MOCK_PREFILL_PER_KCHAR", "0"))
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(self, key, value)
+        self.sample_latency = parse_latency(self.latency)
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[str, int] = {"chat": 0, "responses": 0}
+            self.errors = 0
+            self.not_found = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.cached_tokens = 0
+            self.cached_prefixes: set = set()
+
+    def record(self, endpoint: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+
+    def cache_prefix(self, prefix: str) -> bool:
+        """Remember a cache-marked prefix; True if it was already cached."""
+        with self._lock:
+            if prefix in self.cached_prefixes:
+                return True
+            self.cached_prefixes.add(prefix)
+            return False
+
+    def bump(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "errors": self.errors,
+                "not_found": self.not_found,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+            }
+
+
+def _split_messages(messages: Any) -> Tuple[str, str, bool]:
+    """(system, user, whether the system message carries a cache_control hint)."""
+    system, user, cacheable = "", "", False
+    for msg in messages or []:
+        if not isinstance(msg, dict):
+            continue
+        content = msg.get("content")
+        if isinstance(content, list):
+            # Content parts, as sent with AI_FILTER_PROMPT_CACHE's cache_control hint
+            parts = [p for p in content if isinstance(p, dict)]
+            if msg.get("role") == "system" and any(p.get("cache_control") for p in parts):
+                cacheable = True
+            content = "".join(p.get("text", "") for p in parts)
+        if not isinstance(content, str):
+            continue
+        if msg.get("role") == "system":
+            system += content
+        elif msg.get("role") == "user":
+            user = content
+    return system, user, cacheable
+
+
+def create_app(config: Optional[MockConfig] = None) -> Flask:
+    config = config or MockConfig()
+    stats = MockStats()
+    app = Flask(__name__)
+    app.config["MOCK_CONFIG"] = config
+    app.config["MOCK_STATS"] = stats
+
+    def _simulate(output: str, prompt_chars: int = 0) -> Optional[Response]:
+        delay = (config.sample_latency() + config.latency_per_kchar * len(output) / 1000.0
+                 + config.prefill_per_kchar * prompt_chars / 1000.0)
+        if delay > 0:
+            time.sleep(delay)
+        if config.error_rate > 0 and random.random() < config.error_rate:
+            stats.bump("errors")
+            return Response(
+                json.dumps({"error": {"message": "mock upstream error", "code": config.error_status}}),
+                status=config.error_status,
+                mimetype="application/json",
+            )
+        return None
+
+    def _wants_stream(payload: Dict[str, Any]) -> bool:
+        if config.stream == "always":
+            return True
+        if config.stream == "never":
+            return False
+        return bool(payload.get("stream"))
+
+    def _sse(frames):
+        def gen():
+            for frame in frames:
+                if config.stream_chunk_delay > 0:
+                    time.sleep(config.stream_chunk_delay)
+                yield f"data: {json.dumps(frame)}\n\n"
+            yield "data: [DONE]\n\n"
+        return Response(gen(), mimetype="text/event-stream")
+
+    def _pieces(text: str):
+        size = max(1, config.stream_chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def _usage(system: str, user: str, output: str, cached: bool = False) -> Dict[str, Any]:
+        prompt_tokens = estimate_tokens(system) + estimate_tokens(user)
+        completion_tokens = estimate_tokens(output)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": estimate_tokens(system) if cached else 0},
+        }
+
+    def _prompt(messages: Any) -> Tuple[str, str, bool]:
+        # A cache-marked system prompt is a hit from its second use onwards
+        system, user, cacheable = _split_messages(messages)
+        return system, user, cacheable and bool(system) and stats.cache_prefix(system)
+
+    @app.post("/chat/completions")
+    @app.post("/api/v1/chat/completions")
+    def chat_completions():
+        if config.chat_404:
+            stats.bump("not_found")
+            return jsonify({"error": {"message": "not found", "code": 404}}), 404
+        payload = request.get_json(silent=True) or {}
+        system, user, cached = _prompt(payload.get("messages"))
+        output = redaction_rules.redact(user)
+        failure = _simulate(output, len(user) + (0 if cached else len(system)))
+        if failure is not None:
+            return failure
+        usage = _usage(system, user, output, cached)
+        stats.record("chat", usage["prompt_tokens"], usage["completion_tokens"],
+                     usage["prompt_tokens_details"]["cached_tokens"])
+        rid = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = payload.get("model", "mock")
+        if _wants_stream(payload):
+            frames = [
+                {"id": rid, "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                for piece in _pieces(output)
+            ]
+            frames.append({"id": rid, "object": "chat.completion.chunk", "model": model,
+                           "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+            return _sse(frames)
+        return jsonify({
+            "id": rid,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": output}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    @app.post("/responses")
+    @app.post("/api/v1/responses")
+    def responses():
+        payload = request.get_json(silent=True) or {}
+        raw_input = payload.get("input")
+        if isinstance(raw_input, str):
+            system, user, cached = "", raw_input, False
+        else:
+            system, user, cached = _prompt(raw_input)
+        output = redaction_rules.redact(user)
+        failure = _simulate(output, len(user) + (0 if cached else len(system)))
+        if failure is not None:
+            return failure
+        usage = _usage(system, user, output, cached)
+        cached_tokens = usage["prompt_tokens_details"]["cached_tokens"]
+        stats.record("responses", usage["prompt_tokens"], usage["completion_tokens"], cached_tokens)
+        rid = f"resp_{uuid.uuid4().hex[:24]}"
+        if _wants_stream(payload):
+            frames = [{"type": "response.output_text.delta", "delta": piece} for piece in _pieces(output)]
+            frames.append({"type": "response.completed", "response": {"id": rid, "usage": {
+                "input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"],
+                "total_tokens": usage["total_tokens"], "input_tokens_details": {"cached_tokens": cached_tokens}}}})
+            return _sse(frames)
+        body: Dict[str, Any] = {
+            "id": rid,
+            "object": "response",
+            "model": payload.get("model", "mock"),
+            "usage": {
+                "input_tokens": usage["prompt_tokens"],
+                "output_tokens": usage["completion_tokens"],
+                "total_tokens": usage["total_tokens"],
+                "input_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+        if config.responses_schema == "output":
+            body["output"] = [{"type": "message", "role": "assistant",
+                               "content": [{"type": "output_text", "text": output}]}]
+        else:
+            body["output_text"] = output
+        return jsonify(body)
+
+    @app.get("/stats")
+    def get_stats():
+        return jsonify(stats.snapshot())
+
+    @app.post("/stats/reset")
+    def reset_stats():
+        stats.reset()
+        return jsonify({"status": "ok"})
+
+    return app
+
+
+class MockServer:
+    """Run the mock on a background thread, e.g. from a benchmark process."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.app = create_app(config)
+        self._server = make_server(host, port, self.app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-openrouter", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._server.host}:{self._server.port}"
+
+    @property
+    def stats(self) -> MockStats:
+        return self.app.config["MOCK_STATS"]
+
+    def start(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._thread.join(timeout=5)
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("MOCK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_PORT", "8099")))
+    parser.add_argument("--latency", help="latency distribution spec (default: MOCK_LATENCY)")
+    parser.add_argument("--latency-per-kchar", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--error-status", type=int)
+    parser.add_argument("--chat-404", action="store_true", default=None)
+    parser.add_argument("--responses-schema", choices=["output_text", "output"])
+    parser.add_argument("--stream", choices=["request", "always", "never"])
+    parser.add_argument("--stream-chunk-chars", type=int)
+    parser.add_argument("--stream-chunk-delay", type=float)
+    parser.add_argument("--prefill-per-kchar", type=float)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - [MOCK] %(message)s")
+    config = MockConfig(
+        latency=args.latency,
+        latency_per_kchar=args.latency_per_kchar,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        chat_404=args.chat_404,
+        responses_schema=args.responses_schema,
+        stream=args.stream,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_chunk_delay=args.stream_chunk_delay,
+        prefill_per_kchar=args.prefill_per_kchar,
+    )
+    logger.info("Mock OpenRouter on http://%s:%d (latency=%s, error_rate=%s, chat_404=%s, stream=%s)",
+                args.host, args.port, config.latency, config.error_rate, config.chat_404, config.stream)
+    make_server(args.host, args.port, create_app(config), threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
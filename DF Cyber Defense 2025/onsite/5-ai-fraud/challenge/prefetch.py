@@ -0,0 +1,94 @@
+"""Speculative warm-up of the redaction cache after /search.
+
+Clients usually follow a search with ``/users/<id>`` for each hit. The
+prefetcher takes the ids a search returned and, off the request path, runs
+the caller-supplied ``warm`` function for each of them, so the follow-up
+requests find their redacted body already cached.
+
+Work is bounded: at most ``max_ids`` ids per search, a fixed-size queue
+(overflow is dropped, never blocks a request) and ids already queued are not
+queued twice. Worker threads start lazily, so forked gunicorn workers get
+their own.
+"""
+import os
+import queue
+import logging
+import threading
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    def __init__(self, warm: Callable[[int, str, str], None], max_ids: int = 10,
+                 queue_size: int = 256, workers: int = 1):
+        self.warm = warm
+        self.max_ids = max(0, max_ids)
+        self.queue_size = max(1, queue_size)
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[Tuple[int, str, str]]" = queue.Queue(self.queue_size)
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+
+    def _ensure_workers(self) -> None:
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._pending = set()
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True) for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+
+    def submit(self, ids: Iterable[object], team_token: str, team_abbr: str, limit: Optional[int] = None) -> int:
+        """Queue the first ``max_ids`` (or ``limit``) distinct integer ids; returns how many were queued."""
+        max_ids = self.max_ids if limit is None else max(0, limit)
+        if max_ids <= 0:
+            return 0
+        self._ensure_workers()
+        queued = 0
+        seen: Set[int] = set()
+        for raw in ids:
+            if len(seen) >= max_ids:
+                break
+            # /search rows are attacker-shaped; only plain integer ids are prefetched
+            if isinstance(raw, bool) or not isinstance(raw, int) or raw in seen:
+                continue
+            seen.add(raw)
+            with self._lock:
+                if raw in self._pending:
+                    continue
+                try:
+                    self._queue.put_nowait((raw, team_token, team_abbr))
+                except queue.Full:
+                    metrics.PREFETCH.labels("dropped").inc()
+                    continue
+                self._pending.add(raw)
+            queued += 1
+        if queued:
+            metrics.PREFETCH.labels("queued").inc(queued)
+        return queued
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            user_id, team_token, team_abbr = q.get()
+            try:
+                self.warm(user_id, team_token, team_abbr)
+                metrics.PREFETCH.labels("warmed").inc()
+            except Exception:
+                metrics.PREFETCH.labels("failed").inc()
+                logger.debug("Prefetch of user %s failed", user_id, exc_info=True)
+            finally:
+                with self._lock:
+                    self._pending.discard(user_id)
@@ -0,0 +1,287 @@
+"""Per-team request rate limiting: a fixed window plus a minimum spacing.
+
+The Redis limiter runs the whole check-and-count as one Lua script, so a
+request costs a single round trip and concurrent workers cannot interleave
+between reading and updating a team's state.
+
+With ``lease_size`` > 1 a worker reserves up to that many requests of a
+team's window in one script call and spends them locally, so Redis is only
+consulted once per lease. Reserved but unspent requests count against the
+window (the limit is never exceeded, only reached early), and the minimum
+spacing is then enforced per worker rather than globally; it is meant for
+high-rate deployments that run with ``RATE_LIMIT_MIN_INTERVAL=0``.
+
+Without Redis, MemoryRateLimiter applies the same rules per process. Teams
+are spread over lock-striped shards so concurrent requests from different
+teams rarely contend, and each shard drops idle teams as it goes so the
+state stays proportional to the teams active in the current window.
+
+InflightLimiter caps how many requests a team has in progress at once, so a
+team holding many slow (redacting) connections cannot occupy every worker
+thread while staying under the request rate. The cap is per team only with
+Redis; without it each worker counts alone and a team can have up to
+``max_inflight`` requests in flight per worker.
+"""
+import os
+import uuid
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# allowed, retry_after seconds, requests counted in the window so far
+Decision = Tuple[bool, float, int]
+
+# KEYS: window counter, last-request timestamp
+# ARGV: now, limit, window seconds, min interval, seconds left in window, requests wanted
+# Returns {granted, retry_after (string: Lua numbers become integers), count}
+_CHECK_LUA = """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local min_interval = tonumber(ARGV[4])
+if min_interval > 0 then
+    local last = tonumber(redis.call('GET', KEYS[2]))
+    if last and now - last < min_interval then
+        return {0, tostring(min_interval - (now - last)), 0}
+    end
+end
+local count = tonumber(redis.call('GET', KEYS[1])) or 0
+if count >= limit then
+    return {0, ARGV[5], count}
+end
+local granted = math.min(tonumber(ARGV[6]), limit - count)
+count = redis.call('INCRBY', KEYS[1], granted)
+if count == granted then
+    redis.call('EXPIRE', KEYS[1], math.ceil(window) + 2)
+end
+if min_interval > 0 then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', math.max(math.ceil(window), math.ceil(min_interval) + 1))
+end
+return {granted, '0', count}
+"""
+
+
+class RedisRateLimiter:
+    def __init__(self, get_redis: Callable[[], Any], prefix: str, limit: int, window_seconds: float,
+                 min_interval: float, lease_size: int = 0):
+        self.get_redis = get_redis
+        self.prefix = prefix
+        self.limit = limit
+        self.window_seconds = max(1.0, float(window_seconds))
+        self.min_interval = min_interval
+        self.lease_size = max(1, lease_size)
+        self._scripts: Dict[int, Any] = {}
+        # team -> [window_id, requests left in the lease, last request, window count at lease time]
+        self._leases: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        # Leases belong to the process that reserved them
+        self._scripts = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _script(self, r: Any) -> Any:
+        # register_script binds to a client; EVALSHA, loading the script on NOSCRIPT
+        script = self._scripts.get(id(r))
+        if script is None:
+            script = self._scripts[id(r)] = r.register_script(_CHECK_LUA)
+        return script
+
+    def check(self, r: Any, team_token: str, now: float) -> Decision:
+        """Count one request for ``team_token``; raises on Redis errors."""
+        window_id = int(now // self.window_seconds)
+        if self.lease_size > 1:
+            decision = self._from_lease(team_token, window_id, now)
+            if decision is not None:
+                return decision
+        retry_after = (window_id + 1) * self.window_seconds - now
+        granted, retry_raw, count = self._script(r)(
+            keys=[f"{self.prefix}:rl:{team_token}:w:{window_id}", f"{self.prefix}:rl:{team_token}:last"],
+            args=[repr(now), self.limit, self.window_seconds, self.min_interval, repr(retry_after), self.lease_size],
+        )
+        granted, count = int(granted), int(count)
+        if granted <= 0:
+            return False, float(retry_raw), count
+        if self.lease_size > 1:
+            with self._lock:
+                # The first of the granted requests is this one
+                self._leases[team_token] = [window_id, granted - 1, now, count]
+        return True, 0.0, count
+
+    def _from_lease(self, team_token: str, window_id: int, now: float) -> Optional[Decision]:
+        with self._lock:
+            lease = self._leases.get(team_token)
+            if lease is None or lease[0] != window_id or lease[1] <= 0:
+                return None
+            since_last = now - lease[2]
+            if since_last < self.min_interval:
+                return False, self.min_interval - since_last, lease[3]
+            lease[1] -= 1
+            lease[2] = now
+            return True, 0.0, lease[3]
+
+
+class _Slot:
+    __slots__ = ("window_id", "count", "last")
+
+    def __init__(self, window_id: int):
+        self.window_id = window_id
+        self.count = 0
+        self.last: Optional[float] = None
+
+
+class _Shard:
+    __slots__ = ("lock", "slots", "swept")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots: Dict[str, _Slot] = {}
+        self.swept = 0.0
+
+
+class MemoryRateLimiter:
+    """Per-process limiter with the Redis limiter's accounting (aligned windows, spacing first)."""
+
+    def __init__(self, limit: int, window_seconds: float, min_interval: float,
+                 shards: int = 16, sweep_seconds: float = 60.0):
+        self.limit = limit
+        self.window_seconds = max(1.0, float(window_seconds))
+        self.min_interval = min_interval
+        self.sweep_seconds = sweep_seconds
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        # A lock held by another thread at fork time would never be released in the child
+        for shard in self._shards:
+            shard.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(shard.slots) for shard in self._shards)
+
+    def check(self, team_token: str, now: float) -> Decision:
+        """Count one request for ``team_token``."""
+        window_id = int(now // self.window_seconds)
+        shard = self._shards[hash(team_token) % len(self._shards)]
+        with shard.lock:
+            if now - shard.swept >= self.sweep_seconds:
+                self._sweep(shard, window_id, now)
+            slot = shard.slots.get(team_token)
+            if slot is None:
+                slot = shard.slots[team_token] = _Slot(window_id)
+            if slot.last is not None and now - slot.last < self.min_interval:
+                return False, self.min_interval - (now - slot.last), 0
+            if slot.window_id != window_id:
+                slot.window_id = window_id
+                slot.count = 0
+            if slot.count >= self.limit:
+                return False, (window_id + 1) * self.window_seconds - now, slot.count
+            slot.count += 1
+            slot.last = now
+            return True, 0.0, slot.count
+
+    def _sweep(self, shard: _Shard, window_id: int, now: float) -> None:
+        # A slot from an earlier window whose spacing has lapsed holds nothing a new one wouldn't
+        shard.swept = now
+        idle = [
+            team for team, slot in shard.slots.items()
+            if slot.window_id != window_id and (slot.last is None or now - slot.last >= self.min_interval)
+        ]
+        for team in idle:
+            del shard.slots[team]
+
+
+# KEYS: the team's in-flight set
+# ARGV: now, max in flight, slot ttl seconds, member
+# Members are scored by expiry so slots of a crashed worker drain on their own
+_ACQUIRE_LUA = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])) + 1)
+return 1
+"""
+
+# (redis client or None, team, member) needed to give a slot back
+Ticket = Tuple[Any, str, str]
+
+
+class InflightLimiter:
+    """At most ``max_inflight`` concurrent requests per team; 0 disables it.
+
+    Shared through a Redis sorted set when a client is given, counted per
+    process otherwise (the effective cap is then ``max_inflight`` x workers; a
+    warning is logged the first time a process falls back). A slot not
+    released within ``ttl`` seconds is dropped.
+    """
+
+    def __init__(self, prefix: str, max_inflight: int, ttl: float = 120.0):
+        self.prefix = prefix
+        self.max_inflight = max_inflight
+        self.ttl = max(1.0, ttl)
+        self._scripts: Dict[int, Any] = {}
+        self._local: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._warned_local = False
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_inflight > 0
+
+    def _reset_after_fork(self) -> None:
+        self._scripts = {}
+        self._local = {}
+        self._lock = threading.Lock()
+        self._warned_local = False
+
+    def acquire(self, r: Any, team_token: str, now: float) -> Tuple[bool, Optional[Ticket]]:
+        """(admitted, ticket to release); raises on Redis errors."""
+        if r is None:
+            if not self._warned_local:
+                self._warned_local = True
+                logger.warning("In-flight limit counted per process (no Redis): up to %d requests per team "
+                               "in pid %d", self.max_inflight, os.getpid())
+            with self._lock:
+                count = self._local.get(team_token, 0)
+                if count >= self.max_inflight:
+                    return False, None
+                self._local[team_token] = count + 1
+            return True, (None, team_token, "")
+        script = self._scripts.get(id(r))
+        if script is None:
+            script = self._scripts[id(r)] = r.register_script(_ACQUIRE_LUA)
+        member = uuid.uuid4().hex
+        if not int(script(keys=[self._key(team_token)], args=[repr(now), self.max_inflight, self.ttl, member])):
+            return False, None
+        return True, (r, team_token, member)
+
+    def release(self, ticket: Ticket) -> None:
+        r, team_token, member = ticket
+        if r is None:
+            with self._lock:
+                count = self._local.get(team_token, 0) - 1
+                if count > 0:
+                    self._local[team_token] = count
+                else:
+                    self._local.pop(team_token, None)
+            return
+        try:
+            r.zrem(self._key(team_token), member)
+        except Exception:
+            # The slot expires after ttl
+            logger.warning("Could not release in-flight slot for team %s", team_token, exc_info=True)
+
+    def _key(self, team_token: str) -> str:
+        return f"{self.prefix}:inflight:{team_token}"
@@ -0,0 +1,461 @@
+"""Redaction engines behind ``AIRedactor``.
+
+``AI_FILTER_BACKEND`` picks one:
+
+- ``openrouter`` (default): the remote model, fails closed without a key.
+- ``local``: pattern rules plus an optional CPU token-classification (NER)
+  model run through ONNX Runtime (``pip install onnxruntime tokenizers``,
+  model directory in ``AI_FILTER_LOCAL_MODEL``); no network dependency.
+  A configured model that fails to load disables the backend (fail closed)
+  rather than leaving the pattern rules alone.
+- ``auto``: OpenRouter when ``OPENROUTER_API_KEY`` is set, else local.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import metrics
+import redaction_rules
+from token_accounting import TokenUsage, cached_prompt_tokens, estimate_tokens, usage_from_response
+
+try:
+    import numpy as np  # type: ignore
+    import onnxruntime as ort  # type: ignore
+    from tokenizers import Tokenizer  # type: ignore
+except Exception:  # pragma: no cover
+    np = None
+    ort = None
+    Tokenizer = None
+
+
+logger = logging.getLogger("ai_filter")
+
+
+class RedactionBackend:
+    """Interface: turn one body into its redacted form, or raise.
+
+    Implementations add the tokens they spent to ``usage`` when given one.
+    """
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def redact(self, text: str, content_type: Optional[str] = None, usage: Optional[TokenUsage] = None) -> str:
+        raise NotImplementedError
+
+    def redact_batch(self, texts: List[str], content_type: Optional[str] = None,
+                     usage: Optional[TokenUsage] = None) -> List[str]:
+        return [self.redact(t, content_type, usage) for t in texts]
+
+
+class OpenRouterBackend(RedactionBackend):
+    """Remote model over the chat.completions API, falling back to /responses."""
+
+    name = "openrouter"
+
+    def __init__(self, base_url: str, api_key: Optional[str], model: str, system_prompt: str,
+                 timeout: float, max_output_tokens: int,
+                 log_prompt: Callable[[str, str, Optional[str]], None] = lambda *a: None,
+                 prompt_cache: bool = False):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.timeout = timeout
+        self.max_output_tokens = max_output_tokens
+        self.log_prompt = log_prompt
+        self.prompt_cache = prompt_cache
+        # The system message never changes, so it is built once. With prompt
+        # caching on it is sent as a content part marked as a cache breakpoint
+        # (honoured by providers that support it, ignored by the rest).
+        if prompt_cache:
+            self._system_message = {
+                "role": "system",
+                "content": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+            }
+        else:
+            self._system_message = {"role": "system", "content": system_prompt}
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def redact(self, text: str, content_type: Optional[str] = None, usage: Optional[TokenUsage] = None) -> str:
+        payload = {
+            "model": self.model,
+            "messages": [
+                self._system_message,
+                {"role": "user", "content": text},
+            ],
+            "temperature": 0.0,
+            "max_tokens": self.max_output_tokens,
+            # Encourage model to keep structure
+            "top_p": 0.9,
+        }
+
+        # Optional detailed prompt logging
+        self.log_prompt("chat.completions", text, content_type)
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "User-Agent": os.getenv("AI_FILTER_USER_AGENT", "CTF-AI-Filter/1.0"),
+            # Optional but nice for OpenRouter analytics
+            "HTTP-Referer": os.getenv("OPENROUTER_REFERRER", "https://ctf.local"),
+            "X-Title": os.getenv("OPENROUTER_TITLE", "CTF AI Filter"),
+        }
+
+        # Try chat.completions first; if not available, fall back to /responses
+        url_cc = f"{self.base_url}/chat/completions"
+
+        start_time = time.time()
+        resp = requests.post(url_cc, headers=headers, data=json.dumps(payload), timeout=self.timeout)
+        request_duration = time.time() - start_time
+        metrics.AI_CALL_SECONDS.labels("chat.completions", str(resp.status_code)).observe(request_duration)
+
+        logger.info("AI API RESPONSE - status=%d, duration=%.2fs", resp.status_code, request_duration,
+                    extra={"ai": {"event": "response", "status": resp.status_code, "duration": request_duration}})
+        if resp.status_code == 404 or resp.status_code == 405:
+            # Fallback to unified Responses API
+            metrics.AI_FALLBACK.inc()
+            url_resp = f"{self.base_url}/responses"
+            payload2 = {
+                "model": self.model,
+                "input": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": text},
+                ],
+                "temperature": 0.0,
+                "max_output_tokens": self.max_output_tokens,
+            }
+
+            self.log_prompt("responses", text, content_type)
+
+            start_time = time.time()
+            resp = requests.post(url_resp, headers=headers, data=json.dumps(payload2), timeout=self.timeout)
+            request_duration = time.time() - start_time
+            metrics.AI_CALL_SECONDS.labels("responses", str(resp.status_code)).observe(request_duration)
+
+            logger.info("AI API RESPONSE (fallback) - status=%d, duration=%.2fs", resp.status_code, request_duration,
+                        extra={"ai": {"event": "response", "fallback": True, "status": resp.status_code,
+                                      "duration": request_duration}})
+
+        resp.raise_for_status()
+
+        content_type_header = (resp.headers.get('content-type') or '').lower()
+        if 'json' not in content_type_header:
+            raise RuntimeError("AI redaction returned non-JSON response")
+
+        try:
+            data = resp.json()
+        except ValueError as exc:
+            raise RuntimeError("AI redaction returned invalid JSON") from exc
+
+        content = extract_content(data)
+        if content is None:
+            raise RuntimeError("AI redaction returned no usable content")
+        cached = cached_prompt_tokens(data)
+        if cached:
+            metrics.AI_CACHED_PROMPT_TOKENS.inc(cached)
+        if usage is not None:
+            reported = usage_from_response(data)
+            if reported is not None:
+                usage.add(*reported)
+            else:
+                # Provider omitted usage; estimate so accounting never reads zero
+                usage.add(estimate_tokens(self.system_prompt) + estimate_tokens(text),
+                          estimate_tokens(content), estimated=True)
+        return content
+
+
+def extract_content(data: Any) -> Optional[str]:
+    """Pull the model output out of any of the accepted response schemas."""
+    # 1) OpenAI-compatible chat.completions
+    if isinstance(data, dict) and data.get("choices"):
+        choice = (data.get("choices") or [{}])[0]
+        message = choice.get("message") or {}
+        content = message.get("content")
+        if isinstance(content, str) and content.strip():
+            return content
+
+    # 2) Responses API with output_text
+    content = data.get("output_text")
+    if isinstance(content, str) and content.strip():
+        return content
+
+    # 3) Responses API with output[].content[].text
+    try:
+        output = data.get("output") or []
+        if output:
+            parts = output[0].get("content") or []
+            texts = [p.get("text", "") for p in parts if isinstance(p, dict)]
+            joined = "".join(texts).strip()
+            if joined:
+                return joined
+    except Exception:
+        pass
+    return None
+
+
+class _MicroBatcher:
+    """Coalesce concurrent NER calls into one model run.
+
+    Callers block until their slice of the batch is done; the worker thread
+    is (re)started lazily so it also exists in forked gunicorn workers.
+    """
+
+    def __init__(self, fn: Callable[[List[str]], List[List[Tuple[int, int]]]], max_batch: int, max_wait: float):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="local-redactor-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, items: List[str]) -> List[List[Tuple[int, int]]]:
+        if not items:
+            return []
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((items, fut))
+        return fut.result()
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            pending = [q.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            flat = [s for items, _ in pending for s in items]
+            try:
+                spans: List[List[Tuple[int, int]]] = []
+                for i in range(0, len(flat), self.max_batch):
+                    spans.extend(self.fn(flat[i:i + self.max_batch]))
+            except Exception as exc:
+                for _, fut in pending:
+                    fut.set_exception(exc)
+                continue
+            offset = 0
+            for items, fut in pending:
+                fut.set_result(spans[offset:offset + len(items)])
+                offset += len(items)
+
+
+class OnnxTokenClassifier:
+    """Small token-classification model (e.g. a distilled PII NER) on CPU.
+
+    ``model_dir`` holds ``model.onnx``, a HuggingFace ``tokenizer.json`` and
+    ``config.json`` with ``id2label``.
+    """
+
+    def __init__(self, model_dir: str, threads: int, max_length: int, labels: Optional[List[str]] = None):
+        if ort is None or Tokenizer is None or np is None:
+            raise RuntimeError("onnxruntime, tokenizers and numpy are required for the local NER model")
+        path = Path(model_dir)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path / "model.onnx"), opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        # Longer strings overflow into further windows, overlapping so a value at a boundary is seen whole
+        self.tokenizer.enable_truncation(max_length, stride=min(16, max_length // 4))
+        with (path / "config.json").open("r", encoding="utf-8") as fh:
+            id2label = json.load(fh).get("id2label") or {}
+        self.id2label: Dict[int, str] = {int(k): v for k, v in id2label.items()}
+        wanted = {l.strip().upper() for l in (labels or []) if l.strip()}
+        # Indices of labels that mean "sensitive"; default: everything but O
+        self.sensitive = {
+            i for i, label in self.id2label.items()
+            if label.upper() != "O" and (not wanted or label.upper().split("-", 1)[-1] in wanted)
+        }
+
+    def spans(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        """Sensitive character spans per text, classified ``max_length`` tokens at a time."""
+        windows = []
+        for idx, enc in enumerate(self.tokenizer.encode_batch(texts)):
+            windows.append((idx, enc))
+            windows.extend((idx, extra) for extra in enc.overflowing)
+        found: List[List[Tuple[int, int]]] = [[] for _ in texts]
+        for (idx, enc), preds in zip(windows, self._predict([enc for _, enc in windows])):
+            for (start, end), pred, mask in zip(enc.offsets, preds, enc.attention_mask):
+                if mask and start != end and int(pred) in self.sensitive:
+                    found[idx].append((start, end))
+        return [_merge_spans(spans) for spans in found]
+
+    def _predict(self, encodings: List[Any]) -> List[List[int]]:
+        """Label id per token for each encoding, run as one padded batch."""
+        width = max(len(e.ids) for e in encodings)
+
+        def padded(rows: List[List[int]]) -> Any:
+            return np.array([list(r) + [0] * (width - len(r)) for r in rows], dtype=np.int64)
+
+        feeds = {
+            "input_ids": padded([e.ids for e in encodings]),
+            "attention_mask": padded([e.attention_mask for e in encodings]),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = padded([e.type_ids for e in encodings])
+        logits = self.session.run(None, feeds)[0]
+        return logits.argmax(axis=-1).tolist()
+
+
+def _merge_spans(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # Overlapping windows report some tokens twice; adjacent tokens form one span
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start - merged[-1][1] <= 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _mask_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + redaction_rules.MASK + text[end:]
+    return text
+
+
+class LocalBackend(RedactionBackend):
+    """Pattern rules, then an optional NER model over whatever they left.
+
+    JSON values the model flags are masked whole (same policy as the prompt);
+    in free text only the flagged spans are masked.
+    """
+
+    name = "local"
+
+    def __init__(self, model_dir: Optional[str] = None, threads: int = 1, batch_size: int = 32,
+                 batch_wait: float = 0.002, max_length: int = 128, labels: Optional[List[str]] = None):
+        self.model_dir = model_dir
+        self.classifier: Optional[OnnxTokenClassifier] = None
+        # Set when a configured model failed to load; redaction then fails closed
+        self.error: Optional[str] = None
+        if model_dir:
+            try:
+                self.classifier = OnnxTokenClassifier(model_dir, threads, max_length, labels)
+                logger.info("Local redaction model loaded from %s (threads=%d, batch=%d)", model_dir, threads, batch_size)
+            except Exception as exc:
+                logger.exception("Local redaction model unavailable at %s; local redaction disabled", model_dir)
+                self.error = f"local redaction model unavailable at {model_dir}: {exc}"
+        self._batcher = _MicroBatcher(self.classifier.spans, batch_size, batch_wait) if self.classifier else None
+
+    @property
+    def available(self) -> bool:
+        return self.error is None
+
+    def _ner(self, strings: List[str]) -> List[List[Tuple[int, int]]]:
+        if self._batcher is None:
+            return [[] for _ in strings]
+        return self._batcher.submit(strings)
+
+    def redact(self, text: str, content_type: Optional[str] = None, usage: Optional[TokenUsage] = None) -> str:
+        return self.redact_batch([text], content_type, usage)[0]
+
+    def redact_batch(self, texts: List[str], content_type: Optional[str] = None,
+                     usage: Optional[TokenUsage] = None) -> List[str]:
+        if self.error:
+            raise RuntimeError(self.error)
+        # Rules first, then one NER pass over every remaining string in all bodies
+        docs: List[Any] = []
+        leaves: List[Tuple[int, Any, Any]] = []
+        for idx, text in enumerate(texts):
+            parsed = None
+            if (content_type or "").endswith("json") or text.lstrip()[:1] in {"{", "["}:
+                try:
+                    parsed = redaction_rules.redact_value(json.loads(text))
+                except ValueError:
+                    parsed = None
+            if parsed is None:
+                lines = redaction_rules.redact_inline(text).split("\n")
+                docs.append(("text", lines))
+                leaves.extend((idx, lines, i) for i, line in enumerate(lines) if line.strip())
+            else:
+                docs.append(("json", parsed))
+                leaves.extend(_string_leaves(idx, parsed))
+
+        spans = self._ner([container[key] for _, container, key in leaves])
+        for (idx, container, key), found in zip(leaves, spans):
+            if not found:
+                continue
+            if docs[idx][0] == "json":
+                container[key] = redaction_rules.MASK
+            else:
+                container[key] = _mask_spans(container[key], found)
+
+        out = []
+        for kind, doc in docs:
+            out.append(json.dumps(doc, ensure_ascii=False) if kind == "json" else "\n".join(doc))
+        if usage is not None:
+            # No provider tokens; account the equivalent load so budgets stay comparable
+            usage.add(sum(estimate_tokens(t) for t in texts), sum(estimate_tokens(t) for t in out), estimated=True)
+        return out
+
+
+def _string_leaves(idx: int, obj: Any) -> List[Tuple[int, Any, Any]]:
+    found: List[Tuple[int, Any, Any]] = []
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        items = node.items() if isinstance(node, dict) else enumerate(node) if isinstance(node, list) else ()
+        for key, value in items:
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+            elif isinstance(value, str) and value != redaction_rules.MASK and value.strip():
+                found.append((idx, node, key))
+    return found
+
+
+def build_backend(name: str, *, api_key: Optional[str], **remote: Any) -> RedactionBackend:
+    name = (name or "openrouter").lower()
+    if name == "auto":
+        name = "openrouter" if api_key else "local"
+    if name == "local":
+        labels = os.getenv("AI_FILTER_LOCAL_LABELS", "")
+        return LocalBackend(
+            model_dir=os.getenv("AI_FILTER_LOCAL_MODEL") or None,
+            threads=int(os.getenv("AI_FILTER_LOCAL_THREADS", "1")),
+            batch_size=int(os.getenv("AI_FILTER_LOCAL_BATCH_SIZE", "32")),
+            batch_wait=float(os.getenv("AI_FILTER_LOCAL_BATCH_WAIT_MS", "2")) / 1000.0,
+            max_length=int(os.getenv("AI_FILTER_LOCAL_MAX_LENGTH", "128")),
+            labels=labels.split(",") if labels else None,
+        )
+    if name != "openrouter":
+        logger.warning("Unknown AI_FILTER_BACKEND=%r; using openrouter", name)
+    return OpenRouterBackend(api_key=api_key, **remote)
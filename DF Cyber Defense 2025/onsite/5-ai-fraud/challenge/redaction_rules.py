@@ -0,0 +1,102 @@
+import json
+import re
+from typing import Any, Optional
+
+
+MASK = "********"
+
+# Mirrors the key/pattern policy spelled out in ai_filter._default_system_prompt()
+SENSITIVE_KEYS = {
+    "ssn", "credit_card_number", "credit_card_cvv", "credit_card_exp", "cvc", "cvv",
+    "secret_key", "api_key", "api_token", "token", "jwt", "password", "passcode", "pin", "otp",
+    "bank_account", "bank_account_number", "iban", "routing_number",
+    "phone", "email",
+}
+SENSITIVE_KEY_PARTS = (
+    "card", "cvc", "cvv", "exp", "expiry", "secret", "token", "key", "auth", "pass",
+    "otp", "pin", "iban", "account", "routing",
+)
+
+_PAN_RE = re.compile(r"(?<![\w-])\d(?:[ -]?\d){12,18}(?![\w-])")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?<![\w])\+?\d[\d\s().-]{8,}\d(?![\w])")
+_FLAG_RE = re.compile(r"CBJS_SECRET_\w*")
+_PREFIX_TOKEN_RE = re.compile(r"(?<![\w])(?:sk-|pk_|tg_|jwt )[\w+/=.-]+")
+_HEX_RE = re.compile(r"(?<![0-9A-Fa-f])[0-9A-Fa-f]{20,}(?![0-9A-Fa-f])")
+_LONG_TOKEN_RE = re.compile(r"(?<![\w+/=])(?=[A-Za-z0-9+/=_-]*\d)(?=[A-Za-z0-9+/=_-]*[A-Za-z])[A-Za-z0-9+/=_-]{16,}")
+_ADJACENT_RE = re.compile(
+    r"(?i)\b(cvv|cvc|exp|expiry|exp_date)(\s*[:=]?\s*)(\d{3,4}|\d{1,2}/\d{2,4})\b"
+)
+
+_VALUE_PATTERNS = (_FLAG_RE, _EMAIL_RE, _PREFIX_TOKEN_RE, _PAN_RE, _HEX_RE, _LONG_TOKEN_RE)
+
+
+def _phone_sub(match: "re.Match[str]") -> str:
+    # Dates like 1991-06-15 share the shape; phones need 10+ digits
+    digits = sum(ch.isdigit() for ch in match.group(0))
+    return MASK if digits >= 10 else match.group(0)
+
+
+def _has_phone(value: str) -> bool:
+    return any(_phone_sub(m) == MASK for m in _PHONE_RE.finditer(value))
+
+
+def is_sensitive_key(key: str) -> bool:
+    k = (key or "").lower()
+    if k in SENSITIVE_KEYS:
+        return True
+    return any(part in k for part in SENSITIVE_KEY_PARTS)
+
+
+def is_sensitive_value(value: Any) -> bool:
+    if isinstance(value, bool) or value is None:
+        return False
+    if isinstance(value, (int, float)):
+        value = str(value)
+    if not isinstance(value, str):
+        return False
+    return any(p.search(value) for p in _VALUE_PATTERNS) or _has_phone(value)
+
+
+def redact_inline(text: str) -> str:
+    """Mask pattern matches inside free-form text."""
+    out = _ADJACENT_RE.sub(lambda m: f"{m.group(1)}{m.group(2)}{MASK}", text)
+    for pattern in _VALUE_PATTERNS:
+        out = pattern.sub(MASK, out)
+    return _PHONE_RE.sub(_phone_sub, out)
+
+
+def redact_value(obj: Any, key: Optional[str] = None) -> Any:
+    if key is not None and is_sensitive_key(key):
+        # Sensitive keys mask every leaf below them, keeping container shape
+        if isinstance(obj, dict):
+            return {k: redact_value(v, key) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [redact_value(v, key) for v in obj]
+        return MASK
+    if isinstance(obj, dict):
+        return {k: redact_value(v, k) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [redact_value(v) for v in obj]
+    if is_sensitive_value(obj):
+        return MASK
+    return obj
+
+
+def redact(text: str, content_type: Optional[str] = None) -> str:
+    """Rule-based stand-in for the model: same key and pattern policy, no network.
+
+    JSON input (by content type or by shape) is walked structurally; anything
+    else gets inline pattern masking.
+    """
+    if not isinstance(text, str):
+        return text
+    stripped = text.lstrip()
+    if (content_type or "").endswith("json") or stripped[:1] in {"{", "["}:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            pass
+        else:
+            return json.dumps(redact_value(data), ensure_ascii=False)
+    return redact_inline(text)
@@ -0,0 +1,73 @@
+"""Process-wide Redis client shared by app.py and ai_filter.py.
+
+The connection pool is created lazily on first use and again in every forked
+child, so ``gunicorn --preload`` never shares sockets across workers. Failed
+connects are remembered for ``REDIS_RETRY_SECONDS`` instead of being retried
+(and logged) on every request.
+"""
+import os
+import time
+import logging
+from threading import Lock
+from typing import Optional
+
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "30"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+_lock = Lock()
+_client = None
+_pid: Optional[int] = None
+_failed_at: Optional[float] = None
+
+
+def _reset_after_fork() -> None:
+    global _lock, _client, _pid, _failed_at
+    # The parent's lock may have been held mid-fork; never inherit it
+    _lock = Lock()
+    _client = None
+    _pid = None
+    _failed_at = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_redis():
+    """Return the shared client, or None when Redis is not configured/reachable."""
+    global _client, _pid, _failed_at
+    if not REDIS_URL or redis is None:
+        return None
+    pid = os.getpid()
+    if _client is not None and _pid == pid:
+        return _client
+    with _lock:
+        if _client is not None and _pid == pid:
+            return _client
+        if _failed_at is not None and _pid == pid and (time.time() - _failed_at) < REDIS_RETRY_SECONDS:
+            return None
+        _pid = pid
+        try:
+            pool = redis.ConnectionPool.from_url(
+                REDIS_URL, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS
+            )
+            client = redis.Redis(connection_pool=pool)
+            client.ping()
+        except Exception:
+            logger.exception("Redis unavailable at %s; retrying in %.0fs", REDIS_URL, REDIS_RETRY_SECONDS)
+            _client = None
+            _failed_at = time.time()
+            return None
+        logger.info("Connected Redis at %s (pid %d)", REDIS_URL, pid)
+        _client = client
+        _failed_at = None
+        return _client
@@ -0,0 +1,142 @@
+"""Priority + weighted-fair admission in front of upstream redaction calls.
+
+At most ``max_concurrency`` calls run at once per process. When a slot frees,
+the next waiter is picked by:
+
+1. priority class (``INTERACTIVE`` < ``BULK`` < ``BACKGROUND``), where a
+   waiter is promoted one class for every ``aging_seconds`` it has waited, so
+   low classes cannot starve;
+2. within a class, self-clocked weighted fair queuing between teams: each
+   call is stamped with a virtual finish time ``max(V, F_team) + cost/weight``
+   so one heavy team's backlog interleaves with everyone else's instead of
+   running ahead of it.
+"""
+import time
+import itertools
+from contextlib import contextmanager
+from threading import Condition
+from typing import Dict, Iterator, List, Optional
+
+import metrics
+
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+
+class SchedulerTimeout(RuntimeError):
+    pass
+
+
+class _Waiter:
+    __slots__ = ("priority", "team", "finish", "seq", "enqueued", "granted")
+
+    def __init__(self, priority: int, team: str, finish: float, seq: int):
+        self.priority = priority
+        self.team = team
+        self.finish = finish
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    """``"AAA=2,BBB=0.5"`` -> ``{"AAA": 2.0, "BBB": 0.5}``."""
+    weights: Dict[str, float] = {}
+    for item in (raw or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            try:
+                weights[name.strip()] = max(0.01, float(value))
+            except ValueError:
+                continue
+    return weights
+
+
+class UpstreamScheduler:
+    def __init__(self, max_concurrency: int, aging_seconds: float = 2.0, max_wait: float = 30.0,
+                 team_weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max(0, max_concurrency)
+        self.aging_seconds = aging_seconds
+        self.max_wait = max_wait
+        self.team_weights = team_weights or {}
+        self._cond = Condition()
+        self._running = 0
+        self._waiting: List[_Waiter] = []
+        self._virtual_time = 0.0
+        self._team_finish: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _effective_class(self, waiter: _Waiter, now: float) -> int:
+        if self.aging_seconds <= 0:
+            return waiter.priority
+        promoted = int((now - waiter.enqueued) // self.aging_seconds)
+        return max(INTERACTIVE, waiter.priority - promoted)
+
+    def _grant_next(self) -> None:
+        # Called with the condition held
+        if not self._waiting or self._running >= self.max_concurrency:
+            return
+        now = time.monotonic()
+        best = min(self._waiting, key=lambda w: (self._effective_class(w, now), w.finish, w.seq))
+        self._waiting.remove(best)
+        best.granted = True
+        self._running += 1
+        self._virtual_time = max(self._virtual_time, best.finish)
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = BULK, team: str = "", cost: float = 1.0) -> Iterator[None]:
+        """Hold one upstream slot for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        started = time.monotonic()
+        with self._cond:
+            weight = self.team_weights.get(team, 1.0)
+            previous = self._team_finish.get(team, 0.0)
+            start_tag = max(self._virtual_time, previous)
+            finish = start_tag + max(1.0, cost) / weight
+            self._team_finish[team] = finish
+            waiter = _Waiter(priority, team, finish, next(self._seq))
+            self._waiting.append(waiter)
+            self._grant_next()
+            deadline = started + self.max_wait
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(waiter)
+                    self._refund(waiter, finish - start_tag, previous)
+                    raise SchedulerTimeout(f"no upstream slot within {self.max_wait:.1f}s")
+                self._cond.wait(remaining)
+        metrics.AI_QUEUE_WAIT_SECONDS.labels(PRIORITY_NAMES.get(priority, str(priority))).observe(
+            time.monotonic() - started
+        )
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._grant_next()
+
+    def _refund(self, waiter: _Waiter, charge: float, previous: float) -> None:
+        # Called with the condition held: the call never ran, so its team is not
+        # charged for it; the team's calls queued behind it move up by as much
+        if self._team_finish.get(waiter.team) == waiter.finish:
+            self._team_finish[waiter.team] = previous
+            return
+        for other in self._waiting:
+            if other.team == waiter.team and other.finish > waiter.finish:
+                other.finish -= charge
+        self._team_finish[waiter.team] -= charge
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {"running": self._running, "waiting": len(self._waiting)}
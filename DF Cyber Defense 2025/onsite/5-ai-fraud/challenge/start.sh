@@ -16,6 +16,10 @@ GUNICORN_TIMEOUT=${GUNICORN_TIMEOUT:-120}
 GUNICORN_KEEPALIVE=${GUNICORN_KEEPALIVE:-5}
 GUNICORN_MAX_REQUESTS=${GUNICORN_MAX_REQUESTS:-1000}
 GUNICORN_MAX_REQUESTS_JITTER=${GUNICORN_MAX_REQUESTS_JITTER:-100}
+# Opt in to import the app once in the master; workers then share it
+# copy-on-write and rebuild their redactor/Redis pool lazily after fork
+GUNICORN_PRELOAD=${GUNICORN_PRELOAD:-false}
+PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}
 
 log "Starting AI Fraud app"
 log "DB_PATH=$DB_PATH"
@@ -34,9 +38,21 @@ else
   log "[init] /app/init.sql not found; skipping DB seed"
 fi
 
+# Fresh multiprocess metrics store so /metrics aggregates only this run's workers
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+export PROMETHEUS_MULTIPROC_DIR
+
+PRELOAD_FLAG=""
+case "$GUNICORN_PRELOAD" in
+  1|true|yes|on) PRELOAD_FLAG="--preload" ;;
+esac
+
 # Run the application via gunicorn
-log "Launching gunicorn on ${GUNICORN_BIND} (workers=${GUNICORN_WORKERS}, threads=${GUNICORN_THREADS})"
+log "Launching gunicorn on ${GUNICORN_BIND} (workers=${GUNICORN_WORKERS}, threads=${GUNICORN_THREADS}, preload=${GUNICORN_PRELOAD})"
 exec gunicorn \
+  $PRELOAD_FLAG \
+  -c /app/gunicorn.conf.py \
   -w "$GUNICORN_WORKERS" \
   -k "$GUNICORN_CLASS" \
   --threads "$GUNICORN_THREADS" \
@@ -0,0 +1,66 @@
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# The challenge modules are flat files next to this directory
+CHALLENGE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(CHALLENGE_DIR))
+
+TEAMS = [
+    {"token": "TEAM-aaa", "abbr": "AAA", "full_name": "Team A"},
+    {"token": "TEAM-bbb", "abbr": "BBB", "full_name": "Team B"},
+]
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    from mock_openrouter import MockServer
+
+    with MockServer() as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def app_module(mock_server, tmp_path_factory):
+    """app.py imported once against the mock model, a seeded database and two teams.
+
+    app.py reads its settings at import; tests change the module-level flags
+    they exercise with monkeypatch.
+    """
+    root = tmp_path_factory.mktemp("app")
+    db_path = root / "db.sqlite3"
+    conn = sqlite3.connect(db_path)
+    conn.executescript((CHALLENGE_DIR / "init.sql").read_text(encoding="utf-8"))
+    conn.close()
+    tokens_path = root / "team_tokens.json"
+    tokens_path.write_text(json.dumps(TEAMS), encoding="utf-8")
+    os.environ.update({
+        "DB_PATH": str(db_path),
+        "TEAM_TOKENS_PATH": str(tokens_path),
+        "JWT_SECRET": "test-secret",
+        "OPENROUTER_BASE_URL": mock_server.base_url,
+        "OPENROUTER_API_KEY": "test",
+        "AI_FILTER_LOG_REQUESTS": "false",
+        "RATE_LIMIT_MIN_INTERVAL": "0",
+        "RATE_LIMIT_MAX_REQUESTS": "100000",
+    })
+    for name in ("REDIS_URL", "PROMETHEUS_MULTIPROC_DIR"):
+        os.environ.pop(name, None)
+    import app
+
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    resp = client.post("/auth", json={"token": "TEAM-aaa"})
+    return {"Authorization": "Bearer " + resp.get_json()["jwt"], "Accept": "application/json"}
@@ -0,0 +1,205 @@
+import os
+import threading
+
+import ai_cache
+
+
+class RecordingRedis:
+    """Just enough of a redis client for RedisTier.get: values plus a log of pipelined writes."""
+
+    def __init__(self, values):
+        self.values = values
+        self.writes = []
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def zincrby(self, name, amount, member):
+        self.writes.append(("zincrby", amount, member))
+
+    def zremrangebyrank(self, name, start, end):
+        self.writes.append(("zremrangebyrank",))
+
+    def execute(self):
+        return []
+
+
+def redis_tier(hit_sample):
+    client = RecordingRedis({"p:aicache2:json-abc": "1700000000\ncached"})
+    return ai_cache.RedisTier(lambda: client, "p", 60, hit_sample), client
+
+
+def test_redis_hits_are_not_recorded_by_default():
+    tier, client = redis_tier(0)
+    for _ in range(50):
+        assert tier.get("json-abc") == "cached"
+    assert client.writes == []
+
+
+def test_redis_hits_are_sampled_and_weighted(monkeypatch):
+    tier, client = redis_tier(10)
+    rolls = iter([0.5, 0.05, 0.99])
+    monkeypatch.setattr(ai_cache.random, "random", lambda: next(rolls))
+    for _ in range(3):
+        tier.get("json-abc")
+    assert client.writes == [("zincrby", 10, "json-abc"), ("zremrangebyrank",)]
+
+
+def test_redis_misses_never_write():
+    tier, client = redis_tier(1)
+    assert tier.get("json-missing") is None
+    assert client.writes == []
+
+
+def test_memory_lfu_evicts_least_used():
+    tier = ai_cache.MemoryTier(2, 60, "lfu")
+    tier.set("json-a", "a")
+    tier.set("json-b", "b")
+    tier.get("json-a")
+    tier.set("json-c", "c")
+    assert tier.get("json-a") == "a"
+    assert tier.get("json-b") is None
+
+
+def test_memory_fifo_ignores_reads():
+    tier = ai_cache.MemoryTier(2, 60, "fifo")
+    tier.set("json-a", "a")
+    tier.set("json-b", "b")
+    tier.get("json-a")
+    tier.set("json-c", "c")
+    assert tier.get("json-a") is None
+    assert tier.get("json-b") == "b"
+
+
+def test_memory_purge_by_tag_and_stats():
+    tier = ai_cache.MemoryTier(10, 60)
+    tier.set("json-a", "aa")
+    tier.set("html-b", "b")
+    tier.get("json-a")
+    stats = tier.stats(top=5)
+    assert stats["entries"] == 2
+    assert stats["top_keys"] == [{"key": "json-a", "hits": 1}]
+    assert tier.purge("json") == 1
+    assert tier.get("json-a") is None
+    assert tier.get("html-b") == "b"
+
+
+def test_admin_cache_endpoints(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "admin")
+    assert client.get("/admin/cache").status_code == 401
+    assert client.get("/admin/cache", headers={"Authorization": "Bearer ädmin"}).status_code == 401
+    headers = {"Authorization": "Bearer admin"}
+    assert client.get("/admin/cache", headers=headers).get_json()["primary"] == "memory"
+    resp = client.post("/admin/cache/purge", json={"older_than": "x"}, headers=headers)
+    assert resp.status_code == 400
+    resp = client.post("/admin/cache/purge", json={"content_type": "application/json"}, headers=headers)
+    assert resp.get_json()["status"] == "ok"
+    assert client.put("/admin/cache/settings", json={"policy": "nope"}, headers=headers).status_code == 400
+
+
+def test_disk_tier_round_trip_and_purge(tmp_path):
+    tier = ai_cache.DiskTier(str(tmp_path), 60)
+    tier.set("json-" + "a" * 64, "value")
+    tier.set("html-" + "b" * 64, "other")
+    assert tier.get("json-" + "a" * 64) == "value"
+    assert tier.stats()["entries"] == 2
+    assert tier.purge("json") == 1
+    assert tier.get("json-" + "a" * 64) is None
+    assert tier.get("html-" + "b" * 64) == "other"
+
+
+def test_build_primary_tier_falls_back_to_memory(tmp_path):
+    memory = ai_cache.MemoryTier(1, 1)
+    assert ai_cache.build_primary_tier("auto", memory, get_redis=lambda: None) is memory
+    assert ai_cache.build_primary_tier("redis", memory, get_redis=lambda: None) is memory
+    assert ai_cache.build_primary_tier("disk", memory, disk_path=str(tmp_path)).name == "disk"
+
+
+class StoreRedis:
+    """Just enough of a redis client for RedisTier set/purge/stats; pipelines run on execute."""
+
+    def __init__(self):
+        self.values = {}
+        self.scanned = 0
+        self._queued = []
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def scan_iter(self, match, count):
+        prefix = match.rstrip("*")
+        for key in list(self.values):
+            if key.startswith(prefix):
+                self.scanned += 1
+                yield key
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def getrange(self, key, start, end):
+        self._queued.append(self.values.get(key, "")[start:end + 1])
+
+    def strlen(self, key):
+        self._queued.append(len(self.values.get(key, "")))
+
+    def execute(self):
+        out, self._queued = self._queued, []
+        return out
+
+    def delete(self, *keys):
+        return sum(self.values.pop(k, None) is not None for k in keys)
+
+    def zrevrange(self, name, start, end, withscores=False):
+        return []
+
+
+def test_redis_purge_by_age_uses_the_write_time_not_the_ttl(monkeypatch):
+    client = StoreRedis()
+    tier = ai_cache.RedisTier(lambda: client, "p", 600)
+    monkeypatch.setattr(ai_cache.time, "time", lambda: 1000.0)
+    tier.set("json-old", "a")
+    monkeypatch.setattr(ai_cache.time, "time", lambda: 1090.0)
+    tier.set("json-new", "b")
+    # A TTL change after the writes must not change their age
+    tier.configure(ttl=60)
+    monkeypatch.setattr(ai_cache.time, "time", lambda: 1100.0)
+    assert tier.purge(older_than=50) == 1
+    assert tier.get("json-old") is None
+    assert tier.get("json-new") == "b"
+
+
+def test_redis_stats_scan_is_capped(monkeypatch):
+    client = StoreRedis()
+    tier = ai_cache.RedisTier(lambda: client, "p", 60)
+    monkeypatch.setattr(ai_cache.RedisTier, "STATS_MAX_SCAN", 5)
+    for i in range(20):
+        tier.set(f"json-{i}", "x")
+    stats = tier.stats()
+    assert stats["entries"] == 5 and stats["truncated"]
+    assert client.scanned == 5
+
+
+def test_cache_lookups_do_not_poll_the_control_record(app_module, monkeypatch):
+    from ai_filter import get_redactor
+
+    redactor = get_redactor()
+    polls = []
+    monkeypatch.setattr(redactor.cache_control, "poll", lambda force=False: polls.append(force))
+    for _ in range(5):
+        redactor._cache_get("json-missing")
+    assert polls == []
+    assert redactor.cache_control._watcher_pid == os.getpid()
+
+
+def test_control_watcher_applies_on_a_timer():
+    control = ai_cache.CacheControl(None, "p", poll_seconds=0.01)
+    applied = threading.Event()
+    control.watch(applied.set)
+    control.watch(lambda: None)  # already running in this process
+    assert applied.wait(5)
@@ -0,0 +1,46 @@
+import json
+import logging
+import queue
+
+from ai_logging import DeferredQueueHandler, JsonFormatter, PromptSampler, Truncated
+
+
+def make_record(msg, **extra):
+    record = logging.LogRecord("ai_filter", logging.INFO, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_truncated_keeps_short_text_and_marks_cuts():
+    assert str(Truncated("abc", 10)) == "abc"
+    assert str(Truncated("abc", 0)) == "abc"
+    assert str(Truncated(None, 10)) == ""
+    assert str(Truncated("abcdef", 2)) == "ab... [truncated 4 chars]"
+
+
+def test_prompt_sampler_lets_one_in_n_through():
+    assert all(PromptSampler(1)() for _ in range(5))
+    assert all(PromptSampler(0)() for _ in range(5))
+    sampler = PromptSampler(3)
+    assert [sampler() for _ in range(6)] == [True, False, False, True, False, False]
+
+
+def test_json_formatter_flattens_ai_fields():
+    record = make_record("call", ai={"model": "m", "prompt": Truncated("abcdef", 2)})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "call"
+    assert entry["model"] == "m"
+    assert entry["prompt"] == "ab... [truncated 4 chars]"
+
+
+def test_deferred_handler_does_not_format_or_block():
+    q = queue.Queue(1)
+    handler = DeferredQueueHandler(q)
+    prompt = Truncated("x" * 100, 10)
+    handler.emit(make_record("first %s", ai={"prompt": prompt}))
+    # Full queue: the record is dropped rather than blocking the caller
+    handler.emit(make_record("second"))
+    record = q.get_nowait()
+    assert record.msg == "first %s"
+    assert record.ai["prompt"] is prompt
+    assert q.empty()
@@ -0,0 +1,64 @@
+import json
+import os
+import time
+
+from auth_cache import ClaimsCache, TeamTokenFile
+
+
+def load(path):
+    try:
+        return {t["token"]: t for t in json.loads(path.read_text(encoding="utf-8"))}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_tokens(path, *tokens, mtime=None):
+    path.write_text(json.dumps([{"token": t} for t in tokens]), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_claims_cache_expiry_generation_and_bound():
+    cache = ClaimsCache(size=2)
+    future = time.time() + 60
+    a, b, c = (ClaimsCache.digest(t) for t in ("a", "b", "c"))
+    cache.put(a, 0, {"exp": future, "sub": "a"}, {"token": "a"})
+    assert cache.get(a, 0) == ({"exp": future, "sub": "a"}, {"token": "a"})
+    assert cache.get(a, 1) is None
+    assert cache.get(a, 0) is None  # dropped by the generation miss
+    cache.put(a, 0, {"exp": time.time() - 1}, {})
+    assert cache.get(a, 0) is None
+    cache.put(a, 0, {}, {})
+    assert cache.get(a, 0) is None  # no exp, never cached
+    for d in (a, b, c):
+        cache.put(d, 0, {"exp": future}, {})
+    assert cache.get(a, 0) is None
+    assert cache.get(c, 0) is not None
+
+
+def test_team_token_file_reloads_and_bumps_generation(tmp_path):
+    path = tmp_path / "tokens.json"
+    write_tokens(path, "TEAM-aaa", mtime=1000)
+    tokens = TeamTokenFile(path, load, reload_seconds=0.001)
+    assert tokens.current() == ({"TEAM-aaa": {"token": "TEAM-aaa"}}, 0)
+    time.sleep(0.01)
+    assert tokens.current()[1] == 0  # unchanged file
+    write_tokens(path, "TEAM-bbb", mtime=2000)
+    time.sleep(0.01)
+    assert tokens.current() == ({"TEAM-bbb": {"token": "TEAM-bbb"}}, 1)
+
+
+def test_team_token_file_keeps_old_map_on_a_bad_read(tmp_path):
+    path = tmp_path / "tokens.json"
+    write_tokens(path, "TEAM-aaa", mtime=1000)
+    tokens = TeamTokenFile(path, load, reload_seconds=0.001)
+    path.write_text("[", encoding="utf-8")
+    time.sleep(0.01)
+    assert tokens.current() == ({"TEAM-aaa": {"token": "TEAM-aaa"}}, 0)
+
+
+def test_cached_session_still_authenticates(client, auth_headers):
+    for _ in range(2):
+        assert client.get("/users/1", headers=auth_headers).status_code == 200
+    bad = dict(auth_headers, Authorization=auth_headers["Authorization"] + "x")
+    assert client.get("/users/1", headers=bad).status_code == 401
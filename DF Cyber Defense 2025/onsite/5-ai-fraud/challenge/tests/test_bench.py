@@ -0,0 +1,36 @@
+import json
+import random
+
+from bench import common, redaction
+
+
+def test_percentile_nearest_rank():
+    assert common.percentile([], 50) == 0.0
+    assert common.percentile([3, 1, 2, 4], 50) == 2
+    assert common.percentile([3, 1, 2, 4], 99) == 4
+
+
+def test_compare_to_baseline_direction():
+    case = {"size": 1}
+    baseline = [{"case": case, "throughput": 100, "p95_ms": 10}]
+    assert common.compare_to_baseline([{"case": case, "throughput": 95, "p95_ms": 10.5}], baseline,
+                                      ["throughput", "p95_ms"], 0.10) == []
+    problems = common.compare_to_baseline([{"case": case, "throughput": 80, "p95_ms": 20}], baseline,
+                                          ["throughput", "p95_ms"], 0.10)
+    assert len(problems) == 2
+
+
+def test_search_body_reaches_target_size():
+    body = common.search_body(random.Random(1), 4096, q="a")
+    doc = json.loads(body)
+    assert len(body) >= 4096 and doc["q"] == "a" and doc["results"]
+
+
+def test_redaction_bench_runs_one_case(tmp_path):
+    out = tmp_path / "out.json"
+    argv = ["--sizes", "512", "--hit-ratios", "0.5", "--threads", "2", "--backends", "memory",
+            "--requests", "20", "--latency", "fixed:0", "--latency-per-kchar", "0", "--out", str(out)]
+    assert redaction.main(argv) == 0
+    results = json.loads(out.read_text())["results"]
+    assert results[0]["throughput"] > 0
+    assert results[0]["errors"] == 0
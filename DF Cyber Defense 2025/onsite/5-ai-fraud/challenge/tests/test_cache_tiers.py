@@ -0,0 +1,41 @@
+import os
+import time
+
+import ai_cache
+
+
+def test_memory_tier_ttl_and_lru(monkeypatch):
+    tier = ai_cache.MemoryTier(2, 5)
+    now = [1000.0]
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now[0])
+    tier.set("a", "1")
+    tier.set("b", "2")
+    assert tier.get("a") == "1"
+    tier.set("c", "3")
+    # b was the least recently used
+    assert tier.get("b") is None
+    now[0] += 6
+    assert tier.get("a") is None
+
+
+def test_disk_tier_round_trip_and_ttl(tmp_path):
+    tier = ai_cache.DiskTier(str(tmp_path), 60)
+    key = "json-" + "a" * 64
+    assert tier.get(key) is None
+    tier.set(key, "value")
+    tier.set(key, "newer")
+    assert tier.get(key) == "newer"
+    assert not [f for _, _, files in os.walk(tmp_path) for f in files if f.startswith(".tmp-")]
+    old = time.time() - 120
+    for dirpath, _, files in os.walk(tmp_path):
+        for fname in files:
+            os.utime(os.path.join(dirpath, fname), (old, old))
+    assert tier.get(key) is None
+
+
+def test_build_primary_tier_without_redis(tmp_path):
+    memory = ai_cache.MemoryTier(1, 1)
+    assert ai_cache.build_primary_tier("auto", memory) is memory
+    assert ai_cache.build_primary_tier("memory", memory) is memory
+    assert ai_cache.build_primary_tier("redis", memory) is memory
+    assert ai_cache.build_primary_tier("disk", memory, disk_path=str(tmp_path)).name == "disk"
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import chunking
+import redaction_rules
+
+
+def redact_all(bodies):
+    return [redaction_rules.redact(text, ctype) for text, ctype in bodies]
+
+
+def run(plan):
+    chunks, assemble = plan
+    return assemble(redact_all(chunks))
+
+
+def test_small_bodies_are_not_chunked():
+    assert chunking.plan("short", "text/plain", 100) is None
+    assert chunking.plan("x" * 500, "text/plain", 0) is None
+    assert chunking.plan("<p>x</p>" * 100, "text/html", 100) is None
+
+
+def test_text_secret_straddling_the_size_boundary_stays_whole():
+    secret = "CBJS_SECRET_" + "a1" * 20
+    line = "word " * 15 + secret + " tail. more words follow here. " * 5
+    # max_chars falls in the middle of the secret
+    plan = chunking.plan(line, "text/plain", 90)
+    assert plan is not None
+    chunks, _ = plan
+    assert sum(secret in text for text, _ in chunks) == 1
+    assert not any(secret[:20] in text and secret not in text for text, _ in chunks)
+    assert "CBJS_SECRET" not in run(plan)
+
+
+def test_overlong_line_without_boundary_is_sent_whole():
+    line = "x" * 50 + " CBJS_SECRET_" + "z9" * 60 + " y" * 10
+    parts = chunking._split_lines(line, 40)
+    assert parts == [line]
+
+
+def test_no_cut_between_digit_groups():
+    text = "Card 4111, 1111 1111 1111. Phone 555. 0100 555 0100. " * 4
+    for part in chunking._split_lines(text, 30):
+        assert not part.startswith("1111")
+        assert not part.startswith("0100")
+
+
+def test_text_reassembles_in_order():
+    paragraphs = [f"Paragraph {i} ends here.\n\n" for i in range(30)]
+    text = "".join(paragraphs)
+    plan = chunking.plan(text, "text/plain", 120)
+    chunks, assemble = plan
+    assert len(chunks) > 1
+    assert assemble([c for c, _ in chunks]) == text
+
+
+def test_json_envelope_split_and_reassembled():
+    doc = {"q": "a", "results": [{"id": i, "secret_key": f"CBJS_SECRET_{i}", "username": f"u{i}"} for i in range(40)]}
+    plan = chunking.plan(json.dumps(doc), "application/json", 300)
+    chunks, _ = plan
+    assert len(chunks) > 2
+    out = json.loads(run(plan))
+    assert out["q"] == "a"
+    assert [r["id"] for r in out["results"]] == list(range(40))
+    assert all(r["secret_key"] == redaction_rules.MASK for r in out["results"])
+
+
+def test_json_chunk_length_change_fails_closed():
+    doc = [{"id": i} for i in range(20)]
+    chunks, assemble = chunking.plan(json.dumps(doc), "application/json", 50)
+    with pytest.raises(RuntimeError):
+        assemble(["[]" for _ in chunks])
+
+
+def test_stream_json_yields_valid_document():
+    groups = [[{"id": 1, "ssn": "123-45-6789"}], [], [{"id": 2}, {"id": 3}]]
+    out = "".join(chunking.stream_json({"q": "x", "results": []}, "results", iter(groups), redact_all))
+    assert json.loads(out) == {"q": "x", "results": [{"id": 1, "ssn": "********"}, {"id": 2}, {"id": 3}]}
+
+
+def test_stream_csv_header_then_rows_and_shape_check():
+    groups = [[(1, "alice")], [(2, "bob"), (3, "carol")]]
+    out = "".join(chunking.stream_csv(["id", "username"], iter(groups), lambda bodies: [b for b, _ in bodies]))
+    assert out == "id,username\n1,alice\n2,bob\n3,carol\n"
+
+    def drop_row(bodies):
+        return ["\n".join(b.splitlines()[:-1]) for b, _ in bodies]
+
+    with pytest.raises(RuntimeError):
+        "".join(chunking.stream_csv(["id", "username"], iter(groups), drop_row))
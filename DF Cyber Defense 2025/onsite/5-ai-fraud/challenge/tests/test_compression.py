@@ -0,0 +1,84 @@
+import gzip
+
+from flask import Flask
+
+import compression
+
+
+def make_request(**headers):
+    app = Flask(__name__)
+    return app.test_request_context("/", headers=headers)
+
+
+def test_negotiate_respects_accept_encoding():
+    with make_request(**{"Accept-Encoding": "gzip"}) as ctx:
+        assert compression.negotiate(ctx.request) == "gzip"
+    with make_request(**{"Accept-Encoding": "gzip;q=0"}) as ctx:
+        assert compression.negotiate(ctx.request) is None
+    with make_request() as ctx:
+        assert compression.negotiate(ctx.request) is None
+
+
+def test_gzip_output_is_stable_and_round_trips():
+    data = b'{"a": 1}' * 100
+    assert compression.compress(data, "gzip") == compression.compress(data, "gzip")
+    assert gzip.decompress(compression.compress(data, "gzip", best=True)) == data
+
+
+def test_matching_tag_accepts_encoded_variants():
+    with make_request(**{"If-None-Match": '"abc-gzip"'}) as ctx:
+        assert compression.matching_tag(ctx.request, "abc") == "abc-gzip"
+    with make_request(**{"If-None-Match": '"abc"'}) as ctx:
+        assert compression.matching_tag(ctx.request, "abc") == "abc"
+    with make_request(**{"If-None-Match": '"other"'}) as ctx:
+        assert compression.matching_tag(ctx.request, "abc") is None
+
+
+def test_compression_cache_reuses_bytes():
+    cache = compression.CompressionCache(size=1)
+    first = cache.compress(b"x" * 1000, "gzip")
+    assert cache.compress(b"x" * 1000, "gzip") is first
+    cache.compress(b"y" * 1000, "gzip")
+    assert cache.compress(b"x" * 1000, "gzip") is not first
+
+
+def test_static_page_variants_and_conditional_get():
+    page = compression.StaticPage("<p>" + "hello " * 200 + "</p>")
+    with make_request(**{"Accept-Encoding": "gzip"}) as ctx:
+        resp = page.response(ctx.request)
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(resp.get_data()).startswith(b"<p>hello")
+        tag = resp.get_etag()[0]
+        assert tag.endswith("-gzip")
+    with make_request(**{"Accept-Encoding": "gzip", "If-None-Match": f'"{tag}"'}) as ctx:
+        assert page.response(ctx.request).status_code == 304
+    with make_request(**{"Accept-Encoding": "gzip"}) as ctx:
+        resp = page.response(ctx.request, compress=False)
+        assert "Content-Encoding" not in resp.headers
+        assert resp.get_data().startswith(b"<p>hello")
+
+
+def test_app_compression_is_opt_in(app_module, client, auth_headers, monkeypatch):
+    headers = dict(auth_headers, **{"Accept-Encoding": "gzip"})
+    assert app_module.COMPRESSION_ENABLED is False
+    plain = client.get("/search?q=a", headers=headers)
+    assert "Content-Encoding" not in plain.headers
+    assert "Content-Encoding" not in client.get("/auth", headers=headers).headers
+
+    plain = client.get("/users/1", headers=headers)
+    monkeypatch.setattr(app_module, "COMPRESSION_ENABLED", True)
+    monkeypatch.setattr(app_module, "COMPRESS_MIN_BYTES", 10)
+    resp = client.get("/users/1", headers=headers)
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp.get_data()) == plain.get_data()
+    assert "CBJS_SECRET" not in gzip.decompress(resp.get_data()).decode()
+
+
+def test_reflected_input_is_never_compressed(app_module, client, auth_headers, monkeypatch):
+    headers = dict(auth_headers, **{"Accept-Encoding": "gzip"})
+    monkeypatch.setattr(app_module, "COMPRESSION_ENABLED", True)
+    monkeypatch.setattr(app_module, "COMPRESS_MIN_BYTES", 10)
+    resp = client.get("/search?q=a", headers=headers)
+    assert resp.status_code == 200
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_json()["q"] == "a"
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+from db import ConnectionManager
+
+INIT_SQL = Path(__file__).resolve().parent.parent / "init.sql"
+
+
+@pytest.fixture
+def manager(tmp_path):
+    path = tmp_path / "db.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT)")
+    conn.execute("INSERT INTO users (username) VALUES ('alice'), ('bob')")
+    conn.commit()
+    conn.close()
+    return ConnectionManager(path)
+
+
+def test_read_connection_is_per_thread_and_reused(manager):
+    conn = manager.read()
+    assert manager.read() is conn
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.read()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+    assert len(manager._all) == 2
+
+
+def test_read_connection_is_wal_and_read_only(manager):
+    conn = manager.read()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    assert conn.execute("SELECT username FROM users WHERE id = 1").fetchone()["username"] == "alice"
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM users")
+
+
+def test_reads_see_writes_from_other_connections(manager):
+    reader = manager.read()
+    assert reader.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+    writer = manager.connect()
+    writer.execute("INSERT INTO users (username) VALUES ('carol')")
+    writer.commit()
+    writer.close()
+    assert reader.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 3
+
+
+def test_fork_reset_starts_an_empty_pool(manager):
+    conn = manager.read()
+    manager._reset_after_fork()
+    assert manager.read() is not conn
+
+
+@pytest.fixture
+def seeded(tmp_path):
+    path = tmp_path / "seeded.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(INIT_SQL.read_text(encoding="utf-8"))
+    conn.close()
+    manager = ConnectionManager(path)
+    if not manager.search_index_ready():
+        pytest.skip("SQLite lacks FTS5 trigram")
+    return manager
+
+
+def search_ids(app_module, manager, q):
+    sql, params = app_module.search_sql(q)
+    return [row["id"] for row in manager.read().execute(sql, params)]
+
+
+@pytest.mark.parametrize("q", ["", "n", "an", "nhan", ".ng", "linh.tran", "zzz"])
+def test_fts_search_matches_like(app_module, seeded, monkeypatch, q):
+    monkeypatch.setattr(app_module, "DB", seeded)
+    expected = search_ids(app_module, seeded, q)
+    monkeypatch.setattr(app_module, "SEARCH_BACKEND", "fts")
+    assert sorted(search_ids(app_module, seeded, q)) == sorted(expected)
+
+
+def test_fts_index_follows_writes(app_module, seeded, monkeypatch):
+    monkeypatch.setattr(app_module, "DB", seeded)
+    monkeypatch.setattr(app_module, "SEARCH_BACKEND", "fts")
+    conn = seeded.connect()
+    conn.execute("INSERT INTO users (id, username) VALUES (10, 'minh.vo')")
+    conn.execute("UPDATE users SET username = 'duc.le' WHERE id = 3")
+    conn.execute("DELETE FROM users WHERE id = 2")
+    conn.commit()
+    conn.close()
+    assert search_ids(app_module, seeded, "minh") == [10]
+    assert search_ids(app_module, seeded, "pham") == []
+    assert search_ids(app_module, seeded, "duc.le") == [3]
+    assert search_ids(app_module, seeded, "linh") == []
+
+
+def test_only_the_like_backend_is_injectable(app_module, seeded, monkeypatch):
+    monkeypatch.setattr(app_module, "DB", seeded)
+    q = "zzz' OR 1=1 OR username LIKE '"
+    assert search_ids(app_module, seeded, q) == [1, 2, 3]
+    monkeypatch.setattr(app_module, "SEARCH_BACKEND", "fts")
+    assert search_ids(app_module, seeded, q) == []
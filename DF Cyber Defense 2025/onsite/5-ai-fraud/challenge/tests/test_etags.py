@@ -0,0 +1,56 @@
+import etags
+
+
+def test_db_version_changes_on_write(tmp_path):
+    db = tmp_path / "db.sqlite3"
+    db.write_bytes(b"x")
+    store = etags.ETagStore(db)
+    before = store.db_version()
+    assert store.db_version() == before
+    (tmp_path / "db.sqlite3-wal").write_bytes(b"wal")
+    assert store.db_version() != before
+
+
+def test_lookup_requires_same_fingerprint_and_version(tmp_path):
+    store = etags.ETagStore(tmp_path / "db.sqlite3")
+    tag = store.compute(b"body")
+    store.remember("/users/1", "fp", tag, (1, 2))
+    assert store.lookup("/users/1", "fp", (1, 2)) == tag
+    assert store.lookup("/users/1", "other", (1, 2)) is None
+    assert store.lookup("/users/1", "fp", (1, 3)) is None
+    assert store.lookup("/users/2", "fp", (1, 2)) is None
+
+
+def test_users_conditional_get(app_module, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "ETAGS_ENABLED", True)
+    # The first connection switches the database to WAL, which changes its version
+    client.get("/users/1", headers=auth_headers)
+    first = client.get("/users/1", headers=auth_headers)
+    assert first.status_code == 200
+    tag = first.headers["ETag"]
+    assert "CBJS_SECRET" not in first.get_data(as_text=True)
+
+    redactions = []
+    redactor = app_module.get_redactor()
+    monkeypatch.setattr(redactor, "redact_text", lambda *a, **k: redactions.append(1) or a[0])
+    again = client.get("/users/1", headers=dict(auth_headers, **{"If-None-Match": tag}))
+    assert again.status_code == 304
+    assert again.headers["ETag"] == tag
+    assert redactions == []
+
+
+def test_users_etags_off_by_default(app_module, client, auth_headers):
+    assert app_module.ETAGS_ENABLED is False
+    assert "ETag" not in client.get("/users/1", headers=auth_headers).headers
+
+
+def test_write_invalidates_users_tag(app_module, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "ETAGS_ENABLED", True)
+    client.get("/users/2", headers=auth_headers)
+    tag = client.get("/users/2", headers=auth_headers).headers["ETag"]
+    conn = app_module.get_db()
+    conn.execute("UPDATE users SET address = address || ' ' WHERE id = 2")
+    conn.commit()
+    conn.close()
+    resp = client.get("/users/2", headers=dict(auth_headers, **{"If-None-Match": tag}))
+    assert resp.status_code == 200
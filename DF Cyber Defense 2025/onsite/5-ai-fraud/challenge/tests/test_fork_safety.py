@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+import ai_filter
+import redis_pool
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+def in_child(check):
+    """Run ``check`` in a forked child and return its JSON-able result."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = json.dumps({"ok": check()})
+        except BaseException as exc:  # report anything, never return into pytest
+            payload = json.dumps({"error": repr(exc)})
+        os.write(write_fd, payload.encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fh:
+        data = fh.read()
+    os.waitpid(pid, 0)
+    result = json.loads(data)
+    assert "error" not in result, result["error"]
+    return result["ok"]
+
+
+def test_redis_client_is_not_inherited(monkeypatch):
+    monkeypatch.setattr(redis_pool, "_client", object())
+    monkeypatch.setattr(redis_pool, "_pid", os.getpid())
+    monkeypatch.setattr(redis_pool, "_failed_at", 123.0)
+    assert in_child(lambda: [redis_pool._client is None, redis_pool._pid, redis_pool._failed_at]) == [True, None, None]
+
+
+def test_held_pool_lock_is_replaced_in_child():
+    redis_pool._lock.acquire()
+    try:
+        assert in_child(lambda: redis_pool._lock.acquire(timeout=1))
+    finally:
+        redis_pool._lock.release()
+
+
+def test_redactor_is_built_lazily(monkeypatch):
+    monkeypatch.setattr(ai_filter, "_redactor", None)
+    built = []
+    monkeypatch.setattr(ai_filter, "AIRedactor", lambda: built.append(1) or object())
+    assert ai_filter._redactor is None
+    first = ai_filter.get_redactor()
+    assert ai_filter.get_redactor() is first
+    assert ai_filter.redactor is first
+    assert built == [1]
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+import html_redact
+import redaction_rules
+
+
+def rule_redactor(calls=None):
+    def redact_json(bodies):
+        if calls is not None:
+            calls.extend(bodies)
+        return [json.dumps([redaction_rules.redact_inline(v) for v in json.loads(b)]) for b in bodies]
+    return redact_json
+
+
+def test_script_with_attributes_and_body_is_redacted_in_place():
+    doc = '<script src="app.js">var s="CBJS_SECRET_abc123";</script>'
+    assert html_redact.redact_html(doc, rule_redactor()) == '<script src="app.js">var s="********";</script>'
+
+
+def test_segments_are_rebuilt_in_document_order():
+    doc = (
+        '<p title="CBJS_SECRET_t1">before</p>'
+        '<script type="text/javascript" data-k="CBJS_SECRET_a1">x="CBJS_SECRET_b2"</script>'
+        "<div>after CBJS_SECRET_c3</div>"
+    )
+    out = html_redact.redact_html(doc, rule_redactor())
+    assert "CBJS_SECRET" not in out
+    assert out == (
+        '<p title="********">before</p>'
+        '<script type="text/javascript" data-k="********">x="********"</script>'
+        "<div>after ********</div>"
+    )
+
+
+@pytest.mark.parametrize("doc", [
+    '<div style="background:url(/i.png?k=CBJS_SECRET_st1)">x</div>',
+    '<span class="CBJS_SECRET_cl2">x</span>',
+    "<style>/* CBJS_SECRET_css3 */ body { color: red }</style>",
+    "<style>.a { background: url(/x?k=CBJS_SECRET_css4) }</style>",
+    '<input type="CBJS_SECRET_ty5">',
+])
+def test_style_and_presentation_values_are_sent(doc):
+    calls = []
+    out = html_redact.redact_html(doc, rule_redactor(calls))
+    assert "CBJS_SECRET" not in out
+    assert any("CBJS_SECRET" in body for body in calls)
+
+
+def test_markup_outside_segments_is_unchanged():
+    doc = "<!doctype html><html><body><p>plain text</p><!-- note --></body></html>"
+    assert html_redact.redact_html(doc, rule_redactor()) == doc
+
+
+def test_segment_count_mismatch_fails_closed():
+    def drop_one(bodies):
+        return [json.dumps(json.loads(b)[1:]) for b in bodies]
+
+    with pytest.raises(RuntimeError):
+        html_redact.redact_html("<p>one</p><p>two</p>", drop_one)
+
+
+@pytest.mark.parametrize("doc", [
+    "<![CDATA[CBJS_SECRET_x]]>",
+    "<?pi CBJS_SECRET_x?>",
+    "<!DOCTYPE CBJS_SECRET_x>",
+    "<CBJS_SECRET_x>text</CBJS_SECRET_x>",
+    "<div data-CBJS_SECRET_x>text</div>",
+    "<script data-CBJS_SECRET_x>1</script>",
+    "<p><!-- CBJS_SECRET_x --></p>",
+])
+def test_every_construct_reaches_the_model(doc):
+    calls = []
+    out = html_redact.redact_html(doc, rule_redactor(calls))
+    assert "CBJS_SECRET" not in out
+    assert any("CBJS_SECRET" in body for body in calls)
+
+
+def test_redacted_names_and_sections_cannot_break_out():
+    def hostile(bodies):
+        return [json.dumps(['x">' + v + "]]>-->" for v in json.loads(b)]) for b in bodies]
+
+    doc = '<![CDATA[a]]><!--b--><?c?><d e="f">g</d>'
+    out = html_redact.redact_html(doc, hostile)
+    # Each construct still ends where it did; changed names become the mask
+    assert out == (
+        "<![CDATA[x\">a]]&gt;-->]]>"
+        "<!--x\">b]]>--&gt;-->"
+        "<?x\"&gt;c?]]&gt;--&gt;>"
+        '<******** ********="x&quot;>f]]>-->">x">g]]>--></********>'
+    )
+
+
+@pytest.mark.parametrize("doc", [
+    '<div "CBJS_SECRET_x">text</div>',
+    "<div a='1'='CBJS_SECRET_x'>text</div>",
+])
+def test_unaccounted_tag_syntax_fails_closed(doc):
+    with pytest.raises(RuntimeError):
+        html_redact.redact_html(doc, rule_redactor())
+
+
+def test_whole_documents_are_the_default(app_module):
+    from ai_filter import get_redactor
+
+    assert get_redactor().html_mode == "whole"
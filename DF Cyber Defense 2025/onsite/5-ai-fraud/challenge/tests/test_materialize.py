@@ -0,0 +1,87 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from db import ConnectionManager
+from materialize import Materializer
+
+INIT_SQL = Path(__file__).resolve().parent.parent / "init.sql"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "db.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(INIT_SQL.read_text(encoding="utf-8"))
+    conn.close()
+    manager = ConnectionManager(path)
+    assert manager.redacted_table_ready()
+    return manager
+
+
+def make(db, redact=lambda body: body.upper(), fingerprint="v1"):
+    state = {"fingerprint": fingerprint}
+    materializer = Materializer(
+        db, render=lambda row: json.dumps({"id": row["id"], "username": row["username"]}),
+        redact=redact, fingerprint=lambda: state["fingerprint"], batch=2,
+    )
+    return materializer, state
+
+
+def write(db, sql, *params):
+    conn = db.connect()
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_refresh_fills_stale_rows(db):
+    materializer, _ = make(db)
+    assert materializer.fresh_body(1) is None
+    assert not materializer.is_fresh(1)
+    assert materializer.refresh() == 3
+    assert materializer.is_fresh(1)
+    assert json.loads(materializer.fresh_body(2)) == {"ID": 2, "USERNAME": "LINH.TRAN"}
+    assert materializer.refresh() == 0
+
+
+def test_triggers_mark_changed_users_stale(db):
+    materializer, _ = make(db)
+    materializer.refresh()
+    write(db, "UPDATE users SET username = 'duc.le' WHERE id = 3")
+    write(db, "INSERT INTO users (id, username) VALUES (4, 'minh.vo')")
+    write(db, "DELETE FROM users WHERE id = 1")
+    assert materializer.fresh_body(3) is None
+    assert materializer.fresh_body(4) is None
+    assert materializer.refresh() == 2
+    assert "DUC.LE" in materializer.fresh_body(3)
+    assert "MINH.VO" in materializer.fresh_body(4)
+    assert materializer.fresh_body(1) is None
+    assert db.read().execute("SELECT COUNT(*) FROM users_redacted WHERE id = 1").fetchone()[0] == 0
+
+
+def test_new_fingerprint_invalidates_every_body(db):
+    materializer, state = make(db)
+    materializer.refresh()
+    state["fingerprint"] = "v2"
+    assert materializer.fresh_body(1) is None
+    assert materializer.refresh() == 3
+    assert materializer.fresh_body(1) is not None
+
+
+def test_failed_or_raced_rows_stay_stale(db):
+    def redact(body):
+        if '"id": 1' in body:
+            raise RuntimeError("model down")
+        if '"id": 2' in body:
+            # An update lands while user 2 is being redacted
+            write(db, "UPDATE users SET email = 'new@x.io' WHERE id = 2")
+        return body
+
+    materializer, _ = make(db, redact=redact)
+    assert materializer.refresh() == 1
+    assert materializer.fresh_body(1) is None
+    assert materializer.fresh_body(2) is None
+    assert materializer.fresh_body(3) is not None
@@ -0,0 +1,35 @@
+import metrics
+
+
+def test_metrics_endpoint_reports_request_latency(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape-me")
+    client.get("/health")
+    resp = client.get("/metrics", headers={"Authorization": "Bearer scrape-me"})
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain")
+    assert b"aifraud_request_seconds" in resp.data
+
+
+def test_metrics_are_hidden_without_a_token(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer anything"}).status_code == 404
+
+
+def test_metrics_token_is_required(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape-me")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    # Non-ASCII tokens are a mismatch, not a TypeError
+    assert client.get("/metrics", headers={"Authorization": "Bearer sécret"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-me"}).status_code == 200
+
+
+def test_cache_lookup_counts_sums_hits_and_misses():
+    before = metrics.cache_lookup_counts().get("test-tier", {"hit": 0, "miss": 0})
+    metrics.AI_CACHE_LOOKUPS.labels("test-tier", "hit").inc()
+    metrics.AI_CACHE_LOOKUPS.labels("test-tier", "miss").inc(3)
+    tier = metrics.cache_lookup_counts()["test-tier"]
+    assert tier["hit"] == before["hit"] + 1
+    assert tier["miss"] == before["miss"] + 3
+    assert tier["hit_ratio"] == round(tier["hit"] / (tier["hit"] + tier["miss"]), 4)
@@ -0,0 +1,55 @@
+import json
+
+from mock_openrouter import MockConfig, create_app
+
+
+def chat(client, user, **extra):
+    payload = {"model": "m", "messages": [{"role": "system", "content": "sys"}, {"role": "user", "content": user}]}
+    payload.update(extra)
+    return client.post("/api/v1/chat/completions", json=payload)
+
+
+def test_chat_completion_answers_with_the_rules():
+    client = create_app(MockConfig()).test_client()
+    resp = chat(client, json.dumps({"secret_key": "CBJS_SECRET_x", "username": "alice"}))
+    content = resp.get_json()["choices"][0]["message"]["content"]
+    assert json.loads(content) == {"secret_key": "********", "username": "alice"}
+    stats = client.get("/stats").get_json()
+    assert stats["calls"]["chat"] == 1
+    assert stats["prompt_tokens"] > 0
+
+
+def test_chat_404_mode_and_responses_fallback():
+    client = create_app(MockConfig(chat_404=True)).test_client()
+    assert chat(client, "x").status_code == 404
+    resp = client.post("/responses", json={"model": "m", "input": "mail alice@finova.one"})
+    assert resp.get_json()["output_text"] == "mail ********"
+    assert client.get("/stats").get_json()["not_found"] == 1
+
+
+def test_error_rate_returns_configured_status():
+    client = create_app(MockConfig(error_rate=1.0, error_status=503)).test_client()
+    assert chat(client, "x").status_code == 503
+
+
+def test_streamed_chat_reassembles():
+    client = create_app(MockConfig(stream_chunk_chars=4)).test_client()
+    resp = chat(client, "token sk-abcdef123456", stream=True)
+    deltas = []
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith("data: ") and line != "data: [DONE]":
+            choice = json.loads(line[6:]).get("choices") or [{}]
+            deltas.append(choice[0].get("delta", {}).get("content") or "")
+    assert "".join(deltas) == "token ********"
+
+
+def test_cache_marked_system_prompt_is_cached_from_second_use():
+    client = create_app(MockConfig()).test_client()
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "policy " * 50, "cache_control": {"type": "ephemeral"}}]},
+        {"role": "user", "content": "hello"},
+    ]
+    usages = [client.post("/chat/completions", json={"messages": messages}).get_json()["usage"] for _ in range(2)]
+    assert usages[0]["prompt_tokens_details"]["cached_tokens"] == 0
+    assert usages[1]["prompt_tokens_details"]["cached_tokens"] > 0
+    assert usages[1]["prompt_tokens"] == usages[0]["prompt_tokens"]
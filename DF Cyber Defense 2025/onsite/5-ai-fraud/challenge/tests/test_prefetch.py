@@ -0,0 +1,53 @@
+import threading
+import time
+
+from prefetch import Prefetcher
+
+
+class Recorder:
+    def __init__(self, expected):
+        self.calls = []
+        self.expected = expected
+        self.done = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, user_id, team_token, team_abbr):
+        self.release.wait(5)
+        self.calls.append((user_id, team_token, team_abbr))
+        if len(self.calls) >= self.expected:
+            self.done.set()
+
+
+def test_submit_warms_distinct_integer_ids_only():
+    warm = Recorder(expected=3)
+    prefetcher = Prefetcher(warm, max_ids=10)
+    queued = prefetcher.submit([1, "2", True, 1, 3.0, 2, None, 3], "TEAM-aaa", "AAA")
+    assert queued == 3
+    assert warm.done.wait(5)
+    assert sorted(warm.calls) == [(1, "TEAM-aaa", "AAA"), (2, "TEAM-aaa", "AAA"), (3, "TEAM-aaa", "AAA")]
+
+
+def test_submit_respects_id_limits():
+    warm = Recorder(expected=2)
+    prefetcher = Prefetcher(warm, max_ids=2)
+    assert prefetcher.submit(range(10), "t", "T") == 2
+    assert prefetcher.submit(range(10), "t", "T", limit=0) == 0
+    assert Prefetcher(warm, max_ids=0).submit([1], "t", "T") == 0
+    assert warm.done.wait(5)
+
+
+def test_full_queue_drops_and_pending_ids_are_not_requeued():
+    warm = Recorder(expected=2)
+    warm.release.clear()
+    prefetcher = Prefetcher(warm, max_ids=10, queue_size=1)
+    assert prefetcher.submit([1], "t", "T") == 1
+    # Wait until the worker holds id 1, leaving the one queue slot free
+    for _ in range(500):
+        if prefetcher._queue.empty():
+            break
+        time.sleep(0.01)
+    assert prefetcher.submit([1, 2, 3], "t", "T") == 1
+    warm.release.set()
+    assert warm.done.wait(5)
+    assert [c[0] for c in warm.calls] == [1, 2]
@@ -0,0 +1,57 @@
+import json
+import shutil
+
+import pytest
+
+from bench import prompt_check
+
+
+def diffs(expected, actual):
+    out = {"leak": [], "structure": [], "over": []}
+    prompt_check._leaf_diffs(expected, actual, "", out)
+    return out
+
+
+def test_leaf_diffs_classify_leaks_structure_and_over_redaction():
+    assert diffs({"a": "********", "b": "x"}, {"a": "secret", "b": "x"})["leak"] == [".a"]
+    assert diffs({"a": [1, 2]}, {"a": [1]})["structure"] == [".a"]
+    assert diffs({"a": "x"}, {"a": "********"})["over"] == [".a"]
+    assert diffs({"a": "x"}, {"a": "x"}) == {"leak": [], "structure": [], "over": []}
+
+
+def test_corpus_declares_it_is_rule_seeded():
+    with open(prompt_check.CORPUS, encoding="utf-8") as fh:
+        assert json.load(fh)["source"].startswith("Rule-seeded")
+
+
+def test_record_refuses_the_mock(tmp_path):
+    corpus = tmp_path / "corpus.json"
+    shutil.copy(prompt_check.CORPUS, corpus)
+    before = corpus.read_text(encoding="utf-8")
+    with pytest.raises(SystemExit):
+        prompt_check.main(["--corpus", str(corpus), "--mock", "--record", "default"])
+    assert corpus.read_text(encoding="utf-8") == before
+
+
+def test_mock_run_passes_the_rule_seeded_corpus():
+    assert prompt_check.main(["--mock", "--variants", "default,compact", "--prompt-cache"]) == 0
+
+
+def test_candidate_prompts_are_not_selectable_in_production(monkeypatch):
+    import ai_filter
+
+    monkeypatch.setenv("AI_FILTER_PROMPT_VARIANT", "compact")
+    monkeypatch.delenv("AI_FILTER_SYSTEM_PROMPT", raising=False)
+    redactor = ai_filter.AIRedactor()
+    assert redactor.prompt_variant == "default"
+    assert redactor.system_prompt == ai_filter.DEFAULT_SYSTEM_PROMPT
+
+
+def test_bench_passes_candidates_as_the_system_prompt():
+    from ai_filter import CANDIDATE_SYSTEM_PROMPTS
+    from bench.common import system_prompt_env
+
+    assert system_prompt_env("default") == {"AI_FILTER_PROMPT_VARIANT": "default", "AI_FILTER_SYSTEM_PROMPT": None}
+    assert system_prompt_env("compact")["AI_FILTER_SYSTEM_PROMPT"] == CANDIDATE_SYSTEM_PROMPTS["compact"]()
+    with pytest.raises(SystemExit):
+        system_prompt_env("nope")
@@ -0,0 +1,175 @@
+import logging
+import threading
+
+import ratelimit
+
+
+def test_inflight_local_cap_and_release():
+    limiter = ratelimit.InflightLimiter("p", 2)
+    first = limiter.acquire(None, "team", 0)
+    second = limiter.acquire(None, "team", 0)
+    assert first[0] and second[0]
+    assert limiter.acquire(None, "team", 0) == (False, None)
+    assert limiter.acquire(None, "other", 0)[0]
+    limiter.release(first[1])
+    assert limiter.acquire(None, "team", 0)[0]
+
+
+def test_inflight_local_state_is_dropped_when_idle():
+    limiter = ratelimit.InflightLimiter("p", 1)
+    _, ticket = limiter.acquire(None, "team", 0)
+    limiter.release(ticket)
+    assert limiter._local == {}
+
+
+def test_inflight_warns_once_without_redis(caplog):
+    limiter = ratelimit.InflightLimiter("p", 1)
+    with caplog.at_level(logging.WARNING, logger="ratelimit"):
+        for _ in range(3):
+            _, ticket = limiter.acquire(None, "team", 0)
+            limiter.release(ticket)
+    assert sum("per process" in r.getMessage() for r in caplog.records) == 1
+
+
+def test_inflight_cap_in_app_and_release_on_teardown(app_module, client, auth_headers, monkeypatch):
+    limiter = ratelimit.InflightLimiter(app_module.REDIS_PREFIX, 1)
+    monkeypatch.setattr(app_module, "INFLIGHT_LIMITER", limiter)
+    entered, release = threading.Event(), threading.Event()
+    redactor = app_module.get_redactor()
+    original = redactor.redact_text
+
+    def slow(*args, **kwargs):
+        entered.set()
+        release.wait(5)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(redactor, "redact_text", slow)
+    statuses = []
+    worker = threading.Thread(target=lambda: statuses.append(client.get("/users/1", headers=auth_headers).status_code))
+    worker.start()
+    assert entered.wait(5)
+    blocked = client.get("/users/2", headers=auth_headers)
+    release.set()
+    worker.join(5)
+    assert blocked.status_code == 429
+    assert blocked.get_json() == {"error": "too_many_concurrent_requests", "retry_after": 1.0, "max_inflight": 1}
+    assert blocked.headers["Retry-After"] == "1"
+    assert statuses == [200]
+    assert limiter._local == {}
+    assert client.get("/users/2", headers=auth_headers).status_code == 200
+
+
+class FakeCheckScript:
+    """_CHECK_LUA's semantics over a dict, recording every call."""
+
+    def __init__(self):
+        self.store = {}
+        self.calls = 0
+
+    def __call__(self, keys, args):
+        self.calls += 1
+        now, limit, window, min_interval, retry, wanted = (float(a) for a in args)
+        last = self.store.get(keys[1])
+        if min_interval > 0 and last is not None and now - last < min_interval:
+            return [0, str(min_interval - (now - last)), 0]
+        count = self.store.get(keys[0], 0)
+        if count >= limit:
+            return [0, retry, count]
+        granted = int(min(wanted, limit - count))
+        self.store[keys[0]] = count + granted
+        if min_interval > 0:
+            self.store[keys[1]] = now
+        return [granted, "0", count + granted]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.script = FakeCheckScript()
+        self.registered = 0
+
+    def register_script(self, source):
+        assert source == ratelimit._CHECK_LUA
+        self.registered += 1
+        return self.script
+
+
+def test_redis_limiter_without_leases_calls_once_per_request():
+    r = FakeRedis()
+    limiter = ratelimit.RedisRateLimiter(lambda: r, "p", limit=2, window_seconds=60, min_interval=0)
+    assert limiter.check(r, "team", 0.0) == (True, 0.0, 1)
+    assert limiter.check(r, "team", 1.0) == (True, 0.0, 2)
+    assert limiter.check(r, "team", 2.0) == (False, 58.0, 2)
+    assert r.script.calls == 3 and r.registered == 1
+
+
+def test_redis_limiter_spends_leases_locally_and_never_exceeds_limit():
+    r = FakeRedis()
+    limiter = ratelimit.RedisRateLimiter(lambda: r, "p", limit=7, window_seconds=60, min_interval=0, lease_size=5)
+    results = [limiter.check(r, "team", float(i)) for i in range(8)]
+    assert [ok for ok, _, _ in results] == [True] * 7 + [False]
+    # One call for the first lease, one for the remaining two, one denied
+    assert r.script.calls == 3
+    assert results[-1][1] == 53.0
+    # A new window needs a new lease
+    assert limiter.check(r, "team", 60.0)[0]
+    assert r.script.calls == 4
+
+
+def test_redis_limiter_lease_enforces_spacing_per_worker():
+    r = FakeRedis()
+    limiter = ratelimit.RedisRateLimiter(lambda: r, "p", limit=10, window_seconds=60, min_interval=1.0, lease_size=3)
+    assert limiter.check(r, "team", 0.0)[0]
+    allowed, retry, _ = limiter.check(r, "team", 0.25)
+    assert not allowed and retry == 0.75
+    assert limiter.check(r, "team", 1.0)[0]
+    assert r.script.calls == 1
+    limiter._reset_after_fork()
+    assert limiter._leases == {}
+
+
+def test_memory_limiter_uses_aligned_windows():
+    limiter = ratelimit.MemoryRateLimiter(limit=2, window_seconds=60, min_interval=0)
+    assert limiter.check("team", 50.0) == (True, 0.0, 1)
+    assert limiter.check("team", 55.0) == (True, 0.0, 2)
+    assert limiter.check("team", 59.0) == (False, 1.0, 2)
+    assert limiter.check("other", 59.0)[0]
+    # The window starts at 60, not 60 seconds after the first request
+    assert limiter.check("team", 60.0) == (True, 0.0, 1)
+
+
+def test_memory_limiter_checks_spacing_before_counting():
+    limiter = ratelimit.MemoryRateLimiter(limit=2, window_seconds=60, min_interval=2.0)
+    assert limiter.check("team", 0.0)[0]
+    assert limiter.check("team", 0.5) == (False, 1.5, 0)
+    assert limiter.check("team", 2.0) == (True, 0.0, 2)
+
+
+def test_memory_limiter_sweeps_idle_teams():
+    limiter = ratelimit.MemoryRateLimiter(limit=5, window_seconds=60, min_interval=0, shards=1, sweep_seconds=60)
+    for i in range(10):
+        limiter.check(f"team-{i}", 1.0)
+    assert len(limiter) == 10
+    # Next window: the sweep drops every team that has not been seen in it
+    limiter.check("team-0", 61.0)
+    limiter.check("team-1", 62.0)
+    assert len(limiter) == 2
+    # Not due again until 60 seconds after the last sweep
+    limiter.check("team-2", 120.0)
+    assert len(limiter) == 3
+    limiter.check("team-2", 181.0)
+    assert len(limiter) == 1
+
+
+def test_memory_limiter_is_exact_under_concurrency():
+    limiter = ratelimit.MemoryRateLimiter(limit=100, window_seconds=60, min_interval=0, shards=4)
+    allowed = []
+
+    def hammer():
+        allowed.append(sum(limiter.check("team", 1.0)[0] for _ in range(50)))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == 100
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+import redaction_backends
+from redaction_backends import LocalBackend, OpenRouterBackend, _MicroBatcher, build_backend, extract_content
+from redaction_rules import MASK
+from token_accounting import TokenUsage
+
+
+def test_local_backend_applies_rules_without_a_model():
+    backend = LocalBackend()
+    out = json.loads(backend.redact('{"name": "Ann", "ssn": "123-45-6789", "note": "mail a@b.com"}', "application/json"))
+    assert out == {"name": "Ann", "ssn": MASK, "note": MASK}
+    assert backend.redact("card 4111 1111 1111 1111 ok", "text/plain") == f"card {MASK} ok"
+
+
+def test_local_backend_masks_what_the_model_flags():
+    backend = LocalBackend()
+    seen = []
+
+    def fake_ner(strings):
+        seen.extend(strings)
+        return [[(0, 3)] if s.startswith("Ann") else [] for s in strings]
+
+    backend._batcher = _MicroBatcher(fake_ner, max_batch=8, max_wait=0)
+    usage = TokenUsage()
+    doc, text = backend.redact_batch(['{"name": "Ann Lee", "city": "Hue"}', "Ann paid\nall good"], usage=usage)
+    # JSON values are masked whole, free text only in the flagged span
+    assert json.loads(doc) == {"name": MASK, "city": "Hue"}
+    assert text == f"{MASK} paid\nall good"
+    assert sorted(seen) == ["Ann Lee", "Ann paid", "Hue", "all good"]
+    assert usage.estimated and usage.prompt_tokens > 0
+
+
+def test_micro_batcher_propagates_errors():
+    def boom(strings):
+        raise ValueError("model failed")
+
+    batcher = _MicroBatcher(boom, max_batch=4, max_wait=0)
+    with pytest.raises(ValueError, match="model failed"):
+        batcher.submit(["x"])
+    assert batcher.submit([]) == []
+
+
+def test_build_backend_selection(monkeypatch):
+    monkeypatch.delenv("AI_FILTER_LOCAL_MODEL", raising=False)
+    remote = dict(base_url="http://x", model="m", system_prompt="s", timeout=1, max_output_tokens=10)
+    assert isinstance(build_backend("auto", api_key=None, **remote), LocalBackend)
+    assert isinstance(build_backend("auto", api_key="k", **remote), OpenRouterBackend)
+    assert isinstance(build_backend("local", api_key="k", **remote), LocalBackend)
+    assert isinstance(build_backend("bogus", api_key="k", **remote), OpenRouterBackend)
+    assert not build_backend("openrouter", api_key=None, **remote).available
+
+
+def test_extract_content_accepts_each_schema():
+    assert extract_content({"choices": [{"message": {"content": "a"}}]}) == "a"
+    assert extract_content({"output_text": "b"}) == "b"
+    assert extract_content({"output": [{"content": [{"text": "c"}, {"text": "d"}]}]}) == "cd"
+    assert extract_content({"choices": [{"message": {"content": " "}}]}) is None
+
+
+def test_local_model_load_failure_fails_closed(tmp_path):
+    backend = LocalBackend(model_dir=str(tmp_path))
+    assert backend.classifier is None
+    assert not backend.available
+    with pytest.raises(RuntimeError, match="unavailable"):
+        backend.redact("plain text")
+
+
+class FakeEncoding:
+    def __init__(self, tokens, overflowing=()):
+        # tokens: (text, start, end); no special tokens
+        self.ids = [1] * len(tokens)
+        self.attention_mask = [1] * len(tokens)
+        self.type_ids = [0] * len(tokens)
+        self.offsets = [(start, end) for _, start, end in tokens]
+        self.words = [text for text, _, _ in tokens]
+        self.overflowing = list(overflowing)
+
+
+class FakeTokenizer:
+    """Whitespace tokens, truncated to ``max_length`` with ``stride`` overlapping overflow windows."""
+
+    def __init__(self, max_length, stride):
+        self.max_length = max_length
+        self.stride = stride
+
+    def encode_batch(self, texts):
+        out = []
+        for text in texts:
+            tokens, pos = [], 0
+            for word in text.split():
+                start = text.index(word, pos)
+                pos = start + len(word)
+                tokens.append((word, start, pos))
+            step = self.max_length - self.stride
+            windows = [tokens[i:i + self.max_length] for i in range(0, max(1, len(tokens) - self.stride), step)]
+            out.append(FakeEncoding(windows[0], [FakeEncoding(w) for w in windows[1:]]))
+        return out
+
+
+def fake_classifier(max_length=128):
+    classifier = redaction_backends.OnnxTokenClassifier.__new__(redaction_backends.OnnxTokenClassifier)
+    classifier.tokenizer = FakeTokenizer(max_length, min(16, max_length // 4))
+    classifier.sensitive = {1}
+    classifier.windows = []
+
+    def predict(encodings):
+        classifier.windows.append(len(encodings))
+        return [[1 if w.startswith("PII") else 0 for w in enc.words] for enc in encodings]
+
+    classifier._predict = predict
+    return classifier
+
+
+def test_classifier_covers_tokens_past_the_window():
+    classifier = fake_classifier()
+    text = " ".join(["word"] * 300 + ["PIIalice"] + ["word"] * 5)
+    short = "PIIbob and more"
+    spans = classifier.spans([text, short])
+    start = text.index("PIIalice")
+    assert spans == [[(start, start + len("PIIalice"))], [(0, len("PIIbob"))]]
+    # 306 tokens need three windows of 128 (stride 16); the short text one
+    assert classifier.windows == [4]
+
+
+def test_local_backend_masks_secrets_past_the_window():
+    backend = LocalBackend()
+    backend._batcher = _MicroBatcher(fake_classifier().spans, max_batch=8, max_wait=0)
+    text = " ".join(["word"] * 200 + ["PIIalice", "word"])
+    assert backend.redact(text, "text/plain") == " ".join(["word"] * 200 + [MASK, "word"])
+
+
+def test_redactor_with_a_broken_local_model_is_disabled(app_module, tmp_path, monkeypatch):
+    from ai_filter import AIRedactor
+
+    monkeypatch.setenv("AI_FILTER_BACKEND", "local")
+    monkeypatch.setenv("AI_FILTER_LOCAL_MODEL", str(tmp_path))
+    redactor = AIRedactor()
+    assert not redactor.enabled
+    with pytest.raises(RuntimeError):
+        redactor.redact_text("CBJS_SECRET_x", content_type="text/plain")
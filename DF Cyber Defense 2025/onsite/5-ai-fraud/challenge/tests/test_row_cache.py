@@ -0,0 +1,90 @@
+import json
+import uuid
+
+import pytest
+
+import redaction_rules
+from ai_filter import get_redactor
+from redaction_backends import RedactionBackend
+from redaction_rules import MASK
+
+
+class RecordingBackend(RedactionBackend):
+    name = "recording"
+
+    def __init__(self, drop_key=None):
+        self.bodies = []
+        self.drop_key = drop_key
+
+    def redact(self, text, content_type=None, usage=None):
+        self.bodies.append(text)
+        out = json.loads(redaction_rules.redact(text, content_type))
+        if self.drop_key:
+            for row in out:
+                row.pop(self.drop_key, None)
+        return json.dumps(out)
+
+
+@pytest.fixture
+def redactor(app_module, monkeypatch):
+    redactor = get_redactor()
+    backend = RecordingBackend()
+    monkeypatch.setattr(redactor, "backend", backend)
+    monkeypatch.setattr(redactor, "row_batch", 2)
+    return redactor
+
+
+def make_row(secret="CBJS_SECRET_x"):
+    # Unique per test run, so rows never come from an earlier test's cache entry
+    return {"id": 1, "username": uuid.uuid4().hex[:8], "secret_key": secret}
+
+
+def test_rows_are_sent_once_and_then_cached(redactor):
+    a, b, c = make_row(), make_row(), make_row()
+    out = redactor.redact_rows([a, b, a, c])
+    assert [r["username"] for r in out] == [a["username"], b["username"], a["username"], c["username"]]
+    assert all(r["secret_key"] == MASK for r in out)
+    # Three distinct rows in batches of two; the repeated row is sent once
+    assert [len(json.loads(body)) for body in redactor.backend.bodies] == [2, 1]
+    redactor.backend.bodies.clear()
+    assert redactor.redact_rows([c, b]) == [out[3], out[1]]
+    assert redactor.backend.bodies == []
+
+
+def test_changed_keys_fail_closed(redactor, monkeypatch):
+    monkeypatch.setattr(redactor, "backend", RecordingBackend(drop_key="secret_key"))
+    with pytest.raises(RuntimeError, match="keys"):
+        redactor.redact_rows([make_row()])
+
+
+def test_search_through_row_cache_matches_buffered(app_module, client, auth_headers, monkeypatch):
+    expected = client.get("/search?q=an", headers=auth_headers).get_json()
+    monkeypatch.setattr(app_module, "ROW_CACHE_ENABLED", True)
+    resp = client.get("/search?q=an", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.get_json() == expected
+
+
+def test_prefetch_warms_the_row_cache_get_user_reads(app_module, redactor, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "ROW_CACHE_ENABLED", True)
+    redactor.purge_cache()
+    app_module.prefetch_user(1, "", "")
+    assert redactor.backend.bodies
+    redactor.backend.bodies.clear()
+    assert client.get("/users/1", headers=auth_headers).status_code == 200
+    assert redactor.backend.bodies == []
+
+
+def test_prefetch_skips_users_with_a_fresh_materialized_body(app_module, redactor, monkeypatch):
+    class Fresh:
+        def ready(self):
+            return True
+
+        def is_fresh(self, user_id):
+            return True
+
+    monkeypatch.setattr(app_module, "MATERIALIZE_USERS", True)
+    monkeypatch.setattr(app_module, "USERS_MATERIALIZER", Fresh())
+    redactor.purge_cache()
+    app_module.prefetch_user(1, "", "")
+    assert redactor.backend.bodies == []
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import scheduler
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def run_queued(sched, requests):
+    """Hold the only slot, queue ``requests`` (priority, team) in order, then record grant order."""
+    order = []
+    hold = sched.slot()
+    hold.__enter__()
+
+    def worker(name, priority, team):
+        with sched.slot(priority, team):
+            order.append(name)
+
+    threads = []
+    for i, (name, priority, team) in enumerate(requests):
+        t = threading.Thread(target=worker, args=(name, priority, team))
+        t.start()
+        threads.append(t)
+        wait_for(lambda: sched.snapshot()["waiting"] == i + 1)
+    hold.__exit__(None, None, None)
+    for t in threads:
+        t.join(5)
+    return order
+
+
+def test_disabled_scheduler_never_blocks():
+    sched = scheduler.UpstreamScheduler(0)
+    with sched.slot(), sched.slot():
+        pass
+
+
+def test_priority_classes_go_first():
+    sched = scheduler.UpstreamScheduler(1, aging_seconds=0)
+    order = run_queued(sched, [("bg", scheduler.BACKGROUND, "a"), ("bulk", scheduler.BULK, "a"),
+                               ("ui", scheduler.INTERACTIVE, "a")])
+    assert order == ["ui", "bulk", "bg"]
+
+
+def test_teams_interleave_within_a_class():
+    sched = scheduler.UpstreamScheduler(1, aging_seconds=0)
+    requests = [(f"a{i}", scheduler.BULK, "a") for i in range(3)] + [(f"b{i}", scheduler.BULK, "b") for i in range(2)]
+    order = run_queued(sched, requests)
+    assert order[:4] == ["a0", "b0", "a1", "b1"]
+
+
+def test_timed_out_waiter_is_not_charged_to_its_team():
+    sched = scheduler.UpstreamScheduler(1, aging_seconds=0, max_wait=0.05)
+    with sched.slot(team="x"):
+        before = dict(sched._team_finish)
+        for _ in range(3):
+            with pytest.raises(scheduler.SchedulerTimeout):
+                with sched.slot(team="slow"):
+                    pass
+        assert sched._team_finish.get("slow", 0.0) == before.get("slow", 0.0)
+        assert sched.snapshot() == {"running": 1, "waiting": 0}
+
+
+def test_timeout_moves_the_teams_later_calls_up():
+    sched = scheduler.UpstreamScheduler(1, aging_seconds=0, max_wait=5)
+    sched._virtual_time = 0.0
+    first = scheduler._Waiter(scheduler.BULK, "t", 1.0, 0)
+    second = scheduler._Waiter(scheduler.BULK, "t", 2.0, 1)
+    sched._waiting = [second]
+    sched._team_finish["t"] = 2.0
+    sched._refund(first, 1.0, 0.0)
+    assert second.finish == 1.0
+    assert sched._team_finish["t"] == 1.0
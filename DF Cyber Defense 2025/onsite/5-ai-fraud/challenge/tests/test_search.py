@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+
+import pytest
+
+from ai_filter import get_redactor
+from redaction_rules import MASK
+
+
+@pytest.fixture
+def streaming(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "SEARCH_STREAM", True)
+    monkeypatch.setattr(app_module, "SEARCH_STREAM_BATCH_ROWS", 1)
+
+
+def test_streamed_search_matches_buffered(app_module, client, auth_headers, monkeypatch):
+    buffered = client.get("/search?q=an", headers=auth_headers).get_json()
+    monkeypatch.setattr(app_module, "SEARCH_STREAM", True)
+    monkeypatch.setattr(app_module, "SEARCH_STREAM_BATCH_ROWS", 1)
+    resp = client.get("/search?q=an", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    streamed = json.loads(resp.data)
+    assert streamed == buffered
+    assert [r["id"] for r in streamed["results"]] == [1, 2]
+    assert all(r["secret_key"] == MASK for r in streamed["results"])
+
+
+def test_streamed_search_query_failure_is_400(client, auth_headers, streaming):
+    resp = client.get("/search?q='", headers=auth_headers)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "query_failed"
+
+
+def test_streamed_search_fails_closed_before_sending(client, auth_headers, streaming, monkeypatch):
+    def broken(bodies, usage=None, **kwargs):
+        raise RuntimeError("model down")
+        yield
+
+    monkeypatch.setattr(get_redactor(), "redact_stream", broken)
+    resp = client.get("/search?q=an", headers=auth_headers)
+    assert resp.status_code == 503
+    assert b"CBJS_SECRET" not in resp.data
+
+
+def test_export_is_off_by_default(client, auth_headers):
+    assert client.get("/export?q=an", headers=auth_headers).status_code == 404
+
+
+def test_export_streams_redacted_csv(app_module, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "EXPORT_ENABLED", True)
+    monkeypatch.setattr(app_module, "EXPORT_BATCH_ROWS", 2)
+    resp = client.get("/export?q=", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert rows[0] == app_module.EXPORT_COLUMNS
+    assert [r[0] for r in rows[1:]] == ["1", "2", "3"]
+    secret = app_module.EXPORT_COLUMNS.index("secret_key")
+    assert all(r[secret] == MASK for r in rows[1:])
+    assert b"CBJS_SECRET" not in resp.data
+
+
+def test_export_query_failure_is_csv_400(app_module, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "EXPORT_ENABLED", True)
+    resp = client.get("/export?q='", headers=auth_headers)
+    assert resp.status_code == 400
+    assert resp.mimetype == "text/csv"
@@ -0,0 +1,42 @@
+from token_accounting import TokenAccountant, TokenUsage, cached_prompt_tokens, estimate_tokens, usage_from_response
+
+
+def test_usage_from_either_api_schema():
+    assert usage_from_response({"usage": {"prompt_tokens": 7, "completion_tokens": 3}}) == (7, 3)
+    assert usage_from_response({"usage": {"input_tokens": 5, "output_tokens": 2}}) == (5, 2)
+    assert usage_from_response({"usage": {}}) is None
+    assert usage_from_response({}) is None
+    assert cached_prompt_tokens({"usage": {"prompt_tokens_details": {"cached_tokens": 4}}}) == 4
+    assert cached_prompt_tokens({"usage": {"prompt_tokens": 4}}) == 0
+
+
+def test_token_usage_accumulates():
+    usage = TokenUsage()
+    usage.add(10, 2)
+    usage.add(1, 1, estimated=True)
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.total) == (11, 3, 14)
+    assert usage.estimated
+    assert estimate_tokens("abcd" * 10) == 10
+
+
+def test_memory_accounting_resets_each_window():
+    accountant = TokenAccountant(lambda: None, "test", window_seconds=60)
+    assert accountant.record("t", 30, now=120.0) == 30
+    assert accountant.record("t", 15, now=179.0) == 45
+    assert accountant.record("t", 0, now=179.0) == 45
+    assert accountant.used("other", now=150.0) == 0
+    assert accountant.used("t", now=180.0) == 0
+    assert accountant.record("t", 5, now=181.0) == 5
+    assert accountant.retry_after(now=181.0) == 59.0
+
+
+def test_token_budget_throttles_with_429(app_module, client, auth_headers, monkeypatch):
+    accountant = TokenAccountant(lambda: None, "test", window_seconds=60)
+    monkeypatch.setattr(app_module, "TOKEN_ACCOUNTANT", accountant)
+    monkeypatch.setattr(app_module, "TOKEN_BUDGET_PER_WINDOW", 100)
+    assert client.get("/users/1", headers=auth_headers).status_code == 200
+    accountant.record("TEAM-aaa", 1000)
+    resp = client.get("/users/1", headers=auth_headers)
+    assert resp.status_code == 429
+    assert resp.get_json()["error"] == "token_budget_exceeded"
+    assert int(resp.headers["Retry-After"]) <= 60
@@ -0,0 +1,118 @@
+import time
+import logging
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    # chars/4 is the usual rule of thumb for English/JSON with BPE tokenizers
+    return (len(text or "") + 3) // 4
+
+
+class TokenUsage:
+    """Per-request accumulator handed down to the redactor (thread-safe)."""
+
+    __slots__ = ("prompt_tokens", "completion_tokens", "estimated", "_lock")
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self._lock = Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+        with self._lock:
+            self.prompt_tokens += int(prompt_tokens or 0)
+            self.completion_tokens += int(completion_tokens or 0)
+            self.estimated = self.estimated or estimated
+
+    @property
+    def total(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def usage_from_response(data: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens from a chat.completions or responses body."""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    if prompt is None and completion is None:
+        return None
+    return int(prompt or 0), int(completion or 0)
+
+
+def cached_prompt_tokens(data: Any) -> int:
+    """Prompt tokens the provider served from its prompt cache, if reported."""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if not isinstance(usage, dict):
+        return 0
+    details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0) if isinstance(details, dict) else 0
+
+
+class TokenAccountant:
+    """Model tokens per team per fixed window, in Redis or process memory.
+
+    Windows are aligned like the Redis rate limiter (``now // window``) so
+    both stores agree on when a budget resets.
+    """
+
+    def __init__(self, get_redis: Callable[[], Any], prefix: str, window_seconds: int):
+        self.get_redis = get_redis
+        self.prefix = prefix
+        self.window_seconds = max(1, int(window_seconds))
+        self._state: Dict[str, Tuple[int, int]] = {}
+        self._lock = Lock()
+
+    def _window(self, now: float) -> int:
+        return int(now // self.window_seconds)
+
+    def _key(self, team_token: str, window_id: int) -> str:
+        return f"{self.prefix}:tok:{team_token}:w:{window_id}"
+
+    def record(self, team_token: str, tokens: int, now: Optional[float] = None) -> int:
+        """Add ``tokens`` to the team's current window; returns the new total."""
+        now = time.time() if now is None else now
+        window_id = self._window(now)
+        if tokens <= 0:
+            return self.used(team_token, now)
+        r = self.get_redis()
+        if r is not None:
+            try:
+                key = self._key(team_token, window_id)
+                pipe = r.pipeline()
+                pipe.incrby(key, int(tokens))
+                pipe.expire(key, self.window_seconds + 2)
+                total, _ = pipe.execute()
+                return int(total)
+            except Exception:
+                logger.exception("Redis error recording token usage; using in-memory accounting")
+        with self._lock:
+            win, used = self._state.get(team_token, (window_id, 0))
+            if win != window_id:
+                used = 0
+            used += int(tokens)
+            self._state[team_token] = (window_id, used)
+            return used
+
+    def used(self, team_token: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        window_id = self._window(now)
+        r = self.get_redis()
+        if r is not None:
+            try:
+                return int(r.get(self._key(team_token, window_id)) or 0)
+            except Exception:
+                pass
+        with self._lock:
+            win, used = self._state.get(team_token, (window_id, 0))
+            return used if win == window_id else 0
+
+    def retry_after(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        return (self._window(now) + 1) * self.window_seconds - now